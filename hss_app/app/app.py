@@ -9,8 +9,10 @@
     :license: MIT, see LICENSE for more details.
 """
 
+import atexit
 import logging
 
+import redis
 from bromelia import Bromelia
 from bromelia.avps import *
 from bromelia.lib.etsi_3gpp_s6a import AIA # AuthenticationInformationAnswer
@@ -25,16 +27,32 @@ from bromelia.lib.etsi_3gpp_s6a import ULA # UpdateLocationAnswer
 from bromelia.lib.etsi_3gpp_s6a import ULR # UpdateLocationRequest
 from bromelia.exceptions import *
 
+from change_listener import ChangeListener, get_dsn
 from config import Config
 from counters import app_counterdb
+from latency import LatencyRecorder
 from models import (
+    advance_sqn_info_eps_subscription_profile,
+    engine,
     get_eps_subscription_profile,
+    reserve_sqn_info_eps_subscription_profile,
+    subscriber_cache,
+    subscriber_writes,
+    transactional,
     update_mip6_agent_info_eps_subscription_profile,
     update_mme_info_eps_subscription_profile,
     update_sqn_info_eps_subscription_profile
 )
+from sqn_store import (
+    PostgresSqnStore,
+    RedisSqnStore,
+    SQN_STORE_POSTGRES,
+    SQN_STORE_REDIS
+)
 from utils import (
-    create_subscription_data,
+    AnswerTemplates,
+    apn_configurations,
+    calculate_resync_data,
     create_supported_features,
     decode_from_plmn,
     generate_authentication_info_avp_data,
@@ -43,16 +61,22 @@ from utils import (
     get_num_of_requested_vectors, 
     get_imsi, 
     get_immediate_response_preferred,
+    get_resync_data,
     get_mip6_agent_host_destination_host,
     get_mip6_agent_host_destination_realm,
     get_service_selection,
     get_visited_plmn,
     has_allowed_rat,
     is_new_mme_identity,
+    is_resync_required,
     is_subscriber_roaming,
     is_ue_srvcc_supported,
-    ResponseGenerator
+    milenage_contexts,
+    ResponseGenerator,
+    SQN_STEP,
+    subscription_data_cache
 )
+from vector_pool import VectorPool
 
 app_logger = logging.getLogger("3gpp_hss")
 
@@ -62,8 +86,93 @@ app = Bromelia(config_file=Config.config_file)
 msgs = [AIA, AIR, CLA, CLR, NOA, NOR, PUA, PUR, ULA, ULR]
 app.load_messages_into_application_id(msgs, DIAMETER_APPLICATION_S6a)
 
+#: Error answers built once and copied for every request
+aia_templates = AnswerTemplates(app.s6a.AIA)
+noa_templates = AnswerTemplates(app.s6a.NA)
+pua_templates = AnswerTemplates(app.s6a.PUA)
+ula_templates = AnswerTemplates(app.s6a.ULA,
+                                supported_features=create_supported_features(),
+                                ula_flags=0x00000001)
+
+#: Pre-generated E-UTRAN vectors, refilled off the AIR path
+vector_pool = VectorPool(generate_vectors,
+                         depth=Config.VECTOR_POOL_DEPTH,
+                         ttl=Config.VECTOR_POOL_TTL,
+                         max_memory=Config.VECTOR_POOL_MAX_MEMORY,
+                         sqn_step=SQN_STEP)
+vector_pool.start()
+
+#: Queued MME and MIP6 updates are flushed on a graceful shutdown
+subscriber_writes.start()
+atexit.register(subscriber_writes.stop)
+
+#: So are the counters summed up in memory
+app_counterdb.start()
+atexit.register(app_counterdb.stop)
+
+#: Latency percentiles of each command, published alongside the counters
+latency_recorder = LatencyRecorder(app_counterdb,
+                                   interval=Config.LATENCY_INTERVAL,
+                                   num_of_intervals=Config.LATENCY_NUM_OF_INTERVALS)
+latency_recorder.start()
+atexit.register(latency_recorder.stop)
+
+#: Store where SQN ranges are reserved from on the AIR path
+if Config.SQN_STORE == SQN_STORE_REDIS:
+    sqn_store = RedisSqnStore(redis.Redis(connection_pool=app_counterdb.connection_pool),
+                              reserve=reserve_sqn_info_eps_subscription_profile,
+                              advance=advance_sqn_info_eps_subscription_profile,
+                              update=update_sqn_info_eps_subscription_profile,
+                              lease_size=Config.SQN_STORE_LEASE_SIZE,
+                              failure_threshold=Config.SQN_STORE_FAILURE_THRESHOLD,
+                              retry_interval=Config.SQN_STORE_RETRY_INTERVAL)
+
+elif Config.SQN_STORE == SQN_STORE_POSTGRES:
+    sqn_store = PostgresSqnStore(reserve=reserve_sqn_info_eps_subscription_profile,
+                                 advance=advance_sqn_info_eps_subscription_profile,
+                                 update=update_sqn_info_eps_subscription_profile)
+
+else:
+    raise ValueError(f"Invalid SQN store: {Config.SQN_STORE}")
+
+
+def invalidate_subscriber(imsi: str) -> None:
+    """Drop everything kept in memory for a subscriber changed by the 
+    provisioning.
+
+    :param imsi: subscriber IMSI
+    """
+    subscriber_cache.invalidate(imsi)
+    milenage_contexts.invalidate(imsi)
+    vector_pool.invalidate(imsi)
+    subscription_data_cache.invalidate(imsi)
+    sqn_store.invalidate(imsi)
+
+
+def flush_subscribers() -> None:
+    """Drop everything kept in memory for all subscribers."""
+    subscriber_cache.clear()
+    milenage_contexts.clear()
+    vector_pool.clear()
+    subscription_data_cache.clear()
+    apn_configurations.clear()
+
+
+#: Subscriber changes notified by the provisioning through Postgres
+change_listener = None
+
+if engine.dialect.name == "postgresql":
+    change_listener = ChangeListener(get_dsn(engine.url),
+                                     channel=Config.SUBSCRIBER_CHANGES_CHANNEL,
+                                     on_change=invalidate_subscriber,
+                                     on_flush=flush_subscribers,
+                                     reconnect_interval=Config.SUBSCRIBER_CHANGES_RECONNECT_INTERVAL)
+    change_listener.start()
+
 
 @app.route(application_id=DIAMETER_APPLICATION_S6a, command_code=AUTHENTICATION_INFORMATION_MESSAGE)
+@latency_recorder.timed("air")
+@transactional
 def air(request: AIR) -> AIA:
     """This function is the entrypoint to process S6a/S6d Diameter 
     Authentication-Information-Request messages.
@@ -75,10 +184,12 @@ def air(request: AIR) -> AIA:
     app_counterdb.incr("air:num_requests")
 
     hbh = request.header.hop_by_hop.hex()
-    r = ResponseGenerator(request, proxy_response=app.s6a.AIA)
+    r = ResponseGenerator(request, proxy_response=app.s6a.AIA, templates=aia_templates)
+    spans = latency_recorder.spans()
 
     try:
-        imsi = get_imsi(request)
+        with spans.stage("avp_extraction"):
+            imsi = get_imsi(request)
         app_logger.debug(f"[{hbh}] Got request from subscriber (IMSI: {imsi})")
 
     except DiameterMissingAvp as e:
@@ -94,7 +205,8 @@ def air(request: AIR) -> AIA:
         return r.invalid_avp_value(msg=e.args[0], avp=request.user_name_avp)
 
     try:
-        plmn = get_visited_plmn(request)
+        with spans.stage("avp_extraction"):
+            plmn = get_visited_plmn(request)
         mcc, mnc = decode_from_plmn(plmn)
         app_logger.debug(f"[{hbh}] Visited PLMN: (MCC: {mcc}, MNC: {mnc})")
 
@@ -106,7 +218,8 @@ def air(request: AIR) -> AIA:
 
 
     try:
-        num_of_requested_vectors = get_num_of_requested_vectors(request)
+        with spans.stage("avp_extraction"):
+            num_of_requested_vectors = get_num_of_requested_vectors(request)
         app_logger.debug(f"[{hbh}] MME has requested this number of "\
                          f"vectors: {num_of_requested_vectors}")
 
@@ -124,7 +237,8 @@ def air(request: AIR) -> AIA:
             return r.missing_avp(msg=e.args[0], avp=request.requested_eutran_authentication_info_avp)
 
 
-    subscriber = get_eps_subscription_profile(imsi)
+    with spans.stage("subscriber_fetch"):
+        subscriber = get_eps_subscription_profile(imsi)
 
     if subscriber is None:
         #: test__air_route__3__diameter_error_user_unknown
@@ -135,6 +249,9 @@ def air(request: AIR) -> AIA:
     key = subscriber.key
     app_logger.debug(f"[{hbh}] K: {key.hex()}")
 
+    with spans.stage("milenage"):
+        context = milenage_contexts.get(imsi, key)
+
     opc = subscriber.opc
     app_logger.debug(f"[{hbh}] OPc: {opc.hex()}")
 
@@ -144,7 +261,8 @@ def air(request: AIR) -> AIA:
     sqn = subscriber.sqn
     app_logger.debug(f"[{hbh}] SQN: {sqn.hex()}")
 
-    res_preferred = get_immediate_response_preferred(request)
+    with spans.stage("avp_extraction"):
+        res_preferred = get_immediate_response_preferred(request)
     app_logger.debug(f"[{hbh}] MME has requested this immediate response "\
                      f"preferred: {res_preferred}")
 
@@ -161,22 +279,88 @@ def air(request: AIR) -> AIA:
         app_counterdb.incr("air:num_answers:authentication_data_unavailable")
         return r.authentication_data_unavailable(msg=msg, avp=request.requested_eutran_authentication_info_avp)
 
-    # if is_resync_required(request):
-    #     rand, auts = get_resync_data(request)
-    #     sqn, _ = calculate_resync_data(key, opc, amf, rand, auts)
+    #: On a resynchronisation, SQN_MS is recovered from AUTS and fresh vectors
+    #: are returned in the same answer. Pooled vectors were generated on the
+    #: SQN the UE has just rejected, so they are dropped.
+    vectors = None
+
+    if is_resync_required(request):
+        app_counterdb.incr("air:num_resyncs")
+        with spans.stage("avp_extraction"):
+            rand, auts = get_resync_data(request)
+
+        try:
+            with spans.stage("milenage"):
+                sqn_ms, is_valid = calculate_resync_data(context, opc, rand, auts)
+
+        except ValueError as e:
+            app_counterdb.incr("air:num_answers:invalid_avp_value")
+            app_logger.exception(f"[{hbh}] Unable to resync subscriber: {e.args[0]}")
+            return r.invalid_avp_value(msg=e.args[0], avp=request.requested_eutran_authentication_info_avp)
+
+        vector_pool.invalidate(imsi)
+
+        #: If MAC-S cannot be verified, fresh vectors are still sent but SQN
+        #: is not reset, as per 3GPP TS 33.102 Section 6.3.5.
+        if is_valid:
+            app_logger.debug(f"[{hbh}] Resync SQN_MS: {sqn_ms.hex()}")
+            with spans.stage("milenage"):
+                vectors, next_sqn = generate_vectors(num_of_vectors, context, opc, amf, sqn_ms, plmn)
+            with spans.stage("db_write"):
+                sqn_store.reset(imsi, next_sqn)
+            vector_pool.track(imsi, plmn, context, opc, amf, next_sqn)
+        else:
+            app_counterdb.incr("air:num_resyncs:mac_s_failure")
+            app_logger.debug(f"[{hbh}] Unable to verify MAC-S, SQN kept")
+
+    elif vector_pool.enabled:
+        with spans.stage("sqn_fetch"):
+            sqn = sqn_store.get(imsi, sqn)
+        with spans.stage("vector_pool"):
+            vectors, next_sqn = vector_pool.pop(imsi, plmn, context, opc, amf, sqn, num_of_vectors)
+
+        #: Pooled vectors are only handed out if no other AIR has advanced
+        #: the SQN meanwhile
+        if vectors is not None:
+            with spans.stage("db_write"):
+                is_advanced = sqn_store.advance(imsi, sqn, next_sqn)
+
+            if is_advanced:
+                app_logger.debug(f"[{hbh}] Got vectors from pool")
+            else:
+                vector_pool.invalidate(imsi)
+                vectors = None
+
+    #: The SQN range of the vectors is reserved in a single round trip, so
+    #: concurrent AIRs for the same subscriber never share a SQN
+    if vectors is None:
+        with spans.stage("db_write"):
+            sqn, next_sqn = sqn_store.reserve(imsi, num_of_vectors * SQN_STEP)
+
+        if sqn is None:
+            app_counterdb.incr("air:num_answers:user_unknown")
+            app_logger.debug(f"[{hbh}] Unknown subscriber: {imsi}")
+            return r.user_unknown()
+
+        app_logger.debug(f"[{hbh}] Reserved SQN: {sqn.hex()} -> {next_sqn.hex()}")
+        with spans.stage("milenage"):
+            vectors, _ = generate_vectors(num_of_vectors, context, opc, amf, sqn, plmn)
+        vector_pool.track(imsi, plmn, context, opc, amf, next_sqn)
+
+    with spans.stage("avp_assembly"):
+        authentication_info_data = generate_authentication_info_avp_data(vectors)
+        answer = r.success(auth_session_state=NO_STATE_MAINTAINED, authentication_info=authentication_info_data)
 
-    vectors, sqn = generate_vectors(num_of_vectors, key, opc, amf, sqn, plmn)
-    authentication_info_data = generate_authentication_info_avp_data(vectors)
-    update_sqn_info_eps_subscription_profile(imsi, profile={"sqn": sqn})
-    
     #: test__air_route__6__diameter_success__with_immediate_response_preferred_avp
     #: test__air_route__7__diameter_success__without_immediate_response_preferred_avp__number_of_requested_vectors_2
     #: test__air_route__8__diameter_success__without_immediate_response_preferred_avp__number_of_requested_vectors_3
     app_counterdb.incr("air:num_answers:success")
-    return r.success(auth_session_state=NO_STATE_MAINTAINED, authentication_info=authentication_info_data)
+    return answer
 
 
 @app.route(application_id=DIAMETER_APPLICATION_S6a, command_code=NOTIFY_MESSAGE)
+@latency_recorder.timed("nor")
+@transactional
 def nor(request: NOR) -> NOA:
     """This function is the entrypoint to process S6a/S6d Diameter 
     Notify-Request messages.
@@ -188,12 +372,14 @@ def nor(request: NOR) -> NOA:
     app_counterdb.incr("nor:num_requests")
 
     hbh = request.header.hop_by_hop.hex()
-    r = ResponseGenerator(request, proxy_response=app.s6a.NA)
+    r = ResponseGenerator(request, proxy_response=app.s6a.NA, templates=noa_templates)
+    spans = latency_recorder.spans()
 
     #: When receiving a Notify request the HSS shall check whether the IMSI is 
     #: known.
     try:
-        imsi = get_imsi(request)
+        with spans.stage("avp_extraction"):
+            imsi = get_imsi(request)
         app_logger.debug(f"[{hbh}] Request from subscriber (IMSI: {imsi})")
 
     except DiameterMissingAvp as e:
@@ -210,7 +396,8 @@ def nor(request: NOR) -> NOA:
 
     #: If it is not known, a result code of DIAMETER_ERROR_USER_UNKNOWN shall
     #: be returned. 
-    subscriber = get_eps_subscription_profile(imsi)
+    with spans.stage("subscriber_fetch"):
+        subscriber = get_eps_subscription_profile(imsi)
 
     if subscriber is None:
         #: test__nor_route__2__diameter_error_user_unknown
@@ -229,13 +416,16 @@ def nor(request: NOR) -> NOA:
         return r.unknown_serving_node()
 
     try:
-        profile = {
-            "context_id": get_context_id(request),
-            "service_selection": get_service_selection(request),
-            "destination_host": get_mip6_agent_host_destination_host(request),
-            "destination_realm": get_mip6_agent_host_destination_realm(request)
-        }
-        update_mip6_agent_info_eps_subscription_profile(imsi, profile)
+        with spans.stage("avp_extraction"):
+            profile = {
+                "context_id": get_context_id(request),
+                "service_selection": get_service_selection(request),
+                "destination_host": get_mip6_agent_host_destination_host(request),
+                "destination_realm": get_mip6_agent_host_destination_realm(request)
+            }
+
+        with spans.stage("db_write"):
+            update_mip6_agent_info_eps_subscription_profile(imsi, profile)
         app_logger.exception(f"[{hbh}] Update dynamic profile info")
 
     except DiameterMissingAvp as e:
@@ -254,12 +444,17 @@ def nor(request: NOR) -> NOA:
             #: test__nor_route__8__diameter_missing_mip6_agent_info_avp__destination_realm
             return r.missing_avp(msg=e.args[0], avp=request.mip6_agent_info_avp)
 
+    with spans.stage("avp_assembly"):
+        answer = r.success()
+
     #: test__nor_route__4__diameter_success
     app_counterdb.incr("nor:num_answers:success")
-    return r.success()
+    return answer
 
 
 @app.route(application_id=DIAMETER_APPLICATION_S6a, command_code=PURGE_UE_MESSAGE)
+@latency_recorder.timed("pur")
+@transactional
 def pur(request: PUR) -> PUA:
     """This function is the entrypoint to process S6a/S6d Diameter 
     Purge-UE-Request messages.
@@ -271,12 +466,14 @@ def pur(request: PUR) -> PUA:
     app_counterdb.incr("pur:num_requests")
 
     hbh = request.header.hop_by_hop.hex()
-    r = ResponseGenerator(request, proxy_response=app.s6a.PUA)
+    r = ResponseGenerator(request, proxy_response=app.s6a.PUA, templates=pua_templates)
+    spans = latency_recorder.spans()
 
     #: When receiving a Purge UE request the HSS shall check whether the IMSI 
     #: is known. 
     try:
-        imsi = get_imsi(request)
+        with spans.stage("avp_extraction"):
+            imsi = get_imsi(request)
         app_logger.debug(f"[{hbh}] Got request from subscriber (IMSI: {imsi})")
 
     except DiameterMissingAvp as e:
@@ -294,7 +491,8 @@ def pur(request: PUR) -> PUA:
 
     #: If it is not known, a result code of DIAMETER_ERROR_USER_UNKNOWN shall 
     #: be returned.
-    subscriber = get_eps_subscription_profile(imsi)
+    with spans.stage("subscriber_fetch"):
+        subscriber = get_eps_subscription_profile(imsi)
 
     if subscriber is None:
         #: test__pur_route__3__diameter_error_user_unknown
@@ -310,15 +508,21 @@ def pur(request: PUR) -> PUA:
                          f"serving node: "\
                          f"{request.origin_host_avp.data.decode('utf-8')}")
         #: test__pur_route__5__diameter_success_with_new_mme
-        app_counterdb.incr("pur:num_answers:success")
-        return r.success(pua_flags=0x00000000)
+        pua_flags = 0x00000000
+    else:
+        #: test__pur_route__4__diameter_success
+        pua_flags = 0x00000001
+
+    with spans.stage("avp_assembly"):
+        answer = r.success(pua_flags=pua_flags)
 
-    #: test__pur_route__4__diameter_success
     app_counterdb.incr("pur:num_answers:success")
-    return r.success(pua_flags=0x00000001)
+    return answer
 
 
 @app.route(application_id=DIAMETER_APPLICATION_S6a, command_code=UPDATE_LOCATION_MESSAGE)
+@latency_recorder.timed("ulr")
+@transactional
 def ulr(request: ULR) -> ULA:
     """This function is the entrypoint to process S6a/S6d Diameter 
     Update-Location-Request messages.
@@ -330,13 +534,15 @@ def ulr(request: ULR) -> ULA:
     app_counterdb.incr("ulr:num_requests")
 
     hbh = request.header.hop_by_hop.hex()
-    r = ResponseGenerator(request, proxy_response=app.s6a.ULA)
+    r = ResponseGenerator(request, proxy_response=app.s6a.ULA, templates=ula_templates)
+    spans = latency_recorder.spans()
     r.load_avps(supported_features=create_supported_features(), ula_flags=0x00000001)
 
     #: When receiving an Update Location request the HSS shall check whether
     #: subscription data exists for the IMSI
     try:
-        imsi = get_imsi(request)
+        with spans.stage("avp_extraction"):
+            imsi = get_imsi(request)
         app_logger.debug(f"[{hbh}] Got request from subscriber (IMSI: {imsi})")
 
     except DiameterMissingAvp as e:
@@ -353,7 +559,8 @@ def ulr(request: ULR) -> ULA:
 
 
     try:
-        plmn = get_visited_plmn(request)
+        with spans.stage("avp_extraction"):
+            plmn = get_visited_plmn(request)
         mcc, mnc = decode_from_plmn(plmn)
         app_logger.debug(f"[{hbh}] Visited PLMN: (MCC: {mcc}, MNC: {mnc})")
 
@@ -374,7 +581,8 @@ def ulr(request: ULR) -> ULA:
         return r.rat_not_allowed()
 
 
-    subscriber = get_eps_subscription_profile(imsi)
+    with spans.stage("subscriber_fetch"):
+        subscriber = get_eps_subscription_profile(imsi)
 
     #: If the HSS determines that there is not any type of subscription for the
     #: IMSI (including EPS, GPRS and CS subscription data), a Result Code of
@@ -438,27 +646,34 @@ def ulr(request: ULR) -> ULA:
     #: location information of the (no longer) purged UE.
     if is_new_mme_identity(request, subscriber):
         #: test__ulr_route__6__diameter_success__with_cancel_location_request
-        clr = app.s6a.CLR(user_name=imsi,
-                          cancellation_type=CANCELLATION_TYPE_MME_UPDATE_PROCEDURE,
-                          destination_host=subscriber.mme_hostname)
+        with spans.stage("clr_send"):
+            clr = app.s6a.CLR(user_name=imsi,
+                              cancellation_type=CANCELLATION_TYPE_MME_UPDATE_PROCEDURE,
+                              destination_host=subscriber.mme_hostname)
 
-        app.send_message(clr, recv_answer=False)
+            app.send_message(clr, recv_answer=False)
         app_logger.debug(f"[{hbh}] Sent CLR to MME")
 
     #: The HSS shall store the new terminal information and/or the new UE SRVCC
     #: capability, if they are present in the request. If the UE SRVCC 
     #: capability is not present, the HSS shall store that it has no knowledge
     #: of the UE SRVCC capability. 
-    profile = {
-        "mme_hostname": request.origin_host_avp.data.decode("utf-8"),
-        "mme_realm": request.origin_realm_avp.data.decode("utf-8"),
-        "ue_srvcc_support": is_ue_srvcc_supported(request),
-    }
-    update_mme_info_eps_subscription_profile(imsi, profile)
+    with spans.stage("avp_extraction"):
+        profile = {
+            "mme_hostname": request.origin_host_avp.data.decode("utf-8"),
+            "mme_realm": request.origin_realm_avp.data.decode("utf-8"),
+            "ue_srvcc_support": is_ue_srvcc_supported(request),
+        }
+
+    with spans.stage("db_write"):
+        update_mme_info_eps_subscription_profile(imsi, profile)
+
+    with spans.stage("avp_assembly"):
+        answer = r.success(subscription_data=subscription_data_cache.get(imsi, subscriber))
 
     #: test__ulr_route__4__diameter_success
     #: test__ulr_route__10__diameter_success__odb_all_apn
     #: test__ulr_route__11__diameter_success__odb_hplmn_apn
     #: test__ulr_route__12__diameter_success__odb_vplmn_apn
     app_counterdb.incr("ulr:num_answers:success")
-    return r.success(subscription_data=create_subscription_data(subscriber))
\ No newline at end of file
+    return answer
\ No newline at end of file
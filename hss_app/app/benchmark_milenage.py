@@ -0,0 +1,198 @@
+# -*- coding: utf-8 -*-
+"""
+    hss_app.benchmark_milenage
+    ~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+    This module contains the Milenage and E-UTRAN vector assembly
+    microbenchmarks. Each stage along the AIR path is timed separately, from
+    the raw cipher call up to the Authentication-Info AVP data, alongside the
+    former per-byte implementations for comparison.
+
+    It runs without PostgreSQL and Redis: the models module is bound to an
+    in-memory SQLite database through the SQL_BASE_URI env variable, and no
+    counter is touched.
+
+    Usage: python benchmark_milenage.py [--number NUMBER] [--filter TEXT]
+                                        [--json PATH]
+
+    :copyright: (c) 2021-present Henrique Marques Ribeiro.
+    :license: MIT, see LICENSE for more details.
+"""
+
+import os
+
+os.environ.setdefault("SQL_BASE_URI", "sqlite://")
+
+import argparse
+import json
+import platform
+import statistics
+import time
+
+from Crypto.Cipher import AES
+
+from milenage import *
+from utils import generate_authentication_info_avp_data, generate_vectors
+
+
+KEY = bytes.fromhex("465b5ce8b199b49faa5f0a2ee238a6bc")
+OPC = bytes.fromhex("cd63cb71954a9f4e48a5994e37a02baf")
+RAND = bytes.fromhex("23553cbe9637a89d218ae64dae47bf35")
+AMF = bytes.fromhex("b9b9")
+SQN = bytes.fromhex("ff9bb4d0b607")
+PLMN = bytes.fromhex("27f450")
+
+#: Number of vectors an MME may request in a single AIR
+MAX_NUM_OF_VECTORS = 5
+
+
+def legacy_xor(bytes1: bytes, bytes2: bytes) -> bytes:
+    """Former per-byte generator implementation of xor()."""
+    return bytes(a ^ b for a, b in zip(bytes1, bytes2))
+
+
+def legacy_rot(_input: bytes, _bytes: int) -> bytes:
+    """Former per-byte generator implementation of rot()."""
+    return bytes(_input[(i + _bytes) % len(_input)] for i in range(len(_input)))
+
+
+def legacy_cipher(key: bytes, data: bytes, IV: bytes = INITIALIZATION_VECTOR) -> bytes:
+    """Former cipher() implementation, which expands K on every block."""
+    return AES.new(key, AES.MODE_CBC, IV).encrypt(data)
+
+
+def legacy_calculate_output(key: bytes, rand: bytes, opc: bytes, r: int, c: bytes, sqn: bytes = None, amf: bytes = None) -> bytes:
+    """Former calculate_output() implementation on top of the per-byte
+    primitives."""
+    if sqn is None and amf is None:
+        temp = legacy_xor(legacy_cipher(key, legacy_xor(rand, opc)), opc)
+        return legacy_xor(legacy_cipher(key, legacy_xor(legacy_rot(temp, r), c)), opc)
+
+    temp = legacy_cipher(key, legacy_xor(rand, opc))
+    in1 = (sqn[0:6] + amf[0:2]) * 2
+    return legacy_xor(opc, legacy_cipher(key, legacy_xor(temp, legacy_rot(legacy_xor(in1, opc), R1)), C1))
+
+
+def legacy_calculate_eutran_vector(opc: bytes, key: bytes, amf: bytes, sqn: bytes, plmn: bytes, rand: bytes) -> Vector:
+    """Former calculate_eutran_vector() implementation, which calls f1, f2 &
+    f5, f3 and f4 separately on top of the per-byte primitives."""
+    out1 = legacy_calculate_output(key, rand, opc, R1, C1, sqn, amf)
+    out2 = legacy_calculate_output(key, rand, opc, R2, C2)
+    ck = legacy_calculate_output(key, rand, opc, R3, C3)
+    ik = legacy_calculate_output(key, rand, opc, R4, C4)
+
+    mac_a, xres, ak = get_mac_a(out1), get_res(out2), get_ak(out2)
+    autn = legacy_xor(sqn, ak) + amf + mac_a
+    kasme = kdf(ck + ik, (FC + plmn + L0 + legacy_xor(sqn, ak) + L1))
+
+    return Vector(rand, xres, autn, kasme)
+
+
+def create_cases() -> list:
+    """Build the list of (name, callable) benchmarks, ordered as the stages
+    along the AIR path."""
+    context = MilenageContext(KEY)
+    ck, ik = f3(context, RAND, OPC), f4(context, RAND, OPC)
+    _, ak = f2_and_f5(context, RAND, OPC)
+
+    cases = [
+        ("legacy_xor", lambda: legacy_xor(OPC, RAND)),
+        ("xor", lambda: xor(OPC, RAND)),
+        ("legacy_rot", lambda: legacy_rot(OPC, R3)),
+        ("rot", lambda: rot(OPC, R3)),
+        ("legacy_cipher", lambda: legacy_cipher(KEY, RAND)),
+        ("cipher", lambda: cipher(context, RAND)),
+        ("calculate_output", lambda: calculate_output(context, RAND, OPC, R3, C3)),
+        ("f1_and_f1_s", lambda: f1_and_f1_s(context, RAND, OPC, SQN, AMF)),
+        ("f2_and_f5", lambda: f2_and_f5(context, RAND, OPC)),
+        ("f3", lambda: f3(context, RAND, OPC)),
+        ("f4", lambda: f4(context, RAND, OPC)),
+        ("f5_s", lambda: f5_s(context, RAND, OPC)),
+        ("milenage_all", lambda: milenage_all(context, OPC, RAND, SQN, AMF)),
+        ("calculate_kasme", lambda: calculate_kasme(ck, ik, PLMN, SQN, ak)),
+        ("legacy_calculate_eutran_vector", lambda: legacy_calculate_eutran_vector(OPC, KEY, AMF, SQN, PLMN, RAND)),
+        ("calculate_eutran_vector", lambda: calculate_eutran_vector(OPC, context, AMF, SQN, PLMN, RAND)),
+    ]
+
+    for num_of_vectors in range(1, MAX_NUM_OF_VECTORS + 1):
+        cases.append((f"generate_vectors[{num_of_vectors}]",
+                      lambda n=num_of_vectors: generate_vectors(n, context, OPC, AMF, SQN, PLMN)))
+
+    for num_of_vectors in range(1, MAX_NUM_OF_VECTORS + 1):
+        vectors, _ = generate_vectors(num_of_vectors, context, OPC, AMF, SQN, PLMN)
+        cases.append((f"generate_authentication_info_avp_data[{num_of_vectors}]",
+                      lambda v=vectors: generate_authentication_info_avp_data(v)))
+
+    return cases
+
+
+def percentile(samples: list, q: float) -> float:
+    """Nearest-rank percentile of sorted samples."""
+    index = max(0, min(len(samples) - 1, int(round(q / 100 * len(samples))) - 1))
+    return samples[index]
+
+
+def measure(func, number: int) -> dict:
+    """Time each call individually after a short warm up.
+
+    :param func: callable to be measured
+    :param number: number of timed calls
+
+    :returns: dict with ops/s and the p50/p99 latency in microseconds
+    """
+    for _ in range(min(number, 1000)):
+        func()
+
+    clock = time.perf_counter_ns
+    samples = [0] * number
+    for index in range(number):
+        start = clock()
+        func()
+        samples[index] = clock() - start
+
+    total = sum(samples)
+    samples.sort()
+
+    return {
+        "ops_per_sec": number / total * 1e9,
+        "mean_us": total / number / 1e3,
+        "p50_us": percentile(samples, 50) / 1e3,
+        "p99_us": percentile(samples, 99) / 1e3,
+        "stdev_us": statistics.pstdev(samples) / 1e3,
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Milenage microbenchmarks")
+    parser.add_argument("--number", type=int, default=10000, help="timed calls per benchmark")
+    parser.add_argument("--filter", default=None, help="only run benchmarks whose name contains this text")
+    parser.add_argument("--json", default=None, help="write results to this file, for comparison between commits")
+    args = parser.parse_args()
+
+    assert legacy_calculate_eutran_vector(OPC, KEY, AMF, SQN, PLMN, RAND) == \
+           calculate_eutran_vector(OPC, KEY, AMF, SQN, PLMN, RAND)
+
+    results = dict()
+
+    print(f"\n{'benchmark':<44}{'ops/s':>12}{'p50 (us)':>12}{'p99 (us)':>12}")
+    for name, func in create_cases():
+        if args.filter is not None and args.filter not in name:
+            continue
+
+        results[name] = measure(func, args.number)
+        result = results[name]
+        print(f"{name:<44}{result['ops_per_sec']:>12.0f}{result['p50_us']:>12.2f}{result['p99_us']:>12.2f}")
+
+    if args.json is not None:
+        report = {
+            "python": platform.python_version(),
+            "machine": platform.machine(),
+            "number": args.number,
+            "results": results,
+        }
+        with open(args.json, "w") as json_file:
+            json.dump(report, json_file, indent=4)
+
+
+if __name__ == "__main__":
+    main()
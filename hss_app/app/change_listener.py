@@ -0,0 +1,193 @@
+# -*- coding: utf-8 -*-
+"""
+    hss_app.change_listener
+    ~~~~~~~~~~~~~~~~~~~~~~~
+
+    This module implements the listener of the subscriber changes notified by
+    hss_provisioning through Postgres LISTEN/NOTIFY, which keeps the HSS
+    in-process caches coherent with the database.
+
+    :copyright: (c) 2021-present Henrique Marques Ribeiro.
+    :license: MIT, see LICENSE for more details.
+"""
+
+import json
+import logging
+import select
+import threading
+import time
+
+import psycopg2
+
+listener_logger = logging.getLogger("3gpp_hss")
+
+#: Missing versions beyond which a gap is flushed right away
+MAX_MISSING_VERSIONS = 1000
+
+
+def get_dsn(url) -> str:
+    """Convert a SQLAlchemy URL into a libpq connection string.
+
+    :param url: sqlalchemy.engine.URL object
+
+    :returns: libpq connection string
+    """
+    params = url.translate_connect_args(username="user", database="dbname")
+    params.update(url.query)
+    return psycopg2.extensions.make_dsn(**params)
+
+
+class ChangeListener:
+    """Listens to the subscriber changes channel on its own connection. Each
+    notification carries a version taken from a Postgres sequence and the
+    list of changed IMSIs, or null when any subscriber may have changed.
+
+    Versions are drawn right before commit, so concurrent transactions may
+    notify them out of order, and a failed COMMIT leaves a gap. A skipped
+    version is awaited for reorder_window seconds before it is deemed lost,
+    while a transaction rolled back before its commit draws none.
+
+    Anything that may hide a notification triggers a full flush: a version
+    which has not arrived within the reorder window, a malformed payload and
+    every (re)connection, since notifications sent while disconnected are
+    lost.
+
+    :param dsn: libpq connection string or URI
+    :param channel: Postgres channel name
+    :param on_change: function called with the IMSI of a changed subscriber
+    :param on_flush: function called when any subscriber may have changed
+    :param reconnect_interval: seconds to wait before reconnecting
+    :param poll_interval: seconds to wait for notifications before checking
+                          the connection and whether the listener has been 
+                          stopped
+    :param reorder_window: seconds a skipped version is awaited
+    """
+    def __init__(self, dsn: str, channel: str, on_change, on_flush, reconnect_interval: float = 1, poll_interval: float = 5, reorder_window: float = 1) -> None:
+        self.dsn = dsn
+        self.channel = channel
+        self.on_change = on_change
+        self.on_flush = on_flush
+        self.reconnect_interval = reconnect_interval
+        self.poll_interval = poll_interval
+        self.reorder_window = reorder_window
+
+        self.version = None
+        self.num_of_flushes = 0
+
+        self._missing = dict()
+
+        self._stopped = threading.Event()
+        self._thread = None
+
+    def start(self) -> None:
+        """Start the background thread which listens to the channel."""
+        if self._thread is not None:
+            return
+
+        self._thread = threading.Thread(name="change_listener",
+                                        target=self._run,
+                                        daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        """Stop the background thread, within poll_interval seconds."""
+        self._stopped.set()
+
+    def flush(self) -> None:
+        """Forget the last version and notify a full flush."""
+        self.version = None
+        self._missing.clear()
+        self.num_of_flushes += 1
+        self.on_flush()
+
+    def handle(self, payload: str) -> None:
+        """Process a single notification payload.
+
+        :param payload: JSON object with "version" and "imsis" keys
+        """
+        try:
+            data = json.loads(payload)
+            version = int(data["version"])
+            imsis = data["imsis"]
+
+        except (ValueError, TypeError, KeyError) as e:
+            listener_logger.exception(f"Invalid subscriber change notification: {payload}")
+            return self.flush()
+
+        if self.version is not None and version - self.version - 1 > MAX_MISSING_VERSIONS:
+            listener_logger.debug(f"Subscriber change notifications gap: "\
+                                  f"{self.version} -> {version}")
+            self.flush()
+            self.version = version
+            return
+
+        if self.version is not None and version > self.version + 1:
+            deadline = time.monotonic() + self.reorder_window
+            for missing in range(self.version + 1, version):
+                self._missing[missing] = deadline
+
+        #: Versions arriving late or twice are applied all the same
+        self._missing.pop(version, None)
+        if self.version is None or version > self.version:
+            self.version = version
+
+        if imsis is None:
+            self.num_of_flushes += 1
+            return self.on_flush()
+
+        for imsi in imsis:
+            self.on_change(str(imsi))
+
+    def expire(self) -> None:
+        """Flush if a skipped version has not arrived within the reorder
+        window, keeping the last version."""
+        now = time.monotonic()
+        missing = [version for version, deadline in self._missing.items() if deadline <= now]
+
+        if missing:
+            listener_logger.debug(f"Subscriber change notifications lost: {missing}")
+            version = self.version
+            self.flush()
+            self.version = version
+
+    def _run(self) -> None:
+        while not self._stopped.is_set():
+            connection = None
+            try:
+                connection = psycopg2.connect(self.dsn)
+                connection.set_isolation_level(psycopg2.extensions.ISOLATION_LEVEL_AUTOCOMMIT)
+
+                with connection.cursor() as cursor:
+                    cursor.execute(f'LISTEN "{self.channel}"')
+
+                listener_logger.debug(f"Listening to subscriber changes on {self.channel}")
+                self.flush()
+                self._listen(connection)
+
+            except Exception as e:
+                listener_logger.exception(f"Subscriber change listener failure: {e}")
+                self._stopped.wait(self.reconnect_interval)
+
+            finally:
+                if connection is not None:
+                    connection.close()
+
+    def _listen(self, connection) -> None:
+        while not self._stopped.is_set():
+            #: On idle, a round trip makes sure the connection is still alive
+            timeout = self.poll_interval
+            if self._missing:
+                timeout = min(timeout, max(0, min(self._missing.values()) - time.monotonic()))
+
+            if select.select([connection], [], [], timeout) == ([], [], []):
+                with connection.cursor() as cursor:
+                    cursor.execute("SELECT 1")
+            else:
+                connection.poll()
+
+            #: Notifications are read along any round trip, not only a poll()
+            while connection.notifies:
+                notify = connection.notifies.pop(0)
+                self.handle(notify.payload)
+
+            self.expire()
@@ -58,6 +58,14 @@ def get_database_db():
     return "subscribers"
 
 
+def get_env_variable(name, default):
+    if os.getenv(name):
+        print(f"Found {name} env variable")
+        return os.getenv(name)
+    print(f"Not found {name} env variable, fallback to default ...")
+    return default
+
+
 def get_host_ip_address():
     if is_docker():
         return "0.0.0.0"
@@ -91,10 +99,95 @@ class Config:
         "db": get_database_db()
     }
 
-    SQL_BASE_URI = "postgresql+psycopg2://{user}:{pw}@{url}/{db}?client_encoding=utf8".format(**params)
+    SQL_BASE_URI = get_env_variable("SQL_BASE_URI",
+                                    "postgresql+psycopg2://{user}:{pw}@{url}/{db}?client_encoding=utf8".format(**params))
 
     #: Cache address
     cache_ip_address = get_cache_ip_address()
 
+    #: Number of subscriber keys (K) kept expanded in memory for Milenage, 
+    #: by the Diameter handlers and by each worker process alike
+    MILENAGE_CONTEXT_CACHE_SIZE = int(get_env_variable("MILENAGE_CONTEXT_CACHE_SIZE", 10000))
+
+    #: Milenage engine: "inline" calculates vectors within the Diameter 
+    #: handler thread, "process" dispatches them to a pool of worker processes
+    MILENAGE_ENGINE = get_env_variable("MILENAGE_ENGINE", "inline")
+    MILENAGE_POOL_SIZE = int(get_env_variable("MILENAGE_POOL_SIZE", os.cpu_count()))
+    MILENAGE_POOL_MIN_BATCH_SIZE = int(get_env_variable("MILENAGE_POOL_MIN_BATCH_SIZE", 2))
+
+    #: AES-128 backend used by Milenage: "pycryptodome", "cryptography" or 
+    #: "auto", which picks the fastest one by a quick self-benchmark
+    MILENAGE_CRYPTO_BACKEND = get_env_variable("MILENAGE_CRYPTO_BACKEND", "auto")
+
+    #: Pre-generated E-UTRAN vectors per subscriber. A depth of 0 disables the
+    #: pool, TTL is given in seconds and max memory in bytes
+    VECTOR_POOL_DEPTH = int(get_env_variable("VECTOR_POOL_DEPTH", 0))
+    VECTOR_POOL_TTL = float(get_env_variable("VECTOR_POOL_TTL", 300))
+    VECTOR_POOL_MAX_MEMORY = int(get_env_variable("VECTOR_POOL_MAX_MEMORY", 8 * 1024 * 1024))
+
+    #: In-process cache of subscriber profiles. A size of 0 disables the
+    #: cache, TTL is given in seconds and bounds how long a change made by the
+    #: provisioning may go unnoticed if its notification is lost
+    SUBSCRIBER_CACHE_SIZE = int(get_env_variable("SUBSCRIBER_CACHE_SIZE", 100000))
+    SUBSCRIBER_CACHE_TTL = float(get_env_variable("SUBSCRIBER_CACHE_TTL", 30))
+
+    #: Subscribers whose Subscription-Data AVPs are kept in memory for ULA, 
+    #: each taking roughly 3 KB plus a reference per APN. A size of 0 
+    #: disables the cache
+    SUBSCRIPTION_DATA_CACHE_SIZE = int(get_env_variable("SUBSCRIPTION_DATA_CACHE_SIZE", 10000))
+
+    #: Distinct APN-Configuration AVPs, i.e. APN and MIP6 state pairs, shared
+    #: by all the subscribers. A size of 0 disables the table
+    APN_CONFIGURATION_TABLE_SIZE = int(get_env_variable("APN_CONFIGURATION_TABLE_SIZE", 1024))
+
+    #: Postgres channel where hss_provisioning notifies subscriber changes, 
+    #: and seconds to wait before reconnecting the listener
+    SUBSCRIBER_CHANGES_CHANNEL = "hss_subscriber_changes"
+    SUBSCRIBER_CHANGES_RECONNECT_INTERVAL = float(get_env_variable("SUBSCRIBER_CHANGES_RECONNECT_INTERVAL", 1))
+
+    #: MME and MIP6 updates: "sync" commits them before the answer is sent,
+    #: "group" does so as well but gathers the updates of concurrent handlers
+    #: into a single transaction, and "async" queues them and commits them in
+    #: batches from a background thread. Batches are committed once the 
+    #: oldest update has waited max delay seconds or max batch size of them 
+    #: are pending. Queued updates are lost if the process dies before they 
+    #: are flushed, and once max size of them are pending further ones are 
+    #: committed synchronously
+    SUBSCRIBER_WRITE_MODE = get_env_variable("SUBSCRIBER_WRITE_MODE", "sync")
+    SUBSCRIBER_WRITE_MAX_SIZE = int(get_env_variable("SUBSCRIBER_WRITE_MAX_SIZE", 10000))
+    SUBSCRIBER_WRITE_MAX_BATCH_SIZE = int(get_env_variable("SUBSCRIBER_WRITE_MAX_BATCH_SIZE", 500))
+    SUBSCRIBER_WRITE_MAX_DELAY = float(get_env_variable("SUBSCRIBER_WRITE_MAX_DELAY",
+                                                        0.002 if SUBSCRIBER_WRITE_MODE == "group" else 0.05))
+
+    #: Store where SQN ranges are reserved from on the AIR path: "postgres"
+    #: updates Postgres on every AIR, "redis" reserves them in Redis out of 
+    #: leases taken from Postgres. Lease size is given in SQN, e.g. 1024 
+    #: vectors with the default SQN step of 32, and bounds the SQNs skipped 
+    #: if Redis loses its keys
+    SQN_STORE = get_env_variable("SQN_STORE", "postgres")
+    SQN_STORE_LEASE_SIZE = int(get_env_variable("SQN_STORE_LEASE_SIZE", 32768))
+
+    #: Consecutive Redis failures after which the "redis" SQN store reserves
+    #: straight from Postgres, and seconds between the calls which detect the
+    #: recovery of Redis. A threshold of 0 disables the circuit breaker
+    SQN_STORE_FAILURE_THRESHOLD = int(get_env_variable("SQN_STORE_FAILURE_THRESHOLD", 3))
+    SQN_STORE_RETRY_INTERVAL = float(get_env_variable("SQN_STORE_RETRY_INTERVAL", 5))
+
+    #: Seconds between flushes of the counters summed up in memory to Redis.
+    #: An interval of 0 sends every increment straight to Redis, at the cost
+    #: of a round trip per increment on the Diameter handler threads
+    COUNTER_FLUSH_INTERVAL = float(get_env_variable("COUNTER_FLUSH_INTERVAL", 1))
+
+    #: Consecutive Redis failures after which counters are summed up in 
+    #: memory rather than sent to Redis, and seconds between the pings which
+    #: detect its recovery. A threshold of 0 disables the circuit breaker
+    COUNTER_FAILURE_THRESHOLD = int(get_env_variable("COUNTER_FAILURE_THRESHOLD", 3))
+    COUNTER_PROBE_INTERVAL = float(get_env_variable("COUNTER_PROBE_INTERVAL", 5))
+
+    #: Seconds between publications of the latency percentiles of each 
+    #: command, and intervals within the window they are calculated over
+    LATENCY_INTERVAL = float(get_env_variable("LATENCY_INTERVAL", 10))
+    LATENCY_NUM_OF_INTERVALS = int(get_env_variable("LATENCY_NUM_OF_INTERVALS", 6))
+
     #: Bromelia Config File (CEX procedure)
     config_file = os.path.join(basedir, "config.yaml")
@@ -1,29 +1,235 @@
+# -*- coding: utf-8 -*-
+"""
+    hss_app.counters
+    ~~~~~~~~~~~~~~~~
+
+    This module implements the Redis connector of the counters exported by
+    the SNMP service.
+
+    :copyright: (c) 2021-present Henrique Marques Ribeiro.
+    :license: MIT, see LICENSE for more details.
+"""
+
+import logging
+import threading
+
 import redis
 
 from config import Config
 
+counters_logger = logging.getLogger("3gpp_hss")
+
 
 class CounterDB(redis.Redis):
-    def __init__(self, **kwargs):
+    """Redis client of the counters.
+
+    With a flush interval, increments are summed up in memory and flushed by
+    a background thread every flush interval seconds, as a single pipeline
+    of INCRBY, rather than a round trip per increment on the Diameter
+    handler threads. Deltas which could not be flushed are kept for the next
+    flush, and the last ones are flushed on stop. Gauges, e.g. latency
+    percentiles, are set the same way, the last value of each one winning.
+
+    Increments sent straight to Redis go through a circuit breaker, so an
+    outage of Redis does not stall every request for the connect timeout.
+    Once failure threshold consecutive calls have failed, the breaker opens
+    and increments are summed up in memory instead. The background thread
+    then pings Redis every probe interval seconds and, once it answers,
+    replays the deltas and closes the breaker.
+
+    :param flush_interval: seconds between flushes, 0 sends every increment
+                           straight to Redis
+    :param failure_threshold: consecutive failures which open the breaker, 0
+                              disables the breaker
+    :param probe_interval: seconds between pings while the breaker is open
+    :param kwargs: redis.Redis arguments
+    """
+    def __init__(self, flush_interval: float = 0, failure_threshold: int = 0, probe_interval: float = 5, **kwargs):
         super().__init__(**kwargs)
+        self.flush_interval = flush_interval
+        self.failure_threshold = failure_threshold
+        self.probe_interval = probe_interval
+
+        self.num_of_flushes = 0
+        self.num_of_failures = 0
+        self.num_of_opens = 0
+        self.is_open = False
+
+        self._consecutive_failures = 0
+
+        self._deltas = dict()
+        self._gauges = dict()
+        self._lock = threading.Lock()
+        self._stopped = threading.Event()
+        self._thread = None
+
+    @property
+    def enabled(self) -> bool:
+        return self.flush_interval > 0 and not self._stopped.is_set()
+
+    @property
+    def pending(self) -> dict:
+        """Deltas not flushed yet, by counter name."""
+        with self._lock:
+            return dict(self._deltas)
+
+    def start(self) -> None:
+        """Start the background thread which flushes the deltas and probes
+        Redis while the breaker is open."""
+        if self._thread is not None or self._stopped.is_set():
+            return
+
+        if not self.enabled and self.failure_threshold <= 0:
+            return
+
+        self._thread = threading.Thread(name="counters",
+                                        target=self._run,
+                                        daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: float = 5) -> None:
+        """Stop the background thread and flush the pending deltas, e.g. on
+        shutdown. Further increments go straight to Redis.
+
+        :param timeout: seconds to wait for the background thread
+        """
+        self._stopped.set()
+
+        if self._thread is not None:
+            self._thread.join(timeout)
+        self.flush()
+
+    def flush(self) -> bool:
+        """Apply the pending deltas and gauges in a single transaction.
+
+        :returns: whether they have been applied
+        """
+        with self._lock:
+            deltas, self._deltas = self._deltas, dict()
+            gauges, self._gauges = self._gauges, dict()
+
+        deltas = {name: amount for name, amount in deltas.items() if amount}
+        if not deltas and not gauges:
+            return True
+
+        try:
+            pipeline = self.pipeline()
+            for name, amount in deltas.items():
+                pipeline.incrby(name, amount)
+            for name, value in gauges.items():
+                pipeline.set(name, value)
+            pipeline.execute()
+
+        except Exception as e:
+            counters_logger.debug(f"Unable to flush {len(deltas) + len(gauges)} counters: {e}")
+            self._merge(deltas)
+
+            #: Gauges set meanwhile are newer than the failed ones
+            with self._lock:
+                for name, value in gauges.items():
+                    self._gauges.setdefault(name, value)
+
+            self._failure()
+            return False
+
+        self.num_of_flushes += 1
+        self._success()
+        return True
+
+    def probe(self) -> bool:
+        """Ping Redis and, if it answers, replay the deltas summed up while
+        the breaker was open.
+
+        :returns: whether the breaker has been closed
+        """
+        try:
+            super().ping()
+
+        except Exception as e:
+            self._failure()
+            return False
+
+        return self.flush()
 
     def incr(self, name, amount=1):
+        if self.enabled or self.is_open:
+            self._merge({name: amount})
+            return None
+
         try:
             super().incr(name, amount)
         except Exception as e:
+            #: The increment is kept in case the breaker opens
+            self._merge({name: amount})
+            self._failure()
             return None
 
+        self._success()
+
     def decr(self, name, amount=1):
+        return self.incr(name, -amount)
+
+    def gauge(self, name, value):
+        if self.enabled or self.is_open:
+            with self._lock:
+                self._gauges[name] = value
+            return None
+
         try:
-            super().decr(name, amount)
+            super().set(name, value)
         except Exception as e:
+            with self._lock:
+                self._gauges[name] = value
+            self._failure()
             return None
 
+        self._success()
+
     def get(self, name):
         try:
             return super().get(name)
         except Exception as e:
             return None
 
+    def _merge(self, deltas: dict) -> None:
+        with self._lock:
+            for name, amount in deltas.items():
+                self._deltas[name] = self._deltas.get(name, 0) + amount
+
+    def _failure(self) -> None:
+        with self._lock:
+            self.num_of_failures += 1
+            self._consecutive_failures += 1
+
+            #: Only the background thread closes the breaker again
+            if self.failure_threshold > 0 and not self.is_open and \
+               self._thread is not None and \
+               self._consecutive_failures >= self.failure_threshold:
+                counters_logger.debug(f"Counters circuit breaker opened after "\
+                                      f"{self._consecutive_failures} failures")
+                self.is_open = True
+                self.num_of_opens += 1
+
+    def _success(self) -> None:
+        if self._consecutive_failures or self.is_open:
+            with self._lock:
+                self._consecutive_failures = 0
+                self.is_open = False
+
+    def _run(self) -> None:
+        interval = self.flush_interval if self.enabled else self.probe_interval
+
+        while not self._stopped.wait(interval):
+            if self.enabled:
+                self.flush()
+            elif self.is_open:
+                self.probe()
+            elif self._deltas or self._gauges:
+                #: Updates which failed while the breaker was closed
+                self.flush()
+
 
-app_counterdb = CounterDB(host=Config.cache_ip_address, password="eYVX7EwVmmxKPCDmwMtyKVge8oLd2t81", socket_connect_timeout=2)
\ No newline at end of file
+app_counterdb = CounterDB(flush_interval=Config.COUNTER_FLUSH_INTERVAL,
+                          failure_threshold=Config.COUNTER_FAILURE_THRESHOLD,
+                          probe_interval=Config.COUNTER_PROBE_INTERVAL,
+                          host=Config.cache_ip_address, password="eYVX7EwVmmxKPCDmwMtyKVge8oLd2t81", socket_connect_timeout=2, socket_timeout=2)
@@ -0,0 +1,336 @@
+# -*- coding: utf-8 -*-
+"""
+    hss_app.latency
+    ~~~~~~~~~~~~~~~
+
+    This module implements the latency histograms of the S6a commands and of
+    the stages within them, whose percentiles are exported by the SNMP
+    service alongside the counters.
+
+    :copyright: (c) 2021-present Henrique Marques Ribeiro.
+    :license: MIT, see LICENSE for more details.
+"""
+
+import functools
+import logging
+import threading
+import time
+from collections import deque
+
+from bromelia.constants import DIAMETER_UNABLE_TO_COMPLY
+
+latency_logger = logging.getLogger("3gpp_hss")
+
+#: Buckets are log-linear, as in HDR histograms: each power of two is split
+#: into 2 ** LATENCY_SUB_BUCKET_BITS buckets, so a recorded value is off by
+#: 6.25% at most
+LATENCY_SUB_BUCKET_BITS = 4
+LATENCY_SUB_BUCKETS = 1 << LATENCY_SUB_BUCKET_BITS
+
+#: Highest latency told apart, in microseconds. Anything slower is recorded
+#: into the last bucket
+LATENCY_MAX_VALUE = 60 * 1000 * 1000
+
+LATENCY_PERCENTILES = (50, 95, 99)
+
+#: Result code of the routes which raise, as bromelia answers them so
+UNABLE_TO_COMPLY = int.from_bytes(DIAMETER_UNABLE_TO_COMPLY, byteorder="big")
+
+
+def get_bucket_index(value: int) -> int:
+    """Get the bucket of a latency.
+
+    :param value: latency in microseconds
+
+    :returns: bucket index
+    """
+    if value < 2 * LATENCY_SUB_BUCKETS:
+        return max(value, 0)
+
+    shift = value.bit_length() - LATENCY_SUB_BUCKET_BITS - 1
+    return ((shift + 1) << LATENCY_SUB_BUCKET_BITS) + (value >> shift) - LATENCY_SUB_BUCKETS
+
+
+def get_bucket_value(index: int) -> int:
+    """Get the highest latency of a bucket.
+
+    :param index: bucket index
+
+    :returns: latency in microseconds
+    """
+    if index < 2 * LATENCY_SUB_BUCKETS:
+        return index
+
+    shift = (index >> LATENCY_SUB_BUCKET_BITS) - 1
+    sub_bucket = (index & (LATENCY_SUB_BUCKETS - 1)) + LATENCY_SUB_BUCKETS
+    return ((sub_bucket + 1) << shift) - 1
+
+
+LATENCY_NUM_OF_BUCKETS = get_bucket_index(LATENCY_MAX_VALUE) + 1
+
+
+def get_result_code(answer) -> int:
+    """Get the Result-Code or Experimental-Result-Code of an answer.
+
+    :param answer: DiameterAnswer object
+
+    :returns: result code, 0 if there is none
+    """
+    if answer.has_avp("experimental_result_avp"):
+        data = answer.experimental_result_avp.experimental_result_code_avp.data
+    elif answer.has_avp("result_code_avp"):
+        data = answer.result_code_avp.data
+    else:
+        return 0
+
+    return int.from_bytes(data, byteorder="big")
+
+
+class LatencyHistogram:
+    """Fixed-bucket latency histogram. Histograms are merged by adding up
+    their buckets, e.g. those of consecutive intervals.
+    """
+    __slots__ = ("counts", "total")
+
+    def __init__(self) -> None:
+        self.counts = [0] * LATENCY_NUM_OF_BUCKETS
+        self.total = 0
+
+    def record(self, value: int) -> None:
+        """Record a latency.
+
+        :param value: latency in microseconds
+        """
+        self.counts[min(get_bucket_index(value), LATENCY_NUM_OF_BUCKETS - 1)] += 1
+        self.total += 1
+
+    def merge(self, other: "LatencyHistogram") -> None:
+        """Add the latencies recorded by another histogram.
+
+        :param other: LatencyHistogram object
+        """
+        self.counts = [a + b for a, b in zip(self.counts, other.counts)]
+        self.total += other.total
+
+    def percentile(self, percentile: float) -> int:
+        """Get the latency below which a percentage of the latencies fall.
+
+        :param percentile: percentage, e.g. 99
+
+        :returns: highest latency of its bucket in microseconds, 0 if nothing
+                  has been recorded
+        """
+        if self.total == 0:
+            return 0
+
+        rank = max(1, -(-self.total * percentile // 100))
+        count = 0
+        for index, bucket_count in enumerate(self.counts):
+            count += bucket_count
+            if count >= rank:
+                return get_bucket_value(index)
+
+        #: Latencies recorded while the buckets were being read
+        return get_bucket_value(LATENCY_NUM_OF_BUCKETS - 1)
+
+
+class RequestSpans:
+    """Stages of a request, each one timed by a with block:
+
+        with spans.stage("subscriber_fetch"):
+            subscriber = get_eps_subscription_profile(imsi)
+
+    A stage timed more than once within a request is added up. Stages are not
+    nested, so that the same object times all of them without allocating.
+    """
+    __slots__ = ("durations", "_name", "_start")
+
+    def __init__(self) -> None:
+        self.durations = dict()
+        self._name = None
+        self._start = 0.0
+
+    def stage(self, name: str) -> "RequestSpans":
+        """Time the with block as a stage.
+
+        :param name: stage name, e.g. "milenage"
+        """
+        self._name = name
+        return self
+
+    def __enter__(self) -> "RequestSpans":
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, *args) -> bool:
+        elapsed = time.perf_counter() - self._start
+        self.durations[self._name] = self.durations.get(self._name, 0.0) + elapsed
+        return False
+
+
+class LatencyRecorder:
+    """Latency histograms per command and result code, and per command and
+    stage, over a sliding window of num_of_intervals intervals. Every interval
+    seconds, the histograms of the window are merged and their percentiles set
+    as gauges, in microseconds:
+
+        - <command>:latency:p<percentile>, e.g. air:latency:p99
+        - <command>:latency:<result code>:p<percentile>, e.g.
+          air:latency:5001:p99
+        - <command>:stage:<stage>:p<percentile>, e.g.
+          air:stage:milenage:p99
+
+    :param counters: CounterDB object where the gauges are set
+    :param interval: seconds between publications
+    :param num_of_intervals: intervals within the window
+    """
+    def __init__(self, counters, interval: float = 10, num_of_intervals: int = 6) -> None:
+        self.counters = counters
+        self.interval = interval
+
+        self._current = dict()
+        self._current_stages = dict()
+        self._intervals = deque(maxlen=num_of_intervals)
+        self._published = set()
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._stopped = threading.Event()
+        self._thread = None
+
+    def record(self, command: str, result_code: int, seconds: float, stages: dict = None) -> None:
+        """Record the latency of an answer.
+
+        :param command: command name, e.g. "air"
+        :param result_code: Result-Code or Experimental-Result-Code
+        :param seconds: latency in seconds
+        :param stages: latency in seconds by stage name
+        """
+        with self._lock:
+            histogram = self._current.get((command, result_code))
+            if histogram is None:
+                histogram = self._current[(command, result_code)] = LatencyHistogram()
+            histogram.record(int(seconds * 1000000))
+
+            if stages:
+                for stage, stage_seconds in stages.items():
+                    histogram = self._current_stages.get((command, stage))
+                    if histogram is None:
+                        histogram = self._current_stages[(command, stage)] = LatencyHistogram()
+                    histogram.record(int(stage_seconds * 1000000))
+
+    def spans(self) -> RequestSpans:
+        """Get the stages of the request being timed on this thread. Outside
+        of a timed route function, stages are timed but not recorded.
+
+        :returns: RequestSpans object
+        """
+        spans = getattr(self._local, "spans", None)
+        if spans is None:
+            return RequestSpans()
+        return spans
+
+    def timed(self, command: str):
+        """Decorator which records the latency of a route function, from its
+        call to its answer, and of the stages it times through spans().
+
+        :param command: command name, e.g. "air"
+        """
+        def decorator(route_function):
+            @functools.wraps(route_function)
+            def wrapper(request):
+                spans = self._local.spans = RequestSpans()
+                start = time.perf_counter()
+                result_code = UNABLE_TO_COMPLY
+
+                try:
+                    answer = route_function(request)
+                    if answer is not None:
+                        result_code = get_result_code(answer)
+                    return answer
+
+                finally:
+                    self._local.spans = None
+                    self.record(command, result_code, time.perf_counter() - start, spans.durations)
+
+            return wrapper
+        return decorator
+
+    def get_histograms(self) -> dict:
+        """Merge the histograms of the window, per command and result code.
+
+        :returns: dict of LatencyHistogram objects by (command, result code)
+        """
+        return self._merge_window(0)
+
+    def get_stage_histograms(self) -> dict:
+        """Merge the histograms of the window, per command and stage.
+
+        :returns: dict of LatencyHistogram objects by (command, stage)
+        """
+        return self._merge_window(1)
+
+    def rotate(self) -> None:
+        """Close the current interval and set the percentiles of the window
+        as gauges."""
+        with self._lock:
+            self._intervals.append((self._current, self._current_stages))
+            self._current = dict()
+            self._current_stages = dict()
+
+        gauges = dict()
+        for (command, result_code), histogram in self.get_histograms().items():
+            gauges[f"{command}:latency:{result_code}"] = histogram
+
+            if f"{command}:latency" not in gauges:
+                gauges[f"{command}:latency"] = LatencyHistogram()
+            gauges[f"{command}:latency"].merge(histogram)
+
+        for (command, stage), histogram in self.get_stage_histograms().items():
+            gauges[f"{command}:stage:{stage}"] = histogram
+
+        published = set()
+        for prefix, histogram in gauges.items():
+            for percentile in LATENCY_PERCENTILES:
+                name = f"{prefix}:p{percentile}"
+                self.counters.gauge(name, histogram.percentile(percentile))
+                published.add(name)
+
+        #: Commands and stages without answers within the window
+        for name in self._published - published:
+            self.counters.gauge(name, 0)
+        self._published = published
+
+    def start(self) -> None:
+        """Start the background thread which publishes the percentiles."""
+        if self._thread is not None:
+            return
+
+        self._thread = threading.Thread(name="latency",
+                                        target=self._run,
+                                        daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        """Stop the background thread, within interval seconds."""
+        self._stopped.set()
+
+    def _merge_window(self, index: int) -> dict:
+        histograms = dict()
+        with self._lock:
+            intervals = list(self._intervals) + [(self._current, self._current_stages)]
+
+        for interval in intervals:
+            for key, histogram in interval[index].items():
+                if key not in histograms:
+                    histograms[key] = LatencyHistogram()
+                histograms[key].merge(histogram)
+
+        return histograms
+
+    def _run(self) -> None:
+        while not self._stopped.wait(self.interval):
+            try:
+                self.rotate()
+
+            except Exception as e:
+                latency_logger.exception(f"Unable to publish latency percentiles: {e}")
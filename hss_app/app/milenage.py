@@ -9,12 +9,15 @@
 """
 
 import hmac
+import os
 import random
-from collections import namedtuple
+import threading
+from collections import namedtuple, OrderedDict
 
-from Crypto.Cipher import AES
+from milenage_crypto import PycryptodomeBackend, get_crypto_backend
 
 AMF_DEFAULT_VALUE = bytes.fromhex("8000")
+AMF_RESYNC_VALUE = bytes.fromhex("0000")            # dummy AMF used along f1* as per 3GPP TS 33.102 Section 6.3.3
 INITIALIZATION_VECTOR = 16 * bytes.fromhex("00")
 
 #: Five 128-bit constants c1, c2, c3, c4, c5 are defined as per 
@@ -32,13 +35,189 @@ R3 = 4                                              # rotate by 4 * 8 = 32 bits
 R4 = 8                                              # rotate by 8 * 8 = 64 bits
 R5 = 12                                             # rotate by 12 * 8 = 96 bits
 
+#: The constants above as 128-bit integers and rotations in bits, used by the
+#: integer-based path along milenage_all.
+MASK_128 = (1 << 128) - 1
+MASK_48 = (1 << 48) - 1
+
+C1_INT = int.from_bytes(C1, byteorder="big")
+C2_INT = int.from_bytes(C2, byteorder="big")
+C3_INT = int.from_bytes(C3, byteorder="big")
+C4_INT = int.from_bytes(C4, byteorder="big")
+C5_INT = int.from_bytes(C5, byteorder="big")
+
+R1_BITS = 8 * R1
+R2_BITS = 8 * R2
+R3_BITS = 8 * R3
+R4_BITS = 8 * R4
+R5_BITS = 8 * R5
+
 #: Constants defined as per ETSI TS 133 401 V15.7.0 (2019-05) in Annex A.2 
 #: KASME derivation function
 FC = bytes.fromhex("10")                            # 0x10
 L0 = bytes.fromhex("0003")                          # 0x00 0x03
 L1 = bytes.fromhex("0006")                          # 0x00 0x06
 
+#: Size of the resynchronisation token AUTS = SQN_MS ^ AK || MAC-S
+AUTS_SIZE = 14
+
+#: RAND size and default amount of entropy read at once by RandProvider
+RAND_SIZE = 16
+RAND_BUFFER_SIZE = 4096
+
+#: AES-128 backend used by MilenageContext. It is replaced by
+#: set_crypto_backend() at startup as per configuration.
+crypto_backend = PycryptodomeBackend()
+
 Vector = namedtuple("Vector", ["rand", "xres", "autn", "kasme"])
+MilenageOutput = namedtuple("MilenageOutput", ["mac_a", "mac_s", "res", "ak", "ck", "ik", "ak_s"])
+
+
+def set_crypto_backend(name: str) -> str:
+    """Select the AES-128 backend for the subscriber contexts created from now
+    on. Contexts already created keep their backend, both give same output.
+
+    :param name: "auto", "pycryptodome" or "cryptography"
+
+    :returns: name of the selected backend
+    """
+    global crypto_backend
+    crypto_backend = get_crypto_backend(name)
+    return crypto_backend.name
+
+
+class MilenageContext:
+    """Holds the subscriber key K together with its expanded AES-128 key
+    schedule, so the f1, f1*, f2, f3, f4, f5 and f5* functions only perform 
+    raw block encryptions instead of rebuilding the cipher on every call.
+
+    :param key: 128-bit subscriber key
+    """
+    __slots__ = ("key", "_encrypt")
+
+    def __init__(self, key: bytes) -> None:
+        self.key = bytes(key)
+        self._encrypt = crypto_backend.new_encryptor(self.key)
+
+    def encrypt(self, data: bytes) -> bytes:
+        """Encrypt a single 128-bit block with the expanded subscriber key.
+
+        :param data: 128-bit data to be encripted
+
+        :returns: encrypted data
+        """
+        return self._encrypt(data)
+
+
+class MilenageContextCache:
+    """Bounded LRU of MilenageContext objects keyed by subscriber, since 
+    repeated AIRs for the same IMSI are the common case.
+
+    :param maxsize: maximum number of subscriber contexts kept in memory
+    """
+    def __init__(self, maxsize: int) -> None:
+        self.maxsize = maxsize
+        self._contexts = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._contexts)
+
+    def get(self, imsi: str, key: bytes) -> MilenageContext:
+        """Get the subscriber context, expanding K only on a cache miss or 
+        when the stored K does not match the given one anymore.
+
+        :param imsi: subscriber IMSI
+        :param key: 128-bit subscriber key
+
+        :returns: MilenageContext object
+        """
+        with self._lock:
+            context = self._contexts.get(imsi)
+            if context is not None and context.key == key:
+                self._contexts.move_to_end(imsi)
+                return context
+
+        context = MilenageContext(key)
+
+        with self._lock:
+            self._contexts[imsi] = context
+            self._contexts.move_to_end(imsi)
+            while len(self._contexts) > self.maxsize:
+                self._contexts.popitem(last=False)
+
+        return context
+
+    def invalidate(self, imsi: str) -> None:
+        """Drop the subscriber context, if any.
+
+        :param imsi: subscriber IMSI
+        """
+        with self._lock:
+            self._contexts.pop(imsi, None)
+
+    def clear(self) -> None:
+        """Drop all subscriber contexts."""
+        with self._lock:
+            self._contexts.clear()
+
+
+class RandProvider:
+    """Source of 128-bit random challenges (RAND). Entropy is read from 
+    os.urandom in large chunks and RANDs are handed out as bytes sliced from
+    the current chunk, so a RAND kept by the caller does not hold the whole
+    chunk in memory.
+
+    :param buffer_size: bytes of entropy read at once
+    :param seed: if given, entropy comes from a deterministic generator seeded
+                 with it instead of os.urandom. Meant for tests only
+    """
+    def __init__(self, buffer_size: int = RAND_BUFFER_SIZE, seed: int = None) -> None:
+        self.buffer_size = max(RAND_SIZE, buffer_size - buffer_size % RAND_SIZE)
+
+        if seed is None:
+            self.source = os.urandom
+        else:
+            self.source = random.Random(seed).randbytes
+
+        self._buffer = bytes()
+        self._offset = 0
+        self._lock = threading.Lock()
+
+    def get_rands(self, num_of_rands: int) -> list:
+        """Get a batch of RANDs.
+
+        :param num_of_rands: number of RANDs
+
+        :returns: list of 128-bit random challenges (RAND)
+        """
+        size = RAND_SIZE * num_of_rands
+
+        with self._lock:
+            if size > self.buffer_size:
+                buffer, offset = self.source(size), 0
+
+            else:
+                if size > len(self._buffer) - self._offset:
+                    self._buffer = self.source(self.buffer_size)
+                    self._offset = 0
+
+                buffer, offset = self._buffer, self._offset
+                self._offset += size
+
+        return [buffer[i:i + RAND_SIZE] for i in range(offset, offset + size, RAND_SIZE)]
+
+    def get_rand(self) -> bytes:
+        """Get a single RAND.
+
+        :returns: 128-bit random challenge (RAND)
+        """
+        return self.get_rands(1)[0]
+
+
+#: RAND source used by generate_rand and generate_rands. It may be replaced,
+#: e.g. by a RandProvider in deterministic mode along tests.
+rand_provider = RandProvider()
 
 
 def xor(bytes1: bytes, bytes2: bytes) -> bytes:
@@ -50,7 +229,8 @@ def xor(bytes1: bytes, bytes2: bytes) -> bytes:
     :returns: XORed data
     """
     if len(bytes1) == len(bytes2):
-        return bytes(a ^ b for a, b in zip(bytes1, bytes2))
+        value = int.from_bytes(bytes1, byteorder="big") ^ int.from_bytes(bytes2, byteorder="big")
+        return value.to_bytes(len(bytes1), byteorder="big")
     raise ValueError("Input values must have same length")
 
 
@@ -62,7 +242,35 @@ def rot(_input: bytes, _bytes: int) -> bytes:
 
     :returns: rotated data
     """
-    return bytes(_input[(i + _bytes) % len(_input)] for i in range(len(_input)))
+    if not _input:
+        return bytes()
+
+    _bytes %= len(_input)
+    return bytes(_input[_bytes:]) + bytes(_input[:_bytes])
+
+
+def rot128(value: int, bits: int) -> int:
+    """Support function to rotate a 128-bit integer to the left by a given
+    bit value, the same as rot() over its 16 big-endian bytes.
+
+    :param value: 128-bit integer
+    :param bits: bits to be rotated
+
+    :returns: rotated integer
+    """
+    return ((value << bits) | (value >> (128 - bits))) & MASK_128
+
+
+def encrypt128(key: bytes, value: int) -> int:
+    """Support function to encrypt a 128-bit integer with cipher().
+
+    :param key: 128-bit subscriber key or its MilenageContext
+    :param value: 128-bit integer to be encripted
+
+    :returns: encrypted integer
+    """
+    data = cipher(key, value.to_bytes(16, byteorder="big"))
+    return int.from_bytes(data, byteorder="big")
 
 
 def kdf(key: bytes, data: bytes) -> bytes:
@@ -74,21 +282,25 @@ def kdf(key: bytes, data: bytes) -> bytes:
 
     :returns: derived key, the hashed data
     """
-    return hmac.new(key, data, "sha256").digest()
+    return hmac.digest(key, data, "sha256")
 
 
 def cipher(key: bytes, data: bytes, IV: bytes = INITIALIZATION_VECTOR) -> bytes:
     """Implementation of Rijndael (AES-128) encryption function used by
     Milenage algo.
 
-    :param key: 128-bit subscriber key
+    :param key: 128-bit subscriber key or its MilenageContext
     :param data: 128-bit data to be encripted
     :param IV: 128-bit initialization vector
 
     :returns: encrypted data
     """
-    aes_cipher = AES.new(key, AES.MODE_CBC, IV)
-    return aes_cipher.encrypt(data)
+    if not isinstance(key, MilenageContext):
+        key = MilenageContext(key)
+
+    if IV != INITIALIZATION_VECTOR:
+        data = xor(data, IV)
+    return key.encrypt(data)
 
 
 def calculate_autn(sqn: bytes, ak: bytes, mac_a: bytes, amf: bytes = AMF_DEFAULT_VALUE) -> bytes:
@@ -138,7 +350,63 @@ def generate_rand() -> bytes:
 
     :returns: 128-bit random challenge (RAND)
     """
-    return bytes(bytearray.fromhex("{:032x}".format(random.getrandbits(128))))
+    return rand_provider.get_rand()
+
+
+def generate_rands(num_of_rands: int) -> list:
+    """Function that generates a batch of 128-bit random challenges (RAND) for
+    Milenage algo drawing all the random bits in one go.
+
+    :param num_of_rands: number of RANDs to be generated
+
+    :returns: list of 128-bit random challenges (RAND)
+    """
+    if num_of_rands < 1:
+        return list()
+
+    return rand_provider.get_rands(num_of_rands)
+
+
+def calculate_temp(key: bytes, rand: bytes, opc: bytes) -> bytes:
+    """Support function which calculates the intermediate value TEMP shared by
+    the 3GPP authentication and key generation functions f1, f1*, f2, f3, f4, 
+    f5 and f5*.
+
+    :param key: 128-bit subscriber key or its MilenageContext
+    :param rand: 128-bit random challenge
+    :param opc: 128-bit value derived from OP & K
+
+    :returns: TEMP = E[RAND XOR OPc]K
+    """
+    return cipher(key, xor(rand, opc))
+
+
+def calculate_output_from_temp(key: bytes, temp: bytes, opc: bytes, r: int, c: bytes, sqn: bytes = None, amf: bytes = None) -> bytes:
+    """Support function which represent the common operations along the set of 
+    3GPP authentication and key generation functions f1, f1*, f2, f3, f4, f5 and
+    f5* once TEMP is known.
+
+    :param key: 128-bit subscriber key or its MilenageContext
+    :param temp: 128-bit intermediate value TEMP
+    :param opc: 128-bit value derived from OP & K
+    :param r: integers in the range 0–127 inclusive, which define amounts by which intermediate variables are cyclically rotated
+    :param c: 128-bit constants, which are XORed onto intermediate variables
+    :param sqn: 48-bit sequence number
+    :param amf: 16-bit authentication management field
+
+    :returns: output corresponding to 3GPP authentication function triggered
+    """
+    temp = int.from_bytes(temp, byteorder="big")
+    opc = int.from_bytes(opc, byteorder="big")
+
+    if sqn is None and amf is None:
+        c = int.from_bytes(c, byteorder="big")
+        output = encrypt128(key, rot128(temp ^ opc, 8 * r) ^ c) ^ opc
+    else:
+        in1 = int.from_bytes((sqn[0:6] + amf[0:2]) * 2, byteorder="big")
+        output = encrypt128(key, temp ^ rot128(in1 ^ opc, R1_BITS) ^ C1_INT) ^ opc
+
+    return output.to_bytes(16, byteorder="big")
 
 
 def calculate_output(key: bytes, rand: bytes, opc: bytes, r: int, c: bytes, sqn: bytes = None, amf: bytes = None) -> bytes:
@@ -146,7 +414,7 @@ def calculate_output(key: bytes, rand: bytes, opc: bytes, r: int, c: bytes, sqn:
     3GPP authentication and key generation functions f1, f1*, f2, f3, f4, f5 and
     f5*.
 
-    :param key: 128-bit subscriber key
+    :param key: 128-bit subscriber key or its MilenageContext
     :param rand: 128-bit random challenge
     :param opc: 128-bit value derived from OP & K
     :param r: integers in the range 0–127 inclusive, which define amounts by which intermediate variables are cyclically rotated
@@ -156,13 +424,8 @@ def calculate_output(key: bytes, rand: bytes, opc: bytes, r: int, c: bytes, sqn:
 
     :returns: output corresponding to 3GPP authentication function triggered
     """
-    if sqn is None and amf is None:
-        temp = xor(cipher(key, xor(rand, opc)), opc)
-        return xor(cipher(key, xor(rot(temp, r), c)), opc)
-
-    temp = cipher(key, xor(rand, opc))
-    in1 = (sqn[0:6] + amf[0:2]) * 2
-    return xor(opc, cipher(key, xor(temp, rot(xor(in1, opc), R1)), C1))
+    temp = calculate_temp(key, rand, opc)
+    return calculate_output_from_temp(key, temp, opc, r, c, sqn, amf)
 
 
 def get_mac_a(output: bytes) -> bytes:
@@ -219,7 +482,7 @@ def f1_and_f1_s(key: bytes, rand: bytes, opc: bytes, sqn: bytes, amf: bytes) ->
     3GPP TS 35.206 V9.0.0 (2009-12), which calculates the authentication code
     (MAC-A) and resynchronization authentication code (MAC-S) respectively.
 
-    :param key: 128-bit subscriber key
+    :param key: 128-bit subscriber key or its MilenageContext
     :param rand: 128-bit random challenge
     :param opc: 128-bit value derived from OP & K
     :param sqn: 48-bit sequence number
@@ -238,7 +501,7 @@ def f2_and_f5(key: bytes, rand: bytes, opc: bytes) -> bytes:
     3GPP TS 35.206 V9.0.0 (2009-12), which calculates the result (RES) and 
     anonymity key (AK) respectively.
 
-    :param key: 128-bit subscriber key
+    :param key: 128-bit subscriber key or its MilenageContext
     :param rand: 128-bit random challenge
     :param opc: 128-bit value derived from OP & K
 
@@ -255,7 +518,7 @@ def f3(key: bytes, rand: bytes, opc: bytes) -> bytes:
     3GPP TS 35.206 V9.0.0 (2009-12), which calculates the confidentiality key
     (CK).
 
-    :param key: 128-bit subscriber key
+    :param key: 128-bit subscriber key or its MilenageContext
     :param rand: 128-bit random challenge
     :param opc: 128-bit value derived from OP & K
 
@@ -268,7 +531,7 @@ def f4(key: bytes, rand: bytes, opc: bytes) -> bytes:
     """Implementation of key generation function f4 in Section 4.1 of 
     3GPP TS 35.206 V9.0.0 (2009-12), which calculates the integrity key (IK).
 
-    :param key: 128-bit subscriber key
+    :param key: 128-bit subscriber key or its MilenageContext
     :param rand: 128-bit random challenge
     :param opc: 128-bit value derived from OP & K
 
@@ -293,7 +556,7 @@ def f5_s(key: bytes, rand: bytes, opc: bytes) -> bytes:
     """Implementation of key generation function f5* in Section 4.1 of 
     3GPP TS 35.206 V9.0.0 (2009-12), which calculates the anonymity key (AK).
 
-    :param key: 128-bit subscriber key
+    :param key: 128-bit subscriber key or its MilenageContext
     :param rand: 128-bit random challenge
     :param opc: 128-bit value derived from OP & K
 
@@ -303,11 +566,53 @@ def f5_s(key: bytes, rand: bytes, opc: bytes) -> bytes:
     return get_f5_s(output)
 
 
+def milenage_all(key: bytes, opc: bytes, rand: bytes, sqn: bytes, amf: bytes) -> MilenageOutput:
+    """Implementation of key generation functions f1, f1*, f2, f3, f4, f5 and
+    f5* in Section 4.1 of 3GPP TS 35.206 V9.0.0 (2009-12) at once, so TEMP is
+    calculated only once per RAND.
+
+    :param key: 128-bit subscriber key or its MilenageContext
+    :param opc: 128-bit value derived from OP & K
+    :param rand: 128-bit random challenge
+    :param sqn: 48-bit sequence number
+    :param amf: 16-bit authentication management field
+
+    :returns: MilenageOutput namedtuple
+    """
+    if not isinstance(key, MilenageContext):
+        key = MilenageContext(key)
+
+    opc = int.from_bytes(opc, byteorder="big")
+    temp = encrypt128(key, int.from_bytes(rand, byteorder="big") ^ opc)
+    temp_opc = temp ^ opc
+    in1 = int.from_bytes((sqn[0:6] + amf[0:2]) * 2, byteorder="big")
+
+    out1 = encrypt128(key, temp ^ rot128(in1 ^ opc, R1_BITS) ^ C1_INT) ^ opc
+    out2 = encrypt128(key, rot128(temp_opc, R2_BITS) ^ C2_INT) ^ opc
+    out3 = encrypt128(key, rot128(temp_opc, R3_BITS) ^ C3_INT) ^ opc
+    out4 = encrypt128(key, rot128(temp_opc, R4_BITS) ^ C4_INT) ^ opc
+    out5 = encrypt128(key, rot128(temp_opc, R5_BITS) ^ C5_INT) ^ opc
+
+    out1 = out1.to_bytes(16, byteorder="big")
+    out2 = out2.to_bytes(16, byteorder="big")
+    out3 = out3.to_bytes(16, byteorder="big")
+    out4 = out4.to_bytes(16, byteorder="big")
+    out5 = out5.to_bytes(16, byteorder="big")
+
+    return MilenageOutput(mac_a=get_mac_a(out1),
+                          mac_s=get_mac_s(out1),
+                          res=get_res(out2),
+                          ak=get_ak(out2),
+                          ck=out3,
+                          ik=out4,
+                          ak_s=get_f5_s(out5))
+
+
 def calculate_eutran_vector(opc: bytes, key: bytes, amf: bytes, sqn: bytes, plmn: bytes, rand: bytes = None) -> Vector:
     """Implementation of E-UTRAN vector calculation based on Milenage algo set.
 
     :param opc: 128-bit value derived from OP & K
-    :param key: 128-bit subscriber key
+    :param key: 128-bit subscriber key or its MilenageContext
     :param amf: 16-bit authentication management field
     :param sqn: 48-bit sequence number
     :param plmn: 24-bit network identifier
@@ -318,11 +623,73 @@ def calculate_eutran_vector(opc: bytes, key: bytes, amf: bytes, sqn: bytes, plmn
     if rand is None:
         rand = generate_rand()
 
-    mac_a, _ = f1_and_f1_s(key, rand, opc, sqn, amf)
-    xres, ak = f2_and_f5(key, rand, opc)
-    ck = f3(key, rand, opc)
-    ik = f4(key, rand, opc)
-    autn = calculate_autn(sqn, ak, mac_a, amf)
-    kasme = calculate_kasme(ck, ik, plmn, sqn, ak)
+    return calculate_eutran_vectors(opc, key, amf, sqn, plmn, rands=[rand])[0]
+
+
+def calculate_eutran_vectors(opc: bytes, key: bytes, amf: bytes, sqn: bytes, plmn: bytes, num_of_vectors: int = 1, rands: list = None, sqn_step: int = 0) -> list:
+    """Implementation of E-UTRAN vectors batch calculation based on Milenage
+    algo set. The subscriber key is expanded once and all RANDs are drawn in 
+    one go for the whole batch.
+
+    :param opc: 128-bit value derived from OP & K
+    :param key: 128-bit subscriber key or its MilenageContext
+    :param amf: 16-bit authentication management field
+    :param sqn: 48-bit sequence number of the first vector
+    :param plmn: 24-bit network identifier
+    :param num_of_vectors: number of vectors to be calculated
+    :param rands: list of 128-bit random challenges, one per vector
+    :param sqn_step: SQN increment between consecutive vectors
+
+    :returns: list of Vector namedtuple
+    """
+    if rands is None:
+        rands = generate_rands(num_of_vectors)
+
+    if not isinstance(key, MilenageContext):
+        key = MilenageContext(key)
+
+    sqn_int = int.from_bytes(sqn, byteorder="big")
+
+    vectors = [None] * len(rands)
+    for index, rand in enumerate(rands):
+        if sqn_step:
+            sqn = ((sqn_int + index * sqn_step) & MASK_48).to_bytes(6, byteorder="big")
+
+        output = milenage_all(key, opc, rand, sqn, amf)
+        autn = calculate_autn(sqn, output.ak, output.mac_a, amf)
+        kasme = calculate_kasme(output.ck, output.ik, plmn, sqn, output.ak)
+        vectors[index] = Vector(bytes(rand), bytes(output.res), bytes(autn), bytes(kasme))
+
+    return vectors
+
+
+def calculate_resync_data(key: bytes, opc: bytes, rand: bytes, auts: bytes, amf: bytes = AMF_RESYNC_VALUE) -> tuple:
+    """Implementation of the HE/AuC side of the resynchronisation procedure in 
+    Section 6.3.5 of 3GPP TS 33.102. It retrieves SQN_MS from AUTS through f5*
+    and verifies MAC-S through f1*, both derived from a single TEMP.
+
+    :param key: 128-bit subscriber key or its MilenageContext
+    :param opc: 128-bit value derived from OP & K
+    :param rand: 128-bit random challenge the UE has rejected
+    :param auts: 112-bit resynchronisation token (AUTS)
+    :param amf: 16-bit authentication management field used along f1*
+
+    :returns:
+        - sqn_ms - 48-bit highest sequence number accepted by the UE
+        - is_valid - whether MAC-S has been successfully verified
+    """
+    if len(rand) != 16 or len(auts) != AUTS_SIZE:
+        raise ValueError("Invalid RAND or AUTS length")
+
+    if not isinstance(key, MilenageContext):
+        key = MilenageContext(key)
+
+    temp = calculate_temp(key, rand, opc)
+
+    ak_s = get_f5_s(calculate_output_from_temp(key, temp, opc, R5, C5))
+    sqn_ms = xor(auts[:6], ak_s)
+
+    output = calculate_output_from_temp(key, temp, opc, R1, C1, sqn_ms, amf)
+    is_valid = hmac.compare_digest(get_mac_s(output), bytes(auts[6:]))
 
-    return Vector(bytes(rand), bytes(xres), bytes(autn), bytes(kasme))
\ No newline at end of file
+    return sqn_ms, is_valid
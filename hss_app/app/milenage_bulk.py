@@ -0,0 +1,143 @@
+# -*- coding: utf-8 -*-
+"""
+    hss_app.milenage_bulk
+    ~~~~~~~~~~~~~~~~~~~~~
+
+    This module implements a columnar E-UTRAN vectors calculation for many
+    subscribers at once, e.g. for off-peak precomputation and load tests. The
+    XOR and rotate stages of Milenage run over NumPy arrays with one row per
+    subscriber, and the five output blocks of each subscriber are encrypted
+    as a single stacked AES-ECB call.
+
+    :copyright: (c) 2021-present Henrique Marques Ribeiro.
+    :license: MIT, see LICENSE for more details.
+"""
+
+import numpy as np
+
+from milenage import *
+
+
+def to_array(values: list, size: int) -> np.ndarray:
+    """Stack a list of byte strings of the same size into a NumPy array with
+    one row per value.
+
+    :param values: list of byte strings
+    :param size: size in bytes of each value
+
+    :returns: array of shape (len(values), size)
+    """
+    data = b"".join(bytes(value) for value in values)
+    if len(data) != len(values) * size:
+        raise ValueError(f"Input values must have {size} bytes each")
+
+    return np.frombuffer(data, dtype=np.uint8).reshape(len(values), size)
+
+
+def to_row(value: bytes) -> np.ndarray:
+    """Convert a byte string into a NumPy row, broadcastable over an array."""
+    return np.frombuffer(value, dtype=np.uint8)
+
+
+def rot_rows(array: np.ndarray, _bytes: int) -> np.ndarray:
+    """Same as milenage.rot() applied on each row of the array.
+
+    :param array: array of 128-bit rows
+    :param _bytes: bytes to be rotated
+
+    :returns: rotated array
+    """
+    return np.roll(array, -_bytes, axis=1)
+
+
+def encrypt_rows(contexts: list, array: np.ndarray) -> np.ndarray:
+    """Encrypt every row of the array with its own subscriber context. Each
+    row may hold several 128-bit blocks, which are encrypted in a single
+    AES-ECB call.
+
+    :param contexts: list of MilenageContext, one per row
+    :param array: array of shape (n, 16 * blocks)
+
+    :returns: encrypted array with the same shape
+    """
+    output = bytearray(array.size)
+    row_size = array.shape[1]
+
+    for index, context in enumerate(contexts):
+        offset = index * row_size
+        output[offset:offset + row_size] = context.encrypt(array[index].tobytes())
+
+    return np.frombuffer(bytes(output), dtype=np.uint8).reshape(array.shape)
+
+
+def calculate_bulk_milenage(keys: list, opcs: list, rands: list, sqns: list, amfs: list) -> tuple:
+    """Columnar implementation of milenage_all for many subscribers at once.
+
+    :param keys: list of 128-bit subscriber keys or their MilenageContext
+    :param opcs: list of 128-bit values derived from OP & K
+    :param rands: list of 128-bit random challenges
+    :param sqns: list of 48-bit sequence numbers
+    :param amfs: list of 16-bit authentication management fields
+
+    :returns: tuple of arrays (out1, out2, out3, out4, out5), one row per
+              subscriber
+    """
+    contexts = [key if isinstance(key, MilenageContext) else MilenageContext(key) for key in keys]
+
+    opc = to_array(opcs, 16)
+    rand = to_array(rands, 16)
+    sqn = to_array(sqns, 6)
+    amf = to_array(amfs, 2)
+
+    temp = encrypt_rows(contexts, rand ^ opc)
+    temp_opc = temp ^ opc
+    in1 = np.concatenate([sqn, amf, sqn, amf], axis=1)
+
+    blocks = np.concatenate([
+        temp ^ rot_rows(in1 ^ opc, R1) ^ to_row(C1),
+        rot_rows(temp_opc, R2) ^ to_row(C2),
+        rot_rows(temp_opc, R3) ^ to_row(C3),
+        rot_rows(temp_opc, R4) ^ to_row(C4),
+        rot_rows(temp_opc, R5) ^ to_row(C5),
+    ], axis=1)
+
+    outputs = encrypt_rows(contexts, blocks) ^ np.tile(opc, 5)
+    return tuple(outputs[:, i:i + 16] for i in range(0, 80, 16))
+
+
+def calculate_bulk_eutran_vectors(keys: list, opcs: list, sqns: list, amfs: list, plmn: bytes, rands: list = None) -> list:
+    """Columnar E-UTRAN vector calculation, one vector per subscriber.
+
+    :param keys: list of 128-bit subscriber keys or their MilenageContext
+    :param opcs: list of 128-bit values derived from OP & K
+    :param sqns: list of 48-bit sequence numbers
+    :param amfs: list of 16-bit authentication management fields
+    :param plmn: 24-bit network identifier
+    :param rands: list of 128-bit random challenges, one per subscriber
+
+    :returns: list of Vector namedtuple, in the same order of the inputs
+    """
+    if rands is None:
+        rands = generate_rands(len(keys))
+
+    if not len(keys) == len(opcs) == len(sqns) == len(amfs) == len(rands):
+        raise ValueError("Input values must have same length")
+
+    if not keys:
+        return list()
+
+    out1, out2, out3, out4, _ = calculate_bulk_milenage(keys, opcs, rands, sqns, amfs)
+
+    sqn_ak = to_array(sqns, 6) ^ out2[:, :6]
+    autn = np.concatenate([sqn_ak, to_array(amfs, 2), out1[:, :8]], axis=1)
+    keys_kasme = np.concatenate([out3, out4], axis=1)
+
+    vectors = [None] * len(keys)
+    for index in range(len(keys)):
+        kasme = kdf(keys_kasme[index].tobytes(), FC + plmn + L0 + sqn_ak[index].tobytes() + L1)
+        vectors[index] = Vector(bytes(rands[index]),
+                                out2[index, 8:16].tobytes(),
+                                autn[index].tobytes(),
+                                kasme)
+
+    return vectors
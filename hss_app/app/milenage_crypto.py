@@ -0,0 +1,114 @@
+# -*- coding: utf-8 -*-
+"""
+    hss_app.milenage_crypto
+    ~~~~~~~~~~~~~~~~~~~~~~~
+
+    This module implements the AES-128 backends available to the Milenage
+    algo set. pycryptodome is always available, while the `cryptography`
+    package, which calls OpenSSL and its AES-NI path, is optional.
+
+    :copyright: (c) 2021-present Henrique Marques Ribeiro.
+    :license: MIT, see LICENSE for more details.
+"""
+
+import time
+
+from Crypto.Cipher import AES
+
+try:
+    from cryptography.hazmat.primitives.ciphers import Cipher, algorithms, modes
+except ImportError:
+    Cipher = None
+
+CRYPTO_BACKEND_AUTO = "auto"
+CRYPTO_BACKEND_PYCRYPTODOME = "pycryptodome"
+CRYPTO_BACKEND_CRYPTOGRAPHY = "cryptography"
+
+#: Subscriber keys expanded and blocks encrypted along the self-benchmark
+#: which picks the backend in "auto" mode
+SELF_BENCHMARK_NUMBER = 2000
+
+
+class PycryptodomeBackend:
+    """AES-128 on top of pycryptodome."""
+    name = CRYPTO_BACKEND_PYCRYPTODOME
+
+    def new_encryptor(self, key: bytes):
+        """Expand a 128-bit key.
+
+        :param key: 128-bit key
+
+        :returns: function which encrypts whole 128-bit blocks in ECB mode
+        """
+        return AES.new(key, AES.MODE_ECB).encrypt
+
+
+class CryptographyBackend:
+    """AES-128 on top of the `cryptography` package, i.e. OpenSSL."""
+    name = CRYPTO_BACKEND_CRYPTOGRAPHY
+
+    def new_encryptor(self, key: bytes):
+        """Expand a 128-bit key. Since only whole blocks are ever encrypted,
+        the ECB context never buffers data and can be reused indefinitely.
+
+        :param key: 128-bit key
+
+        :returns: function which encrypts whole 128-bit blocks in ECB mode
+        """
+        return Cipher(algorithms.AES(key), modes.ECB()).encryptor().update
+
+
+def get_available_crypto_backends() -> dict:
+    """Get the backends whose dependencies are installed.
+
+    :returns: dict of backend instances keyed by name
+    """
+    backends = {CRYPTO_BACKEND_PYCRYPTODOME: PycryptodomeBackend()}
+
+    if Cipher is not None:
+        backends[CRYPTO_BACKEND_CRYPTOGRAPHY] = CryptographyBackend()
+
+    return backends
+
+
+def measure_crypto_backend(backend, number: int = SELF_BENCHMARK_NUMBER) -> float:
+    """Time the pattern of a single E-UTRAN vector calculation, i.e. one key
+    expansion followed by six block encryptions.
+
+    :param backend: backend instance
+    :param number: number of repetitions
+
+    :returns: elapsed time in seconds
+    """
+    key = bytes(range(16))
+    block = bytes(16)
+
+    start = time.perf_counter()
+    for _ in range(number):
+        encrypt = backend.new_encryptor(key)
+        for _ in range(6):
+            block = encrypt(block)
+
+    return time.perf_counter() - start
+
+
+def get_crypto_backend(name: str = CRYPTO_BACKEND_AUTO):
+    """Get a backend by name. In "auto" mode every available backend is
+    measured and the fastest one is picked.
+
+    :param name: "auto", "pycryptodome" or "cryptography"
+
+    :returns: backend instance
+    """
+    backends = get_available_crypto_backends()
+
+    if name == CRYPTO_BACKEND_AUTO:
+        return min(backends.values(), key=measure_crypto_backend)
+
+    if name not in (CRYPTO_BACKEND_PYCRYPTODOME, CRYPTO_BACKEND_CRYPTOGRAPHY):
+        raise ValueError(f"Invalid crypto backend: {name}")
+
+    if name not in backends:
+        raise ValueError(f"Crypto backend not available: {name}")
+
+    return backends[name]
@@ -0,0 +1,183 @@
+# -*- coding: utf-8 -*-
+"""
+    hss_app.milenage_engine
+    ~~~~~~~~~~~~~~~~~~~~~~~
+
+    This module implements the engine which runs E-UTRAN vectors calculation
+    either inline, within the Diameter handler thread, or on a pool of worker
+    processes, so AIR throughput is not capped by a single core.
+
+    :copyright: (c) 2021-present Henrique Marques Ribeiro.
+    :license: MIT, see LICENSE for more details.
+"""
+
+import atexit
+import multiprocessing
+
+from config import Config
+from milenage import *
+
+ENGINE_MODE_INLINE = "inline"
+ENGINE_MODE_PROCESS = "process"
+
+#: Size of each field packed into the material sent to worker processes
+KEY_SIZE = 16
+OPC_SIZE = 16
+AMF_SIZE = 2
+SQN_SIZE = 6
+PLMN_SIZE = 3
+SQN_STEP_SIZE = 4
+RAND_SIZE = 16
+
+#: Size of each field packed into the vectors sent back by worker processes
+XRES_SIZE = 8
+AUTN_SIZE = 16
+KASME_SIZE = 32
+VECTOR_SIZE = RAND_SIZE + XRES_SIZE + AUTN_SIZE + KASME_SIZE
+
+#: Expanded subscriber keys (K) kept by each worker process. Workers are not
+#: aware of the IMSI, so contexts are keyed by K itself.
+worker_contexts = MilenageContextCache(maxsize=Config.MILENAGE_CONTEXT_CACHE_SIZE)
+
+
+def pack_material(opc: bytes, key: bytes, amf: bytes, sqn: bytes, plmn: bytes, rands: list, sqn_step: int = 0) -> bytes:
+    """Pack the subscriber key material and RANDs into a single bytes object
+    to be sent to a worker process.
+
+    :param opc: 128-bit value derived from OP & K
+    :param key: 128-bit subscriber key
+    :param amf: 16-bit authentication management field
+    :param sqn: 48-bit sequence number of the first vector
+    :param plmn: 24-bit network identifier
+    :param rands: list of 128-bit random challenges, one per vector
+    :param sqn_step: SQN increment between consecutive vectors
+
+    :returns: packed material
+    """
+    step = sqn_step.to_bytes(SQN_STEP_SIZE, byteorder="big")
+    return b"".join([key, opc, amf, sqn, plmn, step, *rands])
+
+
+def unpack_material(material: bytes) -> tuple:
+    """Unpack the material built by pack_material.
+
+    :param material: packed material
+
+    :returns: tuple of (opc, key, amf, sqn, plmn, rands, sqn_step)
+    """
+    view = memoryview(material)
+    offset = 0
+
+    fields = list()
+    for size in (KEY_SIZE, OPC_SIZE, AMF_SIZE, SQN_SIZE, PLMN_SIZE, SQN_STEP_SIZE):
+        fields.append(bytes(view[offset:offset + size]))
+        offset += size
+
+    key, opc, amf, sqn, plmn, step = fields
+    rands = [bytes(view[i:i + RAND_SIZE]) for i in range(offset, len(material), RAND_SIZE)]
+
+    return opc, key, amf, sqn, plmn, rands, int.from_bytes(step, byteorder="big")
+
+
+def pack_vectors(vectors: list) -> bytes:
+    """Pack E-UTRAN vectors into a single bytes object.
+
+    :param vectors: list of Vector namedtuple
+
+    :returns: packed vectors
+    """
+    return b"".join(b"".join(vector) for vector in vectors)
+
+
+def unpack_vectors(data: bytes) -> list:
+    """Unpack the E-UTRAN vectors built by pack_vectors.
+
+    :param data: packed vectors
+
+    :returns: list of Vector namedtuple
+    """
+    vectors = [None] * (len(data) // VECTOR_SIZE)
+
+    for index in range(len(vectors)):
+        offset = index * VECTOR_SIZE
+        rand = data[offset:offset + RAND_SIZE]
+        offset += RAND_SIZE
+        xres = data[offset:offset + XRES_SIZE]
+        offset += XRES_SIZE
+        autn = data[offset:offset + AUTN_SIZE]
+        offset += AUTN_SIZE
+        kasme = data[offset:offset + KASME_SIZE]
+        vectors[index] = Vector(rand, xres, autn, kasme)
+
+    return vectors
+
+
+def calculate_packed_eutran_vectors(material: bytes) -> bytes:
+    """Worker process entrypoint which calculates the E-UTRAN vectors for the
+    packed material.
+
+    :param material: packed material built by pack_material
+
+    :returns: packed vectors
+    """
+    opc, key, amf, sqn, plmn, rands, sqn_step = unpack_material(material)
+    context = worker_contexts.get(key, key)
+    return pack_vectors(calculate_eutran_vectors(opc, context, amf, sqn, plmn, rands=rands, sqn_step=sqn_step))
+
+
+class MilenageEngine:
+    """Runs E-UTRAN vectors calculation inline or on a pool of worker
+    processes. Batches smaller than min_batch_size always run inline, since
+    dispatching them would cost more than calculating them.
+
+    The pool is forked when the engine is created, so it should be created at
+    import time, before any other thread is started.
+
+    :param mode: either "inline" or "process"
+    :param pool_size: number of worker processes
+    :param min_batch_size: smallest batch dispatched to the pool
+    """
+    def __init__(self, mode: str = ENGINE_MODE_INLINE, pool_size: int = None, min_batch_size: int = 2) -> None:
+        if mode not in (ENGINE_MODE_INLINE, ENGINE_MODE_PROCESS):
+            raise ValueError(f"Invalid Milenage engine mode: {mode}")
+
+        self.mode = mode
+        self.pool_size = pool_size or multiprocessing.cpu_count()
+        self.min_batch_size = min_batch_size
+        self.pool = None
+
+        if self.mode == ENGINE_MODE_PROCESS:
+            self.pool = multiprocessing.get_context("fork").Pool(processes=self.pool_size)
+            atexit.register(self.shutdown)
+
+    def calculate_eutran_vectors(self, opc: bytes, key: bytes, amf: bytes, sqn: bytes, plmn: bytes, num_of_vectors: int = 1, sqn_step: int = 0) -> list:
+        """Calculate a batch of E-UTRAN vectors. RANDs are always drawn in the
+        calling process, so worker processes never share random state.
+
+        :param opc: 128-bit value derived from OP & K
+        :param key: 128-bit subscriber key or its MilenageContext
+        :param amf: 16-bit authentication management field
+        :param sqn: 48-bit sequence number of the first vector
+        :param plmn: 24-bit network identifier
+        :param num_of_vectors: number of vectors to be calculated
+        :param sqn_step: SQN increment between consecutive vectors
+
+        :returns: list of Vector namedtuple
+        """
+        rands = generate_rands(num_of_vectors)
+
+        if self.pool is None or num_of_vectors < self.min_batch_size:
+            return calculate_eutran_vectors(opc, key, amf, sqn, plmn, rands=rands, sqn_step=sqn_step)
+
+        if isinstance(key, MilenageContext):
+            key = key.key
+
+        material = pack_material(opc, key, amf, sqn, plmn, rands, sqn_step)
+        return unpack_vectors(self.pool.apply(calculate_packed_eutran_vectors, (material,)))
+
+    def shutdown(self) -> None:
+        """Stop the worker processes, if any."""
+        if self.pool is not None:
+            self.pool.terminate()
+            self.pool.join()
+            self.pool = None
@@ -9,18 +9,34 @@
     :license: MIT, see LICENSE for more details.
 """
 
+import functools
+import threading
+import time
+from collections import namedtuple, OrderedDict
+from contextlib import contextmanager
+
 from config import Config
+from counters import app_counterdb
 
-from sqlalchemy import create_engine, ForeignKey
+from sqlalchemy import cast, column, create_engine, event, ForeignKey, select, text, update, values
 from sqlalchemy import BigInteger, Column, Integer, LargeBinary, String, Boolean
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import backref, relationship, sessionmaker
 
+from write_behind import WriteBehindQueue, WRITE_MODE_GROUP
+
 engine = create_engine(Config.SQL_BASE_URI, echo=True)
 Session = sessionmaker(bind=engine, expire_on_commit=False)
 Base = declarative_base()
 
 
+@event.listens_for(Session, "do_orm_execute")
+def tag_session_writes(orm_execute_state) -> None:
+    #: Textual statements are tagged as well, as they may write
+    if not orm_execute_state.is_select:
+        orm_execute_state.session.info["written"] = True
+
+
 class Subscriber(Base):
     __tablename__ = "subscribers"
     id = Column(BigInteger, primary_key=True)
@@ -109,51 +125,632 @@ class SubscriberMip6s(Base):
 Base.metadata.create_all(engine)
 
 
-def get_eps_subscription_profile(imsi: str) -> Subscriber:
-    with Session.begin() as session:
-        return session.query(
-                                Subscriber
-                            ).filter(
-                                Subscriber.imsi==imsi
-                            ).one_or_none()
+#: Immutable copies of the models above, shared by the handler threads
+#: through SubscriberCache. They expose the same attributes of the models.
+ApnSnapshot = namedtuple("ApnSnapshot", Apn.__table__.columns.keys())
+Mip6Snapshot = namedtuple("Mip6Snapshot", Mip6.__table__.columns.keys())
+SubscriberSnapshot = namedtuple("SubscriberSnapshot", Subscriber.__table__.columns.keys() + ["apns", "mip6s"])
 
 
-def update_mip6_agent_info_eps_subscription_profile(imsi: str, profile: dict) -> None:
-    with Session.begin() as session:
+def create_subscriber_snapshot(subscriber: Subscriber) -> SubscriberSnapshot:
+    """Copy a subscriber, along with its APNs and MIP6s, into an immutable
+    snapshot.
+
+    :param subscriber: Subscriber object with its relationships loaded
+
+    :returns: SubscriberSnapshot namedtuple
+    """
+    apns = tuple(ApnSnapshot(*(getattr(apn, field) for field in ApnSnapshot._fields))
+                 for apn in subscriber.apns)
+    mip6s = tuple(Mip6Snapshot(*(getattr(mip6, field) for field in Mip6Snapshot._fields))
+                  for mip6 in subscriber.mip6s)
+
+    fields = SubscriberSnapshot._fields[:-2]
+    return SubscriberSnapshot(*(getattr(subscriber, field) for field in fields), apns, mip6s)
+
+
+class SubscriberCache:
+    """Bounded LRU of subscriber snapshots keyed by IMSI, which expire after
+    ttl seconds. Every write made by the HSS itself either refreshes or drops
+    the snapshot, while writes made by the provisioning are only seen once the
+    snapshot expires.
+
+    Each write is tagged with a generation, so a snapshot whose query started
+    before a write of the same subscriber is never stored.
+
+    :param maxsize: maximum number of snapshots kept in memory, 0 disables
+                    the cache
+    :param ttl: seconds a snapshot remains valid
+    """
+    def __init__(self, maxsize: int = 0, ttl: float = 30) -> None:
+        self.maxsize = maxsize
+        self.ttl = ttl
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+        self._snapshots = OrderedDict()
+        self._writes = OrderedDict()
+        self._generation = 0
+        self._trimmed_generation = 0
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self) -> bool:
+        return self.maxsize > 0
+
+    @property
+    def generation(self) -> int:
+        return self._generation
+
+    def __len__(self) -> int:
+        return len(self._snapshots)
+
+    def get(self, imsi: str) -> SubscriberSnapshot:
+        """Get the subscriber snapshot, if cached and not expired.
+
+        :param imsi: subscriber IMSI
+
+        :returns: SubscriberSnapshot namedtuple or None
+        """
+        imsi = str(imsi)
+
+        with self._lock:
+            item = self._snapshots.get(imsi)
+
+            if item is None or item[0] < time.monotonic():
+                if item is not None:
+                    del self._snapshots[imsi]
+                self.misses += 1
+                return None
+
+            self._snapshots.move_to_end(imsi)
+            self.hits += 1
+            return item[1]
+
+    def put(self, imsi: str, snapshot: SubscriberSnapshot, generation: int) -> None:
+        """Store the subscriber snapshot, unless the subscriber has been
+        written since its query started.
+
+        :param imsi: subscriber IMSI
+        :param snapshot: SubscriberSnapshot namedtuple
+        :param generation: value of the generation property before the
+                           snapshot has been queried
+        """
+        if not self.enabled:
+            return
+
+        imsi = str(imsi)
+
+        with self._lock:
+            if self._writes.get(imsi, self._trimmed_generation) > generation:
+                return
+
+            self._snapshots[imsi] = (time.monotonic() + self.ttl, snapshot)
+            self._snapshots.move_to_end(imsi)
+
+            while len(self._snapshots) > self.maxsize:
+                self._snapshots.popitem(last=False)
+                self.evictions += 1
+
+    def refresh(self, imsi: str, **fields) -> None:
+        """Apply a write made by the HSS to the subscriber snapshot, if any.
+
+        :param imsi: subscriber IMSI
+        :param fields: subscriber attributes which have been written
+        """
+        imsi = str(imsi)
+
+        with self._lock:
+            self._tag_write(imsi)
+
+            item = self._snapshots.get(imsi)
+            if item is not None:
+                self._snapshots[imsi] = (item[0], item[1]._replace(**fields))
+
+    def invalidate(self, imsi: str) -> None:
+        """Drop the subscriber snapshot, if any.
+
+        :param imsi: subscriber IMSI
+        """
+        imsi = str(imsi)
+
+        with self._lock:
+            self._tag_write(imsi)
+            self._snapshots.pop(imsi, None)
+
+    def clear(self) -> None:
+        """Drop all the snapshots."""
+        with self._lock:
+            self._generation += 1
+            self._trimmed_generation = self._generation
+            self._writes.clear()
+            self._snapshots.clear()
+
+    def _tag_write(self, imsi: str) -> None:
+        self._generation += 1
+        self._writes[imsi] = self._generation
+        self._writes.move_to_end(imsi)
+
+        while len(self._writes) > max(self.maxsize, 1):
+            _, self._trimmed_generation = self._writes.popitem(last=False)
+
+
+class UnitOfWork:
+    """Database work of a Diameter request. While a unit of work is active on
+    a thread, the functions of this module share its session, so the 
+    subscriber is read and written within a single transaction which is 
+    committed once, when the request ends, rather than in a transaction per
+    call.
+
+    Updates of the subscriber cache are deferred until the commit, so other
+    handlers never get uncommitted values, and are dropped on a rollback.
+
+    :param session_factory: sessionmaker of the session, which is opened on 
+                            first use
+    """
+    def __init__(self, session_factory=Session) -> None:
+        self.session_factory = session_factory
+        self.session = None
+
+        self._callbacks = list()
+        self._previous = None
+
+    def get_session(self):
+        """Get the session of the unit of work, opening it if needed.
+
+        :returns: Session object
+        """
+        if self.session is None:
+            self.session = self.session_factory()
+        return self.session
+
+    def on_commit(self, function, *args, **kwargs) -> None:
+        """Call a function once the unit of work is committed.
+
+        :param function: function to be called
+        """
+        self._callbacks.append((function, args, kwargs))
+
+    def commit(self) -> None:
+        """Commit the session, if any has been opened, and call the 
+        functions deferred until the commit. The unit of work remains
+        usable, with a new session opened on next use."""
+        callbacks, self._callbacks = self._callbacks, list()
+
+        if self.session is not None:
+            try:
+                self.session.commit()
+            finally:
+                self.session.close()
+                self.session = None
+
+        for function, args, kwargs in callbacks:
+            function(*args, **kwargs)
+
+    def release(self) -> bool:
+        """Close the session without committing it, if nothing has been
+        written within it, so its connection is not held while waiting on
+        another one. The functions deferred until the commit are kept.
+
+        :returns: whether no session is held anymore
+        """
+        if self.session is None:
+            return True
+
+        if self.session.info.get("written") or self.session.new or \
+           self.session.dirty or self.session.deleted:
+            return False
+
+        self.session.close()
+        self.session = None
+        return True
+
+    def rollback(self) -> None:
+        """Roll the session back, if any has been opened, and drop the 
+        functions deferred until the commit."""
+        self._callbacks = list()
+
+        if self.session is not None:
+            try:
+                self.session.rollback()
+            finally:
+                self.session.close()
+                self.session = None
+
+    def __enter__(self) -> "UnitOfWork":
+        self._previous = getattr(_units_of_work, "current", None)
+        _units_of_work.current = self
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback) -> bool:
+        _units_of_work.current = self._previous
+
+        if exc_type is None:
+            self.commit()
+        else:
+            self.rollback()
+        return False
+
+
+_units_of_work = threading.local()
+
+
+def get_unit_of_work() -> UnitOfWork:
+    """Get the unit of work active on this thread.
+
+    :returns: UnitOfWork object or None
+    """
+    return getattr(_units_of_work, "current", None)
+
+
+@contextmanager
+def begin_session(standalone: bool = False):
+    """Session of the unit of work active on this thread, or otherwise a new
+    one committed on exit.
+
+    :param standalone: whether a new session is used even if a unit of work
+                       is active, e.g. for writes which must outlive a 
+                       rollback of the request
+    """
+    unit_of_work = get_unit_of_work()
+
+    if unit_of_work is None or standalone:
+        with Session.begin() as session:
+            yield session
+    else:
+        yield unit_of_work.get_session()
+
+
+def on_commit(function, *args, **kwargs) -> None:
+    """Call a function once the writes made so far are committed, i.e. when
+    the unit of work active on this thread commits, or right away if there is
+    none.
+
+    :param function: function to be called
+    """
+    unit_of_work = get_unit_of_work()
+
+    if unit_of_work is None:
+        function(*args, **kwargs)
+    else:
+        unit_of_work.on_commit(function, *args, **kwargs)
+
+
+def transactional(route_function):
+    """Decorator which runs a route function within a UnitOfWork, committed 
+    before its answer is returned.
+
+    :param route_function: route function
+    """
+    @functools.wraps(route_function)
+    def wrapper(request):
+        with UnitOfWork():
+            return route_function(request)
+
+    return wrapper
+
+
+#: SQN is stored as 6 bytes, so it is converted to bigint and back in order to
+#: be advanced within the UPDATE itself.
+RESERVE_SQN_STATEMENT = text("UPDATE subscribers "
+                             "SET sqn = decode(lpad(to_hex((('x' || encode(sqn, 'hex'))::bit(48)::bigint + :delta) "
+                             "& 281474976710655), 12, '0'), 'hex') "
+                             "WHERE imsi = :imsi "
+                             "RETURNING sqn")
+
+SQN_MASK = (1 << 48) - 1
+
+#: Kinds of queued subscriber writes, the first item of their keys
+WRITE_MME = "mme"
+WRITE_MIP6 = "mip6"
+
+
+subscriber_cache = SubscriberCache(maxsize=Config.SUBSCRIBER_CACHE_SIZE, ttl=Config.SUBSCRIBER_CACHE_TTL)
+
+
+def get_eps_subscription_profile(imsi: str) -> SubscriberSnapshot:
+    if subscriber_cache.enabled:
+        snapshot = subscriber_cache.get(imsi)
+        if snapshot is not None:
+            return snapshot
+
+    generation = subscriber_cache.generation
+
+    with begin_session() as session:
         subscriber = session.query(
                                 Subscriber
                             ).filter(
                                 Subscriber.imsi==imsi
                             ).one_or_none()
 
-        mip6 = list(filter(lambda mip6: mip6.context_id == profile["context_id"], subscriber.mip6s))
+        if subscriber is None:
+            return None
+
+        snapshot = create_subscriber_snapshot(subscriber)
+
+    on_commit(subscriber_cache.put, imsi, snapshot, generation)
+    return snapshot
+
+
+def create_mme_statement(writes: list, multi_row: bool):
+    """Build the UPDATE of the MME of the subscribers.
+
+    :param writes: list of (imsi, values) tuples
+    :param multi_row: whether all the writes are joined from a VALUES list, 
+                      otherwise a single write is expected
+
+    :returns: UPDATE statement
+    """
+    if not multi_row:
+        (imsi, _values), = writes
+        return update(
+                    Subscriber
+                ).where(
+                    Subscriber.imsi==imsi
+                ).values(
+                    **_values
+                )
+
+    data = values(
+                column("imsi", BigInteger),
+                column("mme_hostname", String),
+                column("mme_realm", String),
+                column("ue_srvcc_support", Boolean),
+                name="mme_writes"
+            ).data([
+                (int(imsi), _values["mme_hostname"], _values["mme_realm"], _values["ue_srvcc_support"])
+                for imsi, _values in writes
+            ])
+
+    return update(
+                Subscriber
+            ).where(
+                Subscriber.imsi==data.c.imsi
+            ).values(
+                mme_hostname=data.c.mme_hostname,
+                mme_realm=data.c.mme_realm,
+                ue_srvcc_support=cast(data.c.ue_srvcc_support, Boolean)
+            )
+
+
+def create_mip6_statement(writes: list, multi_row: bool):
+    """Build the UPDATE of the MIP6 agent info of the subscribers.
+
+    :param writes: list of (imsi, context_id, values) tuples
+    :param multi_row: whether all the writes are joined from a VALUES list, 
+                      otherwise a single write is expected
+
+    :returns: UPDATE statement
+    """
+    if not multi_row:
+        (imsi, context_id, _values), = writes
+        mip6_ids = select(
+                        SubscriberMip6s.mip6_id
+                    ).join(
+                        Subscriber, Subscriber.id==SubscriberMip6s.subscriber_id
+                    ).where(
+                        Subscriber.imsi==imsi
+                    )
+
+        return update(
+                    Mip6
+                ).where(
+                    Mip6.context_id==context_id,
+                    Mip6.id.in_(mip6_ids)
+                ).values(
+                    **_values
+                )
+
+    data = values(
+                column("imsi", BigInteger),
+                column("context_id", Integer),
+                column("destination_host", String),
+                column("destination_realm", String),
+                name="mip6_writes"
+            ).data([
+                (int(imsi), int(context_id), _values["destination_host"], _values["destination_realm"])
+                for imsi, context_id, _values in writes
+            ])
+
+    return update(
+                Mip6
+            ).where(
+                Mip6.context_id==data.c.context_id,
+                Mip6.id==SubscriberMip6s.mip6_id,
+                SubscriberMip6s.subscriber_id==Subscriber.id,
+                Subscriber.imsi==data.c.imsi
+            ).values(
+                destination_host=data.c.destination_host,
+                destination_realm=data.c.destination_realm
+            )
+
+
+def create_subscriber_write_statements(writes: list, dialect: str) -> list:
+    """Build the statements which commit the subscriber writes. On Postgres
+    all the writes of a kind are applied by a single multi-row 
+    UPDATE ... FROM (VALUES ...), other databases get one UPDATE per write.
+
+    :param writes: list of (key, values) tuples, as put into subscriber_writes
+    :param dialect: SQLAlchemy dialect name
+
+    :returns: list of UPDATE statements
+    """
+    mme_writes = list()
+    mip6_writes = list()
+
+    for key, _values in writes:
+        if key[0] == WRITE_MME:
+            mme_writes.append((key[1], _values))
+        elif key[0] == WRITE_MIP6:
+            mip6_writes.append((key[1], key[2], _values))
+        else:
+            raise ValueError(f"Invalid subscriber write: {key[0]}")
+
+    statements = list()
+    for create_statement, _writes in ((create_mme_statement, mme_writes),
+                                      (create_mip6_statement, mip6_writes)):
+        if dialect == "postgresql" and len(_writes) > 1:
+            statements.append(create_statement(_writes, multi_row=True))
+        else:
+            statements.extend(create_statement([write], multi_row=False) for write in _writes)
+
+    return statements
+
+
+def apply_subscriber_writes(writes: list) -> None:
+    """Commit subscriber writes in a single transaction.
+
+    :param writes: list of (key, values) tuples, as put into subscriber_writes
+    """
+    with begin_session() as session:
+        dialect = session.get_bind().dialect.name
+
+        for statement in create_subscriber_write_statements(writes, dialect):
+            session.execute(statement.execution_options(synchronize_session=False))
+
+    #: Snapshots are only updated once the writes are committed, which for
+    #: queued writes happens after the unit of work of their handler
+    for key, values in writes:
+        if key[0] == WRITE_MME:
+            on_commit(subscriber_cache.refresh, key[1], **values)
+
+    #: Snapshots hold their MIP6s, so they are reloaded once committed
+    for imsi in {key[1] for key, _ in writes if key[0] == WRITE_MIP6}:
+        on_commit(subscriber_cache.invalidate, imsi)
+
+
+#: MME and MIP6 updates, either committed within the Diameter handler, 
+#: group-committed along with the ones of concurrent handlers or queued and 
+#: committed in batches by a background thread
+subscriber_writes = WriteBehindQueue(apply_subscriber_writes,
+                                     mode=Config.SUBSCRIBER_WRITE_MODE,
+                                     max_size=Config.SUBSCRIBER_WRITE_MAX_SIZE,
+                                     max_batch_size=Config.SUBSCRIBER_WRITE_MAX_BATCH_SIZE,
+                                     max_delay=Config.SUBSCRIBER_WRITE_MAX_DELAY,
+                                     counters=app_counterdb,
+                                     prefix="subscriber_writes")
+
+
+def put_subscriber_write(key: tuple, values: dict) -> None:
+    """Put a write into subscriber_writes, releasing the connection of the
+    unit of work active on this thread while waiting for a group commit.
+
+    :param key: what the write updates, e.g. ("mme", imsi)
+    :param values: values to be written
+    """
+    unit_of_work = get_unit_of_work()
+
+    if unit_of_work is not None and subscriber_writes.mode == WRITE_MODE_GROUP:
+        unit_of_work.release()
+
+    subscriber_writes.put(key, values)
 
-        if mip6:
-            setattr(mip6[0], "destination_host", profile["destination_host"])
-            setattr(mip6[0], "destination_realm", profile["destination_realm"])
+
+def update_mip6_agent_info_eps_subscription_profile(imsi: str, profile: dict) -> None:
+    put_subscriber_write((WRITE_MIP6, imsi, profile["context_id"]),
+                         {"destination_host": profile["destination_host"],
+                          "destination_realm": profile["destination_realm"]})
 
 
 def update_mme_info_eps_subscription_profile(imsi: str, profile: dict) -> None:
-    with Session.begin() as session:
-        subscriber = session.query(
-                                Subscriber,
-                            ).filter(
-                                Subscriber.imsi==imsi
-                            ).one_or_none()
+    values = {
+        "mme_hostname": profile["mme_hostname"],
+        "mme_realm": profile["mme_realm"],
+        "ue_srvcc_support": profile["ue_srvcc_support"],
+    }
 
-        if subscriber is not None:
-            setattr(subscriber, "mme_hostname", profile["mme_hostname"])
-            setattr(subscriber, "mme_realm", profile["mme_realm"])
-            setattr(subscriber, "ue_srvcc_support", profile["ue_srvcc_support"])
+    put_subscriber_write((WRITE_MME, imsi), values)
 
 
 def update_sqn_info_eps_subscription_profile(imsi: str, profile: dict) -> None:
-    with Session.begin() as session:
-        subscriber = session.query(
-                                Subscriber,
-                            ).filter(
-                                Subscriber.imsi==imsi
-                            ).one_or_none()
-
-        if subscriber is not None:
-            setattr(subscriber, "sqn", profile["sqn"])
\ No newline at end of file
+    with begin_session() as session:
+        session.execute(
+                    update(
+                        Subscriber
+                    ).where(
+                        Subscriber.imsi==imsi
+                    ).values(
+                        sqn=profile["sqn"]
+                    ).execution_options(
+                        synchronize_session=False
+                    ))
+
+    on_commit(subscriber_cache.refresh, imsi, sqn=profile["sqn"])
+
+
+def reserve_sqn_info_eps_subscription_profile(imsi: str, delta: int, standalone: bool = False) -> tuple:
+    """Atomically advance the subscriber SQN, so the range in between is
+    reserved for the caller. On Postgres this is a single UPDATE ... RETURNING
+    round trip, other databases fall back to a locking read.
+
+    :param imsi: subscriber IMSI
+    :param delta: amount the SQN is advanced by
+    :param standalone: whether the reservation is committed before return,
+                       rather than along the unit of work active on this 
+                       thread, e.g. for SQN leases handed out beyond the 
+                       request
+
+    :returns:
+        - sqn - SQN before the reservation, None if the IMSI is unknown
+        - next_sqn - SQN after the reservation, None if the IMSI is unknown
+    """
+    with begin_session(standalone) as session:
+        if session.get_bind().dialect.name == "postgresql":
+            next_sqn = session.execute(RESERVE_SQN_STATEMENT, {"imsi": int(imsi), "delta": delta}).scalar()
+
+        else:
+            subscriber = session.query(
+                                    Subscriber,
+                                ).filter(
+                                    Subscriber.imsi==imsi
+                                ).with_for_update().one_or_none()
+
+            next_sqn = None
+            if subscriber is not None:
+                next_sqn = ((int.from_bytes(subscriber.sqn, byteorder="big") + delta) & SQN_MASK).to_bytes(6, byteorder="big")
+                setattr(subscriber, "sqn", next_sqn)
+
+    if next_sqn is None:
+        return None, None
+
+    next_sqn = bytes(next_sqn)
+    sqn = ((int.from_bytes(next_sqn, byteorder="big") - delta) & SQN_MASK).to_bytes(6, byteorder="big")
+
+    if standalone:
+        subscriber_cache.refresh(imsi, sqn=next_sqn)
+    else:
+        on_commit(subscriber_cache.refresh, imsi, sqn=next_sqn)
+
+    return sqn, next_sqn
+
+
+def advance_sqn_info_eps_subscription_profile(imsi: str, sqn: bytes, next_sqn: bytes) -> bool:
+    """Set the subscriber SQN only if it still holds the expected value.
+
+    :param imsi: subscriber IMSI
+    :param sqn: expected SQN
+    :param next_sqn: SQN to be set
+
+    :returns: whether the SQN has been set
+    """
+    with begin_session() as session:
+        result = session.execute(
+                                update(
+                                    Subscriber
+                                ).where(
+                                    Subscriber.imsi==imsi,
+                                    Subscriber.sqn==sqn
+                                ).values(
+                                    sqn=next_sqn
+                                ).execution_options(
+                                    synchronize_session=False
+                                ))
+
+    if result.rowcount != 1:
+        subscriber_cache.invalidate(imsi)
+        return False
+
+    on_commit(subscriber_cache.refresh, imsi, sqn=next_sqn)
+    return True
@@ -0,0 +1,367 @@
+# -*- coding: utf-8 -*-
+"""
+    hss_app.sqn_store
+    ~~~~~~~~~~~~~~~~~
+
+    This module implements the stores where SQN ranges are reserved from on
+    the AIR path. Either every reservation is an UPDATE on Postgres, or ranges
+    are reserved in Redis out of leases taken from Postgres.
+
+    :copyright: (c) 2021-present Henrique Marques Ribeiro.
+    :license: MIT, see LICENSE for more details.
+"""
+
+import logging
+import threading
+import time
+
+store_logger = logging.getLogger("3gpp_hss")
+
+SQN_STORE_POSTGRES = "postgres"
+SQN_STORE_REDIS = "redis"
+
+SQN_MASK = (1 << 48) - 1
+
+#: Leases taken by a single reservation before it falls back to Postgres,
+#: e.g. once the SQN wraps around
+MAX_LEASE_ATTEMPTS = 3
+
+#: KEYS: SQN, lease limit. ARGV: delta. Returns the SQN after the reservation,
+#: or -1 if there is no lease or it would be exceeded.
+RESERVE_SCRIPT = """
+local limit = redis.call("GET", KEYS[2])
+if not limit then
+    return -1
+end
+
+local sqn = redis.call("INCRBY", KEYS[1], ARGV[1])
+if sqn > tonumber(limit) then
+    redis.call("DECRBY", KEYS[1], ARGV[1])
+    return -1
+end
+
+return sqn
+"""
+
+#: KEYS: SQN, lease limit. ARGV: lease start, lease limit. Leases come from a
+#: monotonic Postgres SQN, so a lease which does not go beyond the current
+#: limit has been superseded by a concurrent one and is discarded.
+EXTEND_SCRIPT = """
+local limit = redis.call("GET", KEYS[2])
+if limit and tonumber(limit) >= tonumber(ARGV[2]) then
+    return 0
+end
+
+redis.call("SET", KEYS[1], ARGV[1])
+redis.call("SET", KEYS[2], ARGV[2])
+return 1
+"""
+
+#: KEYS: SQN, lease limit. ARGV: expected SQN, SQN to be set. Returns 1 if the
+#: SQN has been set.
+ADVANCE_SCRIPT = """
+local limit = redis.call("GET", KEYS[2])
+if not limit or redis.call("GET", KEYS[1]) ~= ARGV[1] then
+    return 0
+end
+
+if tonumber(ARGV[2]) > tonumber(limit) then
+    return 0
+end
+
+redis.call("SET", KEYS[1], ARGV[2])
+return 1
+"""
+
+
+def to_sqn(value: int) -> bytes:
+    return (value & SQN_MASK).to_bytes(6, byteorder="big")
+
+
+def from_sqn(sqn: bytes) -> int:
+    return int.from_bytes(sqn, byteorder="big")
+
+
+class PostgresSqnStore:
+    """Reserves every SQN range with a single UPDATE on Postgres.
+
+    :param reserve: function with the same signature of
+                    models.reserve_sqn_info_eps_subscription_profile
+    :param advance: function with the same signature of
+                    models.advance_sqn_info_eps_subscription_profile
+    :param update: function with the same signature of
+                   models.update_sqn_info_eps_subscription_profile
+    """
+    name = SQN_STORE_POSTGRES
+
+    def __init__(self, reserve, advance, update) -> None:
+        self._reserve = reserve
+        self._advance = advance
+        self._update = update
+
+    def get(self, imsi: str, sqn: bytes) -> bytes:
+        """Get the current SQN of a subscriber.
+
+        :param imsi: subscriber IMSI
+        :param sqn: SQN read from the subscriber profile
+
+        :returns: current 48-bit SQN
+        """
+        return sqn
+
+    def reserve(self, imsi: str, delta: int) -> tuple:
+        """Atomically advance the subscriber SQN, so the range in between is
+        reserved for the caller.
+
+        :param imsi: subscriber IMSI
+        :param delta: amount the SQN is advanced by
+
+        :returns:
+            - sqn - SQN before the reservation, None if the IMSI is unknown
+            - next_sqn - SQN after the reservation, None if the IMSI is unknown
+        """
+        return self._reserve(imsi, delta)
+
+    def advance(self, imsi: str, sqn: bytes, next_sqn: bytes) -> bool:
+        """Set the subscriber SQN only if it still holds the expected value.
+
+        :param imsi: subscriber IMSI
+        :param sqn: expected SQN
+        :param next_sqn: SQN to be set
+
+        :returns: whether the SQN has been set
+        """
+        return self._advance(imsi, sqn, next_sqn)
+
+    def reset(self, imsi: str, sqn: bytes) -> None:
+        """Set the subscriber SQN unconditionally, e.g. after a
+        resynchronisation.
+
+        :param imsi: subscriber IMSI
+        :param sqn: SQN to be set
+        """
+        self._update(imsi, profile={"sqn": sqn})
+
+    def invalidate(self, imsi: str) -> None:
+        """Forget anything kept for a subscriber changed by the provisioning.
+
+        :param imsi: subscriber IMSI
+        """
+        pass
+
+
+class RedisSqnStore(PostgresSqnStore):
+    """Reserves SQN ranges with an atomic Lua INCRBY in Redis.
+
+    Redis only hands out SQNs within a lease, i.e. a range reserved in
+    Postgres beforehand, so the SQN persisted in Postgres is a high-water mark
+    of every SQN ever handed out. Postgres is therefore written once per lease
+    rather than once per AIR, and if Redis loses its keys the next lease starts
+    beyond any SQN already used, at the cost of skipping the rest of the
+    former lease. If Redis is unavailable, ranges are reserved straight from
+    Postgres, which is ahead of Redis as well. The lease left in Redis is then
+    behind Postgres, so its keys are dropped before Redis is used again for
+    that subscriber, and the same goes for keys which could not be dropped
+    on a reset.
+
+    Calls to Redis go through a circuit breaker, so an outage of Redis does
+    not cost every AIR the connect timeout before it falls back to Postgres.
+    Once failure threshold consecutive calls have failed, the breaker opens
+    and Redis is skipped. Every retry interval seconds a single call is let
+    through, which closes the breaker if Redis answers.
+
+    :param client: redis.Redis object
+    :param reserve: function with the same signature of
+                    models.reserve_sqn_info_eps_subscription_profile
+    :param advance: function with the same signature of
+                    models.advance_sqn_info_eps_subscription_profile
+    :param update: function with the same signature of
+                   models.update_sqn_info_eps_subscription_profile
+    :param lease_size: amount of SQN reserved in Postgres at once
+    :param prefix: prefix of the Redis keys
+    :param failure_threshold: consecutive failures which open the breaker, 0
+                              disables the breaker
+    :param retry_interval: seconds between calls let through while the
+                           breaker is open
+    """
+    name = SQN_STORE_REDIS
+
+    def __init__(self, client, reserve, advance, update, lease_size: int, prefix: str = "sqn", failure_threshold: int = 0, retry_interval: float = 5) -> None:
+        super().__init__(reserve, advance, update)
+        self.client = client
+        self.lease_size = lease_size
+        self.prefix = prefix
+        self.failure_threshold = failure_threshold
+        self.retry_interval = retry_interval
+
+        self.num_of_leases = 0
+        self.num_of_failures = 0
+        self.num_of_opens = 0
+        self.is_open = False
+
+        self._consecutive_failures = 0
+        self._retry_at = 0
+        self._stale = set()
+        self._lock = threading.Lock()
+
+        self._reserve_script = client.register_script(RESERVE_SCRIPT)
+        self._extend_script = client.register_script(EXTEND_SCRIPT)
+        self._advance_script = client.register_script(ADVANCE_SCRIPT)
+
+    def get_keys(self, imsi: str) -> list:
+        return [f"{self.prefix}:{imsi}", f"{self.prefix}:{imsi}:limit"]
+
+    def get(self, imsi: str, sqn: bytes) -> bytes:
+        if not self.is_available():
+            return sqn
+
+        try:
+            if self._drop_stale_keys(imsi):
+                value = None
+            else:
+                value = self.client.get(self.get_keys(imsi)[0])
+
+        except Exception as e:
+            store_logger.exception(f"Unable to get SQN from Redis (IMSI: {imsi}): {e}")
+            self._failure()
+            return sqn
+
+        self._success()
+        if value is None:
+            return sqn
+        return to_sqn(int(value))
+
+    def reserve(self, imsi: str, delta: int) -> tuple:
+        if not self.is_available():
+            return self._fallback(imsi, delta)
+
+        keys = self.get_keys(imsi)
+
+        try:
+            self._drop_stale_keys(imsi)
+            next_sqn = self._reserve_script(keys=keys, args=[delta])
+
+            #: Concurrent AIRs may use up a lease right after it is taken, or
+            #: supersede it with their own
+            for _ in range(MAX_LEASE_ATTEMPTS):
+                if next_sqn != -1:
+                    break
+
+                #: Leases are handed out by Redis to other requests as soon as
+                #: they are published, so they are committed on their own
+                #: rather than along the transaction of this request
+                lease_size = max(self.lease_size, delta)
+                lease_start, _ = self._reserve(imsi, lease_size, standalone=True)
+                if lease_start is None:
+                    return None, None
+
+                self.num_of_leases += 1
+                self._extend_script(keys=keys, args=[from_sqn(lease_start), from_sqn(lease_start) + lease_size])
+                next_sqn = self._reserve_script(keys=keys, args=[delta])
+
+            if next_sqn == -1:
+                return self._fallback(imsi, delta)
+
+        except Exception as e:
+            store_logger.exception(f"Unable to reserve SQN from Redis (IMSI: {imsi}): {e}")
+            self._failure()
+            return self._fallback(imsi, delta)
+
+        self._success()
+        return to_sqn(next_sqn - delta), to_sqn(next_sqn)
+
+    def advance(self, imsi: str, sqn: bytes, next_sqn: bytes) -> bool:
+        if not self.is_available():
+            return False
+
+        keys = self.get_keys(imsi)
+
+        try:
+            self._drop_stale_keys(imsi)
+            is_advanced = self._advance_script(keys=keys, args=[from_sqn(sqn), from_sqn(next_sqn)]) == 1
+
+        except Exception as e:
+            store_logger.exception(f"Unable to advance SQN in Redis (IMSI: {imsi}): {e}")
+            self._failure()
+            return False
+
+        self._success()
+        return is_advanced
+
+    def reset(self, imsi: str, sqn: bytes) -> None:
+        #: The next reservation takes a lease beyond the new SQN
+        self._update(imsi, profile={"sqn": sqn})
+        self.invalidate(imsi)
+
+    def invalidate(self, imsi: str) -> None:
+        if not self.is_available():
+            return self._mark_stale(imsi)
+
+        try:
+            self.client.delete(*self.get_keys(imsi))
+
+        except Exception as e:
+            store_logger.exception(f"Unable to invalidate SQN in Redis (IMSI: {imsi}): {e}")
+            self._failure()
+            return self._mark_stale(imsi)
+
+        self._success()
+
+    def is_available(self) -> bool:
+        """Check whether Redis is to be called, i.e. the breaker is closed or
+        a call is let through to find out whether Redis has recovered.
+
+        :returns: whether Redis is to be called
+        """
+        if not self.is_open:
+            return True
+
+        with self._lock:
+            now = time.monotonic()
+            if now < self._retry_at:
+                return False
+
+            self._retry_at = now + self.retry_interval
+            return True
+
+    def _fallback(self, imsi: str, delta: int) -> tuple:
+        self._mark_stale(imsi)
+        return self._reserve(imsi, delta)
+
+    def _mark_stale(self, imsi: str) -> None:
+        with self._lock:
+            self._stale.add(imsi)
+
+    def _drop_stale_keys(self, imsi: str) -> bool:
+        if imsi not in self._stale:
+            return False
+
+        with self._lock:
+            self._stale.discard(imsi)
+
+        try:
+            self.client.delete(*self.get_keys(imsi))
+        except Exception:
+            self._mark_stale(imsi)
+            raise
+        return True
+
+    def _failure(self) -> None:
+        with self._lock:
+            self.num_of_failures += 1
+            self._consecutive_failures += 1
+
+            if self.failure_threshold > 0 and \
+               self._consecutive_failures >= self.failure_threshold:
+                if not self.is_open:
+                    store_logger.debug(f"SQN store circuit breaker opened after "\
+                                       f"{self._consecutive_failures} failures")
+                    self.is_open = True
+                    self.num_of_opens += 1
+                self._retry_at = time.monotonic() + self.retry_interval
+
+    def _success(self) -> None:
+        if self._consecutive_failures or self.is_open:
+            with self._lock:
+                self._consecutive_failures = 0
+                self.is_open = False
@@ -0,0 +1,288 @@
+# -*- coding: utf-8 -*-
+"""
+    hss_app.test_counters
+    ~~~~~~~~~~~~~~~~~~~~~
+
+    This module contains the counters unittests. Redis is replaced by an
+    in-memory pipeline.
+
+    :copyright: (c) 2021 Henrique Marques Ribeiro.
+    :license: MIT, see LICENSE for more details.
+"""
+
+import threading
+import unittest
+
+from counters import *
+
+
+class FakePipeline:
+    def __init__(self, counters):
+        self.counters = counters
+        self.commands = list()
+
+    def incrby(self, name, amount):
+        self.commands.append(("INCRBY", name, amount))
+
+    def set(self, name, value):
+        self.commands.append(("SET", name, value))
+
+    def execute(self):
+        if not self.counters.available:
+            raise ConnectionError("Redis unavailable")
+
+        for command in self.commands:
+            self.counters.execute_command(*command)
+        self.counters.num_of_executes += 1
+        self.counters.event.set()
+
+
+class FakeCounterDB(CounterDB):
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.data = dict()
+        self.available = True
+        self.num_of_executes = 0
+        self.num_of_commands = 0
+        self.event = threading.Event()
+
+    def pipeline(self, transaction=True, shard_hint=None):
+        return FakePipeline(self)
+
+    def execute_command(self, *args, **options):
+        self.num_of_commands += 1
+        if not self.available:
+            raise ConnectionError("Redis unavailable")
+
+        if args[0] == "PING":
+            return True
+
+        if args[0] == "SET":
+            self.data[args[1]] = args[2]
+            return True
+
+        name, amount = args[1:]
+        self.data[name] = self.data.get(name, 0) + amount
+        return self.data[name]
+
+
+class TestCounterDB(unittest.TestCase):
+    def create_counters(self, **kwargs):
+        counters = FakeCounterDB(**kwargs)
+        self.addCleanup(counters.stop)
+        return counters
+
+    def test__batching__pending(self):
+        counters = self.create_counters(flush_interval=60)
+        counters.incr("air:num_requests")
+        counters.incr("air:num_requests")
+        counters.incr("air:num_answers:success")
+        counters.decr("air:num_answers:success")
+
+        self.assertEqual(counters.pending, {"air:num_requests": 2, "air:num_answers:success": 0})
+        self.assertEqual(counters.data, dict())
+
+    def test__batching__flush(self):
+        counters = self.create_counters(flush_interval=60)
+        for _ in range(3):
+            counters.incr("ulr:num_requests")
+        counters.incr("ulr:num_answers:success", 2)
+
+        self.assertTrue(counters.flush())
+
+        self.assertEqual(counters.data, {"ulr:num_requests": 3, "ulr:num_answers:success": 2})
+        self.assertEqual(counters.pending, dict())
+        self.assertEqual(counters.num_of_executes, 1)
+        self.assertEqual(counters.num_of_flushes, 1)
+
+    def test__batching__flush_nothing_pending(self):
+        counters = self.create_counters(flush_interval=60)
+        counters.incr("nor:num_requests")
+        counters.decr("nor:num_requests")
+
+        self.assertTrue(counters.flush())
+        self.assertEqual(counters.num_of_executes, 0)
+
+    def test__batching__failure(self):
+        counters = self.create_counters(flush_interval=60)
+        counters.incr("pur:num_requests")
+        counters.available = False
+
+        self.assertFalse(counters.flush())
+        self.assertEqual(counters.num_of_failures, 1)
+
+        #: Deltas are kept for the next flush
+        counters.incr("pur:num_requests")
+        self.assertEqual(counters.pending, {"pur:num_requests": 2})
+
+        counters.available = True
+        self.assertTrue(counters.flush())
+        self.assertEqual(counters.data, {"pur:num_requests": 2})
+
+    def test__batching__background_flush(self):
+        counters = self.create_counters(flush_interval=0.01)
+        counters.start()
+        counters.incr("air:num_requests")
+
+        self.assertTrue(counters.event.wait(2))
+        self.assertEqual(counters.data, {"air:num_requests": 1})
+
+    def test__batching__stop(self):
+        counters = self.create_counters(flush_interval=60)
+        counters.start()
+        counters.incr("air:num_requests")
+        counters.stop()
+
+        self.assertEqual(counters.data, {"air:num_requests": 1})
+        self.assertFalse(counters.enabled)
+
+    def test__batching__gauge(self):
+        counters = self.create_counters(flush_interval=60)
+        counters.gauge("air:latency:p99", 1000)
+        counters.gauge("air:latency:p99", 2000)
+        counters.incr("air:num_requests")
+
+        self.assertEqual(counters.data, dict())
+        self.assertTrue(counters.flush())
+        self.assertEqual(counters.data, {"air:num_requests": 1, "air:latency:p99": 2000})
+
+    def test__batching__gauge_failure(self):
+        counters = self.create_counters(flush_interval=60)
+        counters.gauge("air:latency:p99", 1000)
+        counters.available = False
+
+        self.assertFalse(counters.flush())
+
+        #: A gauge set meanwhile is newer than the failed one
+        counters.gauge("air:latency:p99", 2000)
+        counters.available = True
+        counters.flush()
+
+        self.assertEqual(counters.data, {"air:latency:p99": 2000})
+
+    def test__disabled(self):
+        counters = self.create_counters()
+        counters.start()
+        counters.incr("air:num_requests")
+        counters.decr("air:num_requests", 3)
+
+        self.assertFalse(counters.enabled)
+        self.assertIsNone(counters._thread)
+        self.assertEqual(counters.data, {"air:num_requests": -2})
+
+        counters.gauge("air:latency:p99", 1000)
+        self.assertEqual(counters.data["air:latency:p99"], 1000)
+
+    def test__disabled__redis_unavailable(self):
+        counters = CounterDB(host="127.0.0.1", port=1, socket_connect_timeout=0.1)
+
+        self.assertIsNone(counters.incr("air:num_requests"))
+        self.assertIsNone(counters.get("air:num_requests"))
+        self.assertEqual(counters.pending, {"air:num_requests": 1})
+
+
+class TestCounterDBCircuitBreaker(unittest.TestCase):
+    def create_counters(self, **kwargs):
+        counters = FakeCounterDB(failure_threshold=3, **kwargs)
+        self.addCleanup(counters.stop)
+        return counters
+
+    def test__open(self):
+        counters = self.create_counters(probe_interval=60)
+        counters.start()
+        counters.available = False
+
+        for _ in range(3):
+            counters.incr("air:num_requests")
+
+        self.assertTrue(counters.is_open)
+        self.assertEqual(counters.num_of_opens, 1)
+        self.assertEqual(counters.num_of_commands, 3)
+
+        #: Redis is no longer called once the breaker is open
+        counters.incr("air:num_requests")
+        self.assertEqual(counters.num_of_commands, 3)
+        self.assertEqual(counters.pending, {"air:num_requests": 4})
+
+    def test__consecutive_failures(self):
+        counters = self.create_counters(probe_interval=60)
+        counters.start()
+
+        for available in (False, False, True, False, False):
+            counters.available = available
+            counters.incr("air:num_requests")
+
+        self.assertFalse(counters.is_open)
+        self.assertEqual(counters.num_of_failures, 4)
+
+    def test__not_started(self):
+        counters = self.create_counters()
+        counters.available = False
+
+        for _ in range(5):
+            counters.incr("air:num_requests")
+
+        self.assertFalse(counters.is_open)
+
+    def test__probe(self):
+        counters = self.create_counters(probe_interval=60)
+        counters.start()
+        counters.available = False
+
+        for _ in range(5):
+            counters.incr("ulr:num_requests")
+
+        self.assertFalse(counters.probe())
+        self.assertTrue(counters.is_open)
+
+        counters.available = True
+        self.assertTrue(counters.probe())
+
+        self.assertFalse(counters.is_open)
+        self.assertEqual(counters.data, {"ulr:num_requests": 5})
+        self.assertEqual(counters.pending, dict())
+
+    def test__background_probe(self):
+        counters = self.create_counters(probe_interval=0.01)
+        counters.start()
+        counters.available = False
+
+        for _ in range(3):
+            counters.incr("nor:num_requests")
+
+        counters.available = True
+
+        self.assertTrue(counters.event.wait(2))
+        counters.stop()
+
+        self.assertFalse(counters.is_open)
+        self.assertEqual(counters.data, {"nor:num_requests": 3})
+
+    def test__background_flush_closed(self):
+        counters = self.create_counters(probe_interval=0.01)
+        counters.start()
+        counters.available = False
+        counters.incr("pur:num_requests")
+        counters.available = True
+
+        #: An increment which failed below the threshold is not lost
+        self.assertTrue(counters.event.wait(2))
+        self.assertEqual(counters.data, {"pur:num_requests": 1})
+
+    def test__batching(self):
+        counters = self.create_counters(flush_interval=60)
+        counters.start()
+        counters.available = False
+
+        for _ in range(3):
+            counters.incr("air:num_requests")
+            counters.flush()
+
+        #: Increments never reach Redis on the request path
+        self.assertTrue(counters.is_open)
+        self.assertEqual(counters.num_of_commands, 0)
+        self.assertEqual(counters.pending, {"air:num_requests": 3})
+
+
+if __name__ == "__main__":
+    unittest.main()
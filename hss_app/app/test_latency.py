@@ -0,0 +1,222 @@
+# -*- coding: utf-8 -*-
+"""
+    hss_app.test_latency
+    ~~~~~~~~~~~~~~~~~~~~
+
+    This module contains the latency histograms unittests.
+
+    :copyright: (c) 2021 Henrique Marques Ribeiro.
+    :license: MIT, see LICENSE for more details.
+"""
+
+import unittest
+from collections import namedtuple
+
+from latency import *
+
+
+class FakeCounters:
+    def __init__(self):
+        self.gauges = dict()
+
+    def gauge(self, name, value):
+        self.gauges[name] = value
+
+
+class FakeAnswer:
+    def __init__(self, result_code=None, experimental_result_code=None):
+        self.avps = dict()
+
+        if result_code is not None:
+            self.result_code_avp = namedtuple("Avp", ["data"])(result_code.to_bytes(4, byteorder="big"))
+            self.avps["result_code_avp"] = self.result_code_avp
+
+        if experimental_result_code is not None:
+            avp = namedtuple("Avp", ["data"])(experimental_result_code.to_bytes(4, byteorder="big"))
+            self.experimental_result_avp = namedtuple("Avp", ["experimental_result_code_avp"])(avp)
+            self.avps["experimental_result_avp"] = self.experimental_result_avp
+
+    def has_avp(self, avp_key):
+        return avp_key in self.avps
+
+
+class TestBuckets(unittest.TestCase):
+    def test__exact_below_sub_buckets(self):
+        for value in range(2 * LATENCY_SUB_BUCKETS):
+            self.assertEqual(get_bucket_value(get_bucket_index(value)), value)
+
+    def test__bucket_bounds(self):
+        for value in list(range(10000)) + [123456, 999999, LATENCY_MAX_VALUE]:
+            index = get_bucket_index(value)
+
+            self.assertLessEqual(value, get_bucket_value(index))
+            if index > 0:
+                self.assertLess(get_bucket_value(index - 1), value)
+
+    def test__relative_error(self):
+        for value in (100, 1000, 12345, 1000000, 30000000):
+            self.assertLessEqual(get_bucket_value(get_bucket_index(value)) - value, value / LATENCY_SUB_BUCKETS)
+
+
+class TestLatencyHistogram(unittest.TestCase):
+    def test__percentile(self):
+        histogram = LatencyHistogram()
+        for value in range(1, 101):
+            histogram.record(value * 1000)
+
+        self.assertEqual(histogram.total, 100)
+        self.assertAlmostEqual(histogram.percentile(50), 50000, delta=50000 / LATENCY_SUB_BUCKETS)
+        self.assertAlmostEqual(histogram.percentile(99), 99000, delta=99000 / LATENCY_SUB_BUCKETS)
+        self.assertGreaterEqual(histogram.percentile(99), 99000)
+
+    def test__percentile__empty(self):
+        self.assertEqual(LatencyHistogram().percentile(99), 0)
+
+    def test__percentile__above_max_value(self):
+        histogram = LatencyHistogram()
+        histogram.record(10 * LATENCY_MAX_VALUE)
+
+        self.assertEqual(histogram.percentile(50), get_bucket_value(LATENCY_NUM_OF_BUCKETS - 1))
+
+    def test__merge(self):
+        histogram1 = LatencyHistogram()
+        histogram2 = LatencyHistogram()
+        for _ in range(99):
+            histogram1.record(1000)
+        histogram2.record(500000)
+
+        histogram1.merge(histogram2)
+
+        self.assertEqual(histogram1.total, 100)
+        self.assertEqual(histogram1.percentile(99), get_bucket_value(get_bucket_index(1000)))
+        self.assertEqual(histogram1.percentile(100), get_bucket_value(get_bucket_index(500000)))
+
+
+class TestGetResultCode(unittest.TestCase):
+    def test__result_code(self):
+        self.assertEqual(get_result_code(FakeAnswer(result_code=2001)), 2001)
+
+    def test__experimental_result_code(self):
+        self.assertEqual(get_result_code(FakeAnswer(experimental_result_code=5001)), 5001)
+
+    def test__none(self):
+        self.assertEqual(get_result_code(FakeAnswer()), 0)
+
+
+class TestLatencyRecorder(unittest.TestCase):
+    def setUp(self):
+        self.counters = FakeCounters()
+        self.recorder = LatencyRecorder(self.counters, interval=60, num_of_intervals=2)
+
+    def test__rotate(self):
+        self.recorder.record("air", 2001, 0.001)
+        self.recorder.record("air", 5001, 0.1)
+        self.recorder.rotate()
+
+        self.assertEqual(self.counters.gauges["air:latency:2001:p99"], get_bucket_value(get_bucket_index(1000)))
+        self.assertEqual(self.counters.gauges["air:latency:5001:p50"], get_bucket_value(get_bucket_index(100000)))
+        self.assertEqual(self.counters.gauges["air:latency:p50"], get_bucket_value(get_bucket_index(1000)))
+        self.assertEqual(self.counters.gauges["air:latency:p99"], get_bucket_value(get_bucket_index(100000)))
+        self.assertEqual(len(self.counters.gauges), 3 * len(LATENCY_PERCENTILES))
+
+    def test__window(self):
+        self.recorder.record("ulr", 2001, 0.1)
+        self.recorder.rotate()
+        self.recorder.record("ulr", 2001, 0.001)
+        self.recorder.rotate()
+
+        self.assertEqual(self.counters.gauges["ulr:latency:p99"], get_bucket_value(get_bucket_index(100000)))
+
+        #: The slow answer leaves the window
+        self.recorder.record("ulr", 2001, 0.001)
+        self.recorder.rotate()
+
+        self.assertEqual(self.counters.gauges["ulr:latency:p99"], get_bucket_value(get_bucket_index(1000)))
+
+    def test__window__no_answers(self):
+        self.recorder.record("nor", 2001, 0.001)
+        for _ in range(3):
+            self.recorder.rotate()
+
+        self.assertEqual(self.counters.gauges["nor:latency:p99"], 0)
+        self.assertEqual(self.counters.gauges["nor:latency:2001:p99"], 0)
+
+    def test__get_histograms(self):
+        self.recorder.record("pur", 2001, 0.001)
+        self.recorder.rotate()
+        self.recorder.record("pur", 2001, 0.001)
+
+        self.assertEqual(self.recorder.get_histograms()[("pur", 2001)].total, 2)
+
+    def test__timed(self):
+        @self.recorder.timed("air")
+        def air(request):
+            return FakeAnswer(result_code=2001)
+
+        self.assertEqual(air.__name__, "air")
+        air(None)
+
+        self.assertEqual(self.recorder.get_histograms()[("air", 2001)].total, 1)
+
+    def test__timed__exception(self):
+        @self.recorder.timed("air")
+        def air(request):
+            raise RuntimeError("Database unavailable")
+
+        with self.assertRaises(RuntimeError):
+            air(None)
+
+        self.assertEqual(self.recorder.get_histograms()[("air", UNABLE_TO_COMPLY)].total, 1)
+
+    def test__spans(self):
+        @self.recorder.timed("air")
+        def air(request):
+            spans = self.recorder.spans()
+            with spans.stage("avp_extraction"):
+                pass
+            with spans.stage("milenage"):
+                pass
+            with spans.stage("avp_extraction"):
+                pass
+            return FakeAnswer(result_code=2001)
+
+        air(None)
+        air(None)
+
+        histograms = self.recorder.get_stage_histograms()
+        self.assertEqual(set(histograms), {("air", "avp_extraction"), ("air", "milenage")})
+
+        #: A stage timed twice within a request is recorded once
+        self.assertEqual(histograms[("air", "avp_extraction")].total, 2)
+
+    def test__spans__exception(self):
+        @self.recorder.timed("ulr")
+        def ulr(request):
+            with self.recorder.spans().stage("subscriber_fetch"):
+                raise RuntimeError("Database unavailable")
+
+        with self.assertRaises(RuntimeError):
+            ulr(None)
+
+        self.assertEqual(self.recorder.get_stage_histograms()[("ulr", "subscriber_fetch")].total, 1)
+
+    def test__spans__not_timed(self):
+        with self.recorder.spans().stage("db_write"):
+            pass
+
+        self.assertEqual(self.recorder.get_stage_histograms(), dict())
+
+    def test__spans__rotate(self):
+        self.recorder.record("nor", 2001, 0.002, {"db_write": 0.001})
+        self.recorder.rotate()
+
+        self.assertEqual(self.counters.gauges["nor:stage:db_write:p99"], get_bucket_value(get_bucket_index(1000)))
+
+        for _ in range(2):
+            self.recorder.rotate()
+
+        self.assertEqual(self.counters.gauges["nor:stage:db_write:p99"], 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -9,12 +9,113 @@
     :license: MIT, see LICENSE for more details.
 """
 
+import threading
 import unittest
 
+import milenage
 from milenage import *
 from utils import *
 
 
+class TestPrimitives(unittest.TestCase):
+    def test__xor(self):
+        bytes1 = bytes.fromhex("23553cbe9637a89d218ae64dae47bf35")
+        bytes2 = bytes.fromhex("cd63cb71954a9f4e48a5994e37a02baf")
+
+        self.assertEqual(xor(bytes1, bytes2).hex(), "ee36f7cf037d37d3692f7f0399e7949a")
+        self.assertEqual(xor(bytes.fromhex("00ff"), bytes.fromhex("0f0f")).hex(), "0ff0")
+
+    def test__xor__different_length(self):
+        with self.assertRaises(ValueError) as cm:
+            xor(bytes.fromhex("00ff"), bytes.fromhex("0f"))
+
+        self.assertEqual(cm.exception.args[0], "Input values must have same length")
+
+    def test__rot(self):
+        data = bytes.fromhex("000102030405060708090a0b0c0d0e0f")
+
+        self.assertEqual(rot(data, R2).hex(), "000102030405060708090a0b0c0d0e0f")
+        self.assertEqual(rot(data, R3).hex(), "0405060708090a0b0c0d0e0f00010203")
+        self.assertEqual(rot(data, R5).hex(), "0c0d0e0f000102030405060708090a0b")
+
+    def test__rot128(self):
+        data = bytes.fromhex("000102030405060708090a0b0c0d0e0f")
+        value = int.from_bytes(data, byteorder="big")
+
+        for r in (R1, R2, R3, R4, R5):
+            rotated = rot128(value, 8 * r).to_bytes(16, byteorder="big")
+            self.assertEqual(rotated, rot(data, r))
+
+
+class TestRandProvider(unittest.TestCase):
+    def test__deterministic(self):
+        rands1 = RandProvider(seed=7).get_rands(5)
+        rands2 = RandProvider(seed=7).get_rands(5)
+
+        self.assertEqual(rands1, rands2)
+        self.assertNotEqual(rands1, RandProvider(seed=8).get_rands(5))
+
+    def test__rand_size(self):
+        provider = RandProvider()
+
+        self.assertEqual(len(provider.get_rand()), 16)
+        self.assertTrue(all(len(rand) == 16 for rand in provider.get_rands(10)))
+
+    def test__rand_type(self):
+        provider = RandProvider(buffer_size=64)
+
+        self.assertIsInstance(provider.get_rand(), bytes)
+        self.assertTrue(all(isinstance(rand, bytes) for rand in provider.get_rands(10)))
+
+    def test__refill(self):
+        provider = RandProvider(buffer_size=64, seed=7)
+        reference = RandProvider(buffer_size=64, seed=7)
+
+        rands = provider.get_rands(3) + provider.get_rands(3)
+        self.assertEqual(rands[:3], reference.get_rands(3))
+
+        reference.get_rands(1)
+        self.assertEqual(rands[3:], reference.get_rands(3))
+
+    def test__larger_than_buffer(self):
+        provider = RandProvider(buffer_size=64)
+
+        rands = provider.get_rands(10)
+
+        self.assertEqual(len(rands), 10)
+        self.assertEqual(len({bytes(rand) for rand in rands}), 10)
+
+    def test__unique_across_threads(self):
+        provider = RandProvider(buffer_size=256)
+        results = list()
+
+        def worker():
+            rands = list()
+            for _ in range(200):
+                rands.extend(bytes(rand) for rand in provider.get_rands(3))
+            results.append(rands)
+
+        threads = [threading.Thread(target=worker) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        rands = [rand for rands in results for rand in rands]
+        self.assertEqual(len(rands), 4 * 200 * 3)
+        self.assertEqual(len(set(rands)), len(rands))
+
+    def test__generate_rands_uses_provider(self):
+        rand_provider_ = milenage.rand_provider
+        self.addCleanup(setattr, milenage, "rand_provider", rand_provider_)
+
+        milenage.rand_provider = RandProvider(seed=7)
+        rands = generate_rands(4)
+
+        self.assertEqual(rands, RandProvider(seed=7).get_rands(4))
+        self.assertEqual(generate_rands(0), list())
+
+
 class TestMilenage(unittest.TestCase):
     def test__test_set_0(self):
         rand = bytes.fromhex("000000000000000000000000000008a7")
@@ -189,6 +290,42 @@ class TestMilenage(unittest.TestCase):
         self.assertEqual(f5_star.hex(), "dc6dd01e8f15")                    # f5*
 
 
+class TestMilenageAll(unittest.TestCase):
+    def test__3gpp_35208_v5_0_0__test_set_1(self):
+        rand = bytes.fromhex("23553cbe9637a89d218ae64dae47bf35")
+        opc = bytes.fromhex("cd63cb71954a9f4e48a5994e37a02baf")
+        key = bytes.fromhex("465b5ce8b199b49faa5f0a2ee238a6bc")
+        amf = bytes.fromhex("b9b9")
+        sqn = bytes.fromhex("ff9bb4d0b607")
+
+        mac_a, mac_s, xres, ak, ck, ik, f5_star = milenage_all(key, opc, rand, sqn, amf)
+
+        self.assertEqual(mac_a.hex(), "4a9ffac354dfafb3")                  # f1
+        self.assertEqual(mac_s.hex(), "01cfaf9ec4e871e9")                  # f1*
+        self.assertEqual(xres.hex(), "a54211d5e3ba50bf")                   # f2
+        self.assertEqual(ck.hex(), "b40ba9a3c58b2a05bbf0d987b21bf8cb")     # f3
+        self.assertEqual(ik.hex(), "f769bcd751044604127672711c6d3441")     # f4
+        self.assertEqual(ak.hex(), "aa689c648370")                         # f5
+        self.assertEqual(f5_star.hex(), "451e8beca43b")                    # f5*
+
+    def test__3gpp_35208_v5_0_0__section_4_3_4__test_set_4(self):
+        rand = bytes.fromhex("ce83dbc54ac0274a157c17f80d017bd6")
+        opc = bytes.fromhex("a64a507ae1a2a98bb88eb4210135dc87")
+        key = bytes.fromhex("9e5944aea94b81165c82fbf9f32db751")
+        amf = bytes.fromhex("9e09")
+        sqn = bytes.fromhex("0b604a81eca8")
+
+        output = milenage_all(MilenageContext(key), opc, rand, sqn, amf)
+
+        self.assertEqual(output.mac_a.hex(), "74a58220cba84c49")                  # f1
+        self.assertEqual(output.mac_s.hex(), "ac2cc74a96871837")                  # f1*
+        self.assertEqual(output.res.hex(), "f365cd683cd92e96")                    # f2
+        self.assertEqual(output.ck.hex(), "e203edb3971574f5a94b0d61b816345d")     # f3
+        self.assertEqual(output.ik.hex(), "0c4524adeac041c4dd830d20854fc46b")     # f4
+        self.assertEqual(output.ak.hex(), "f0b9c08ad02e")                         # f5
+        self.assertEqual(output.ak_s.hex(), "6085a86c6f63")                       # f5*
+
+
 class TestGenerateEutranVector(unittest.TestCase):
     def test__test_set_0(self):
         rand = bytes.fromhex("000000000000000000000000000008a7")
@@ -289,5 +426,179 @@ class TestGenerateEutranVector(unittest.TestCase):
         self.assertEqual(kasme.hex(), "8cd327e3d1eba71cbc7b3e84a7dbfc88038ccd1adb530415d96d9201056a682c")
 
 
+class TestMilenageContext(unittest.TestCase):
+    def test__3gpp_35208_v5_0_0__test_set_1(self):
+        rand = bytes.fromhex("23553cbe9637a89d218ae64dae47bf35")
+        opc = bytes.fromhex("cd63cb71954a9f4e48a5994e37a02baf")
+        key = bytes.fromhex("465b5ce8b199b49faa5f0a2ee238a6bc")
+        amf = bytes.fromhex("b9b9")
+        sqn = bytes.fromhex("ff9bb4d0b607")
+
+        context = MilenageContext(key)
+
+        mac_a, mac_s= f1_and_f1_s(context, rand, opc, sqn, amf)
+        xres, ak = f2_and_f5(context, rand, opc)
+        ck = f3(context, rand, opc)
+        ik = f4(context, rand, opc)
+        f5_star = f5_s(context, rand, opc)
+
+        self.assertEqual(mac_a.hex(), "4a9ffac354dfafb3")                  # f1
+        self.assertEqual(mac_s.hex(), "01cfaf9ec4e871e9")                  # f1*
+        self.assertEqual(xres.hex(), "a54211d5e3ba50bf")                   # f2
+        self.assertEqual(ck.hex(), "b40ba9a3c58b2a05bbf0d987b21bf8cb")     # f3
+        self.assertEqual(ik.hex(), "f769bcd751044604127672711c6d3441")     # f4
+        self.assertEqual(ak.hex(), "aa689c648370")                         # f5
+        self.assertEqual(f5_star.hex(), "451e8beca43b")                    # f5*
+
+    def test__cipher_with_iv(self):
+        key = bytes.fromhex("465b5ce8b199b49faa5f0a2ee238a6bc")
+        data = bytes.fromhex("23553cbe9637a89d218ae64dae47bf35")
+        iv = bytes.fromhex("000000000000000000000000000000ff")
+
+        self.assertEqual(cipher(MilenageContext(key), data, iv), cipher(key, data, iv))
+
+
+class TestMilenageContextCache(unittest.TestCase):
+    def test__reuse_context(self):
+        key = bytes.fromhex("465b5ce8b199b49faa5f0a2ee238a6bc")
+        contexts = MilenageContextCache(maxsize=2)
+
+        context = contexts.get("999000000000001", key)
+
+        self.assertIs(contexts.get("999000000000001", key), context)
+        self.assertEqual(len(contexts), 1)
+
+    def test__key_change(self):
+        key1 = bytes.fromhex("465b5ce8b199b49faa5f0a2ee238a6bc")
+        key2 = bytes.fromhex("fec86ba6eb707ed08905757b1bb44b8f")
+        contexts = MilenageContextCache(maxsize=2)
+
+        context1 = contexts.get("999000000000001", key1)
+        context2 = contexts.get("999000000000001", key2)
+
+        self.assertIsNot(context1, context2)
+        self.assertEqual(context2.key, key2)
+        self.assertEqual(len(contexts), 1)
+
+    def test__evict_least_recently_used(self):
+        key = bytes.fromhex("465b5ce8b199b49faa5f0a2ee238a6bc")
+        contexts = MilenageContextCache(maxsize=2)
+
+        context1 = contexts.get("999000000000001", key)
+        context2 = contexts.get("999000000000002", key)
+        contexts.get("999000000000001", key)
+        contexts.get("999000000000003", key)
+
+        self.assertEqual(len(contexts), 2)
+        self.assertIs(contexts.get("999000000000001", key), context1)
+        self.assertIsNot(contexts.get("999000000000002", key), context2)
+
+    def test__invalidate(self):
+        key = bytes.fromhex("465b5ce8b199b49faa5f0a2ee238a6bc")
+        contexts = MilenageContextCache(maxsize=2)
+
+        context = contexts.get("999000000000001", key)
+        contexts.invalidate("999000000000001")
+
+        self.assertEqual(len(contexts), 0)
+        self.assertIsNot(contexts.get("999000000000001", key), context)
+
+
+class TestGenerateEutranVectors(unittest.TestCase):
+    def test__3gpp_35208_v5_0_0__test_set_1(self):
+        rand = bytes.fromhex("23553cbe9637a89d218ae64dae47bf35")
+        opc = bytes.fromhex("cd63cb71954a9f4e48a5994e37a02baf")
+        key = bytes.fromhex("465b5ce8b199b49faa5f0a2ee238a6bc")
+        amf = bytes.fromhex("b9b9")
+        sqn = bytes.fromhex("ff9bb4d0b607")
+        plmn = bytes.fromhex("27f450")
+
+        vectors = calculate_eutran_vectors(opc, key, amf, sqn, plmn, rands=[rand, rand])
+
+        self.assertEqual(len(vectors), 2)
+
+        for _rand, xres, autn, kasme in vectors:
+            self.assertEqual(_rand, rand)
+            self.assertEqual(xres.hex(), "a54211d5e3ba50bf")
+            self.assertEqual(autn.hex(), "55f328b43577b9b94a9ffac354dfafb3")
+            self.assertEqual(kasme.hex(), "00c73bac435945a7c5cf3565c0d3c64375416b255f0bd65d74f40e60c90a280a")
+
+    def test__num_of_vectors(self):
+        opc = bytes.fromhex("cd63cb71954a9f4e48a5994e37a02baf")
+        key = bytes.fromhex("465b5ce8b199b49faa5f0a2ee238a6bc")
+        amf = bytes.fromhex("b9b9")
+        sqn = bytes.fromhex("ff9bb4d0b607")
+        plmn = bytes.fromhex("27f450")
+
+        vectors = calculate_eutran_vectors(opc, key, amf, sqn, plmn, num_of_vectors=4)
+
+        self.assertEqual(len(vectors), 4)
+        self.assertEqual(len({vector.rand for vector in vectors}), 4)
+
+        for vector in vectors:
+            self.assertEqual(len(vector.rand), 16)
+            self.assertEqual(vector, calculate_eutran_vector(opc, key, amf, sqn, plmn, vector.rand))
+
+    def test__sqn_step(self):
+        opc = bytes.fromhex("cd63cb71954a9f4e48a5994e37a02baf")
+        key = bytes.fromhex("465b5ce8b199b49faa5f0a2ee238a6bc")
+        amf = bytes.fromhex("b9b9")
+        sqn = bytes.fromhex("ffffffffffe0")
+        plmn = bytes.fromhex("27f450")
+
+        vectors = calculate_eutran_vectors(opc, key, amf, sqn, plmn, num_of_vectors=3, sqn_step=32)
+
+        for vector, _sqn in zip(vectors, ("ffffffffffe0", "000000000000", "000000000020")):
+            self.assertEqual(vector, calculate_eutran_vector(opc, key, amf, bytes.fromhex(_sqn), plmn, vector.rand))
+
+    def test__generate_rands(self):
+        rands = generate_rands(3)
+
+        self.assertEqual(len(rands), 3)
+        for rand in rands:
+            self.assertEqual(len(rand), 16)
+
+        self.assertEqual(generate_rands(0), [])
+
+
+class TestResyncData(unittest.TestCase):
+    def create_auts(self, key, opc, rand, sqn_ms):
+        ak_s = f5_s(key, rand, opc)
+        _, mac_s = f1_and_f1_s(key, rand, opc, sqn_ms, AMF_RESYNC_VALUE)
+        return xor(sqn_ms, ak_s) + mac_s
+
+    def test__valid_mac_s(self):
+        rand = bytes.fromhex("23553cbe9637a89d218ae64dae47bf35")
+        opc = bytes.fromhex("cd63cb71954a9f4e48a5994e37a02baf")
+        key = bytes.fromhex("465b5ce8b199b49faa5f0a2ee238a6bc")
+        sqn_ms = bytes.fromhex("ff9bb4d0b607")
+
+        auts = self.create_auts(key, opc, rand, sqn_ms)
+
+        self.assertEqual(calculate_resync_data(key, opc, rand, auts), (sqn_ms, True))
+        self.assertEqual(calculate_resync_data(MilenageContext(key), opc, rand, auts), (sqn_ms, True))
+
+    def test__invalid_mac_s(self):
+        rand = bytes.fromhex("23553cbe9637a89d218ae64dae47bf35")
+        opc = bytes.fromhex("cd63cb71954a9f4e48a5994e37a02baf")
+        key = bytes.fromhex("465b5ce8b199b49faa5f0a2ee238a6bc")
+        sqn_ms = bytes.fromhex("ff9bb4d0b607")
+
+        auts = self.create_auts(key, opc, rand, sqn_ms)
+        auts = auts[:-1] + bytes([auts[-1] ^ 0x01])
+
+        self.assertEqual(calculate_resync_data(key, opc, rand, auts), (sqn_ms, False))
+
+    def test__invalid_length(self):
+        rand = bytes.fromhex("23553cbe9637a89d218ae64dae47bf35")
+        opc = bytes.fromhex("cd63cb71954a9f4e48a5994e37a02baf")
+        key = bytes.fromhex("465b5ce8b199b49faa5f0a2ee238a6bc")
+
+        with self.assertRaises(ValueError) as cm:
+            calculate_resync_data(key, opc, rand, bytes(13))
+
+        self.assertEqual(cm.exception.args[0], "Invalid RAND or AUTS length")
+
+
 if __name__ == "__main__":
     unittest.main()
\ No newline at end of file
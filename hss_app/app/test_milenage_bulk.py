@@ -0,0 +1,96 @@
+# -*- coding: utf-8 -*-
+"""
+    hss_app.test_milenage_bulk
+    ~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+    This module contains the columnar Milenage unittests.
+
+    :copyright: (c) 2021 Henrique Marques Ribeiro.
+    :license: MIT, see LICENSE for more details.
+"""
+
+import unittest
+
+from milenage import *
+from milenage_bulk import *
+
+
+#: 3GPP TS 35.208 test sets as (RAND, OPc, K, AMF, SQN, XRES, AUTN, KASME)
+TEST_SETS = [
+    ("23553cbe9637a89d218ae64dae47bf35", "cd63cb71954a9f4e48a5994e37a02baf", "465b5ce8b199b49faa5f0a2ee238a6bc", "b9b9", "ff9bb4d0b607",
+     "a54211d5e3ba50bf", "55f328b43577b9b94a9ffac354dfafb3", "00c73bac435945a7c5cf3565c0d3c64375416b255f0bd65d74f40e60c90a280a"),
+    ("9f7c8d021accf4db213ccff0c7f71a6a", "1006020f0a478bf6b699f15c062e42b3", "fec86ba6eb707ed08905757b1bb44b8f", "725c", "9d0277595ffc",
+     "8011c48c0c214ed2", "ae4a3a9b4c97725c9cabc3e99baf7281", "4826154dc86a76e8eeba9673c5c7fac9141f00c0c0ffbf386e93e9f2e0eb34f4"),
+    ("ce83dbc54ac0274a157c17f80d017bd6", "a64a507ae1a2a98bb88eb4210135dc87", "9e5944aea94b81165c82fbf9f32db751", "9e09", "0b604a81eca8",
+     "f365cd683cd92e96", "fbd98a0b3c869e0974a58220cba84c49", "35e1f31c813e4b64466367bf15b6e52b7db7cd9922901bd793432be30d754f6a"),
+    ("74b0cd6031a1c8339b2b6ce2b8c4a186", "dcf07cbd51855290b92a07a9891e523e", "4ab1deb05ca6ceb051fc98e77d026a84", "9f07", "e880a1b580b6",
+     "5860fc1bce351e7e", "d961bbd511ae9f0749e785dd12626ef2", "788677b1a220a418640338c8d6a8d6dbc306ea2a239154460084259b53c82a83"),
+    ("ee6466bc96202c5a557abbeff8babf63", "3803ef5363b947c6aaa225e58fae3934", "6c38a116ac280c454f59332ee35c8c4f", "4464", "414b98222181",
+     "16c8233f05a0ac28", "04fb6eb891ed4464078adfb488241a57", "2a90f8b6b6522d62f046f838693c4946edcdc52eeabf1204e275eb1d53853b69"),
+    ("194aa756013896b74b4a2a3b0af4539e", "c35a0ab0bcbfc9252caff15f24efbde0", "2d609d4db0ac5bf0d2c0de267014de0d", "5f67", "6bf69438c2e4",
+     "8c25a16cd918a1df", "1592c1cb8e175f67bd07d3003b9e5cc3", "8cd327e3d1eba71cbc7b3e84a7dbfc88038ccd1adb530415d96d9201056a682c"),
+]
+
+
+def get_column(index):
+    return [bytes.fromhex(test_set[index]) for test_set in TEST_SETS]
+
+
+class TestCalculateBulkMilenage(unittest.TestCase):
+    def test__3gpp_35208_v5_0_0__test_sets(self):
+        rands, opcs, keys, amfs, sqns = [get_column(i) for i in range(5)]
+
+        outputs = calculate_bulk_milenage(keys, opcs, rands, sqns, amfs)
+
+        for index, (key, opc, rand, sqn, amf) in enumerate(zip(keys, opcs, rands, sqns, amfs)):
+            output = milenage_all(key, opc, rand, sqn, amf)
+            out1, out2, out3, out4, out5 = [out[index].tobytes() for out in outputs]
+
+            self.assertEqual(out1[:8], output.mac_a)
+            self.assertEqual(out1[8:], output.mac_s)
+            self.assertEqual(out2[8:], output.res)
+            self.assertEqual(out2[:6], output.ak)
+            self.assertEqual(out3, output.ck)
+            self.assertEqual(out4, output.ik)
+            self.assertEqual(out5[:6], output.ak_s)
+
+
+class TestCalculateBulkEutranVectors(unittest.TestCase):
+    def test__3gpp_35208_v5_0_0__test_sets(self):
+        rands, opcs, keys, amfs, sqns = [get_column(i) for i in range(5)]
+        plmn = bytes.fromhex("27f450")
+
+        vectors = calculate_bulk_eutran_vectors(keys, opcs, sqns, amfs, plmn, rands)
+
+        self.assertEqual(len(vectors), len(TEST_SETS))
+
+        for vector, test_set in zip(vectors, TEST_SETS):
+            self.assertEqual(vector.rand.hex(), test_set[0])
+            self.assertEqual(vector.xres.hex(), test_set[5])
+            self.assertEqual(vector.autn.hex(), test_set[6])
+            self.assertEqual(vector.kasme.hex(), test_set[7])
+
+    def test__random_rands(self):
+        _, opcs, keys, amfs, sqns = [get_column(i) for i in range(5)]
+        plmn = bytes.fromhex("27f450")
+        contexts = [MilenageContext(key) for key in keys]
+
+        vectors = calculate_bulk_eutran_vectors(contexts, opcs, sqns, amfs, plmn)
+
+        for vector, key, opc, amf, sqn in zip(vectors, keys, opcs, amfs, sqns):
+            self.assertEqual(vector, calculate_eutran_vector(opc, key, amf, sqn, plmn, vector.rand))
+
+    def test__empty(self):
+        self.assertEqual(calculate_bulk_eutran_vectors([], [], [], [], bytes.fromhex("27f450")), [])
+
+    def test__different_length(self):
+        _, opcs, keys, amfs, sqns = [get_column(i) for i in range(5)]
+
+        with self.assertRaises(ValueError) as cm:
+            calculate_bulk_eutran_vectors(keys, opcs[1:], sqns, amfs, bytes.fromhex("27f450"))
+
+        self.assertEqual(cm.exception.args[0], "Input values must have same length")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,87 @@
+# -*- coding: utf-8 -*-
+"""
+    hss_app.test_milenage_crypto
+    ~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+    This module contains the Milenage crypto backends unittests.
+
+    :copyright: (c) 2021 Henrique Marques Ribeiro.
+    :license: MIT, see LICENSE for more details.
+"""
+
+import unittest
+
+import milenage
+import milenage_crypto
+import test_milenage
+from milenage import *
+from milenage_crypto import *
+
+
+class TestCryptoBackends(unittest.TestCase):
+    def test__fips_197_appendix_c_1(self):
+        key = bytes.fromhex("000102030405060708090a0b0c0d0e0f")
+        data = bytes.fromhex("00112233445566778899aabbccddeeff")
+
+        for name, backend in get_available_crypto_backends().items():
+            with self.subTest(backend=name):
+                encrypt = backend.new_encryptor(key)
+                self.assertEqual(encrypt(data).hex(), "69c4e0d86a7b0430d8cdb78070b4c55a")
+                self.assertEqual(encrypt(data + data).hex(), 2 * "69c4e0d86a7b0430d8cdb78070b4c55a")
+
+    def test__get_crypto_backend(self):
+        self.assertEqual(get_crypto_backend("pycryptodome").name, "pycryptodome")
+        self.assertIn(get_crypto_backend("auto").name, get_available_crypto_backends())
+
+    def test__get_crypto_backend__invalid(self):
+        with self.assertRaises(ValueError) as cm:
+            get_crypto_backend("openssl")
+
+        self.assertEqual(cm.exception.args[0], "Invalid crypto backend: openssl")
+
+    def test__get_crypto_backend__not_available(self):
+        self.addCleanup(setattr, milenage_crypto, "Cipher", milenage_crypto.Cipher)
+        milenage_crypto.Cipher = None
+
+        self.assertEqual(list(get_available_crypto_backends()), ["pycryptodome"])
+
+        with self.assertRaises(ValueError) as cm:
+            get_crypto_backend("cryptography")
+
+        self.assertEqual(cm.exception.args[0], "Crypto backend not available: cryptography")
+
+    def test__set_crypto_backend(self):
+        self.addCleanup(setattr, milenage, "crypto_backend", milenage.crypto_backend)
+
+        self.assertEqual(set_crypto_backend("pycryptodome"), "pycryptodome")
+        self.assertIsInstance(milenage.crypto_backend, PycryptodomeBackend)
+
+
+class CryptographyBackendMixin:
+    """Runs the Milenage conformance tests with the `cryptography` backend."""
+    def setUp(self):
+        if "cryptography" not in get_available_crypto_backends():
+            self.skipTest("cryptography package not installed")
+
+        self.addCleanup(setattr, milenage, "crypto_backend", milenage.crypto_backend)
+        set_crypto_backend("cryptography")
+
+
+class TestMilenageCryptography(CryptographyBackendMixin, test_milenage.TestMilenage):
+    pass
+
+
+class TestMilenageAllCryptography(CryptographyBackendMixin, test_milenage.TestMilenageAll):
+    pass
+
+
+class TestGenerateEutranVectorCryptography(CryptographyBackendMixin, test_milenage.TestGenerateEutranVector):
+    pass
+
+
+class TestResyncDataCryptography(CryptographyBackendMixin, test_milenage.TestResyncData):
+    pass
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,85 @@
+# -*- coding: utf-8 -*-
+"""
+    hss_app.test_milenage_engine
+    ~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+    This module contains the Milenage engine unittests.
+
+    :copyright: (c) 2021 Henrique Marques Ribeiro.
+    :license: MIT, see LICENSE for more details.
+"""
+
+import unittest
+
+from milenage import *
+from milenage_engine import *
+
+
+class TestPacking(unittest.TestCase):
+    def test__material(self):
+        opc = bytes.fromhex("cd63cb71954a9f4e48a5994e37a02baf")
+        key = bytes.fromhex("465b5ce8b199b49faa5f0a2ee238a6bc")
+        amf = bytes.fromhex("b9b9")
+        sqn = bytes.fromhex("ff9bb4d0b607")
+        plmn = bytes.fromhex("27f450")
+        rands = generate_rands(3)
+
+        material = pack_material(opc, key, amf, sqn, plmn, rands, 32)
+
+        self.assertEqual(len(material), 47 + 3 * 16)
+        self.assertEqual(unpack_material(material), (opc, key, amf, sqn, plmn, rands, 32))
+
+    def test__vectors(self):
+        opc = bytes.fromhex("cd63cb71954a9f4e48a5994e37a02baf")
+        key = bytes.fromhex("465b5ce8b199b49faa5f0a2ee238a6bc")
+        amf = bytes.fromhex("b9b9")
+        sqn = bytes.fromhex("ff9bb4d0b607")
+        plmn = bytes.fromhex("27f450")
+
+        vectors = calculate_eutran_vectors(opc, key, amf, sqn, plmn, num_of_vectors=2)
+
+        self.assertEqual(unpack_vectors(pack_vectors(vectors)), vectors)
+
+
+class TestMilenageEngine(unittest.TestCase):
+    def assert_vectors(self, engine, num_of_vectors, sqn_step=0):
+        opc = bytes.fromhex("cd63cb71954a9f4e48a5994e37a02baf")
+        key = bytes.fromhex("465b5ce8b199b49faa5f0a2ee238a6bc")
+        amf = bytes.fromhex("b9b9")
+        sqn = bytes.fromhex("ff9bb4d0b607")
+        plmn = bytes.fromhex("27f450")
+
+        vectors = engine.calculate_eutran_vectors(opc, MilenageContext(key), amf, sqn, plmn, num_of_vectors, sqn_step)
+
+        self.assertEqual(len(vectors), num_of_vectors)
+        self.assertEqual(len({vector.rand for vector in vectors}), num_of_vectors)
+
+        for index, vector in enumerate(vectors):
+            _sqn = (int.from_bytes(sqn, byteorder="big") + index * sqn_step).to_bytes(6, byteorder="big")
+            self.assertEqual(vector, calculate_eutran_vector(opc, key, amf, _sqn, plmn, vector.rand))
+
+    def test__inline(self):
+        engine = MilenageEngine()
+
+        self.assertIsNone(engine.pool)
+        self.assert_vectors(engine, 3)
+        self.assert_vectors(engine, 3, sqn_step=32)
+
+    def test__process(self):
+        engine = MilenageEngine(mode="process", pool_size=2, min_batch_size=2)
+        self.addCleanup(engine.shutdown)
+
+        self.assertIsNotNone(engine.pool)
+        self.assert_vectors(engine, 1)
+        self.assert_vectors(engine, 4)
+        self.assert_vectors(engine, 4, sqn_step=32)
+
+    def test__invalid_mode(self):
+        with self.assertRaises(ValueError) as cm:
+            MilenageEngine(mode="thread")
+
+        self.assertEqual(cm.exception.args[0], "Invalid Milenage engine mode: thread")
+
+
+if __name__ == "__main__":
+    unittest.main()
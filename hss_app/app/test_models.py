@@ -0,0 +1,369 @@
+# -*- coding: utf-8 -*-
+"""
+    hss_app.test_models
+    ~~~~~~~~~~~~~~~~~~~
+
+    This module contains the database models unittests.
+
+    :copyright: (c) 2021 Henrique Marques Ribeiro.
+    :license: MIT, see LICENSE for more details.
+"""
+
+import time
+import unittest
+
+from sqlalchemy.dialects import postgresql
+
+import models
+from models import *
+from write_behind import WRITE_MODE_GROUP, WRITE_MODE_SYNC
+
+
+def create_subscriber(imsi: int = 999000000000001, sqn: bytes = bytes.fromhex("000000000020")) -> Subscriber:
+    return Subscriber(id=1,
+                      imsi=imsi,
+                      key=bytes.fromhex("465b5ce8b199b49faa5f0a2ee238a6bc"),
+                      opc=bytes.fromhex("cd63cb71954a9f4e48a5994e37a02baf"),
+                      amf=bytes.fromhex("b9b9"),
+                      sqn=sqn,
+                      msisdn=5511999999999,
+                      roaming_allowed=True,
+                      schar=8,
+                      default_apn=1,
+                      apns=[Apn(id=1, apn_id=1, apn_name="internet", pdn_type="IPv4", qci=9)],
+                      mip6s=[Mip6(id=1, context_id=1, service_selection="internet")])
+
+
+class TestCreateSubscriberSnapshot(unittest.TestCase):
+    def test__snapshot(self):
+        subscriber = create_subscriber()
+
+        snapshot = create_subscriber_snapshot(subscriber)
+
+        for field in SubscriberSnapshot._fields[:-2]:
+            self.assertEqual(getattr(snapshot, field), getattr(subscriber, field))
+
+        self.assertEqual(snapshot.apns, (ApnSnapshot(id=1, apn_id=1, apn_name="internet", pdn_type="IPv4", qci=9,
+                                                     priority_level=None, max_req_bw_ul=None, max_req_bw_dl=None),))
+        self.assertEqual(snapshot.mip6s, (Mip6Snapshot(id=1, context_id=1, service_selection="internet",
+                                                       destination_realm=None, destination_host=None),))
+
+    def test__immutable(self):
+        snapshot = create_subscriber_snapshot(create_subscriber())
+
+        with self.assertRaises(AttributeError):
+            snapshot.sqn = bytes(6)
+
+
+class TestSubscriberCache(unittest.TestCase):
+    def test__hit_and_miss(self):
+        cache = SubscriberCache(maxsize=10)
+        snapshot = create_subscriber_snapshot(create_subscriber())
+
+        self.assertIsNone(cache.get("999000000000001"))
+        cache.put("999000000000001", snapshot, cache.generation)
+
+        self.assertIs(cache.get("999000000000001"), snapshot)
+        self.assertIs(cache.get(999000000000001), snapshot)
+        self.assertEqual((cache.hits, cache.misses), (2, 1))
+
+    def test__disabled(self):
+        cache = SubscriberCache(maxsize=0)
+
+        cache.put("999000000000001", create_subscriber_snapshot(create_subscriber()), cache.generation)
+
+        self.assertFalse(cache.enabled)
+        self.assertEqual(len(cache), 0)
+
+    def test__ttl(self):
+        cache = SubscriberCache(maxsize=10, ttl=0.01)
+
+        cache.put("999000000000001", create_subscriber_snapshot(create_subscriber()), cache.generation)
+        time.sleep(0.02)
+
+        self.assertIsNone(cache.get("999000000000001"))
+        self.assertEqual(len(cache), 0)
+
+    def test__lru_eviction(self):
+        cache = SubscriberCache(maxsize=2)
+        snapshots = [create_subscriber_snapshot(create_subscriber(imsi)) for imsi in range(3)]
+
+        cache.put("0", snapshots[0], cache.generation)
+        cache.put("1", snapshots[1], cache.generation)
+        cache.get("0")
+        cache.put("2", snapshots[2], cache.generation)
+
+        self.assertIs(cache.get("0"), snapshots[0])
+        self.assertIsNone(cache.get("1"))
+        self.assertEqual(cache.evictions, 1)
+
+    def test__refresh(self):
+        cache = SubscriberCache(maxsize=10)
+        cache.put("999000000000001", create_subscriber_snapshot(create_subscriber()), cache.generation)
+
+        cache.refresh("999000000000001", sqn=bytes.fromhex("000000000040"))
+
+        self.assertEqual(cache.get("999000000000001").sqn, bytes.fromhex("000000000040"))
+
+    def test__invalidate(self):
+        cache = SubscriberCache(maxsize=10)
+        cache.put("999000000000001", create_subscriber_snapshot(create_subscriber()), cache.generation)
+
+        cache.invalidate("999000000000001")
+
+        self.assertIsNone(cache.get("999000000000001"))
+
+    def test__put_after_concurrent_write(self):
+        cache = SubscriberCache(maxsize=10)
+
+        generation = cache.generation
+        cache.refresh("999000000000001", sqn=bytes.fromhex("000000000040"))
+        cache.put("999000000000001", create_subscriber_snapshot(create_subscriber()), generation)
+
+        self.assertIsNone(cache.get("999000000000001"))
+
+    def test__put_after_concurrent_write_of_other_subscriber(self):
+        cache = SubscriberCache(maxsize=10)
+        snapshot = create_subscriber_snapshot(create_subscriber())
+
+        generation = cache.generation
+        cache.invalidate("999000000000002")
+        cache.put("999000000000001", snapshot, generation)
+
+        self.assertIs(cache.get("999000000000001"), snapshot)
+
+    def test__put_after_trimmed_write(self):
+        cache = SubscriberCache(maxsize=1)
+
+        generation = cache.generation
+        cache.invalidate("999000000000001")
+        cache.invalidate("999000000000002")
+        cache.put("999000000000001", create_subscriber_snapshot(create_subscriber()), generation)
+
+        self.assertIsNone(cache.get("999000000000001"))
+
+
+class TestCreateSubscriberWriteStatements(unittest.TestCase):
+    def compile(self, statement):
+        return str(statement.compile(dialect=postgresql.dialect()))
+
+    def test__postgresql__multi_row(self):
+        writes = [
+            ((WRITE_MME, "999000000000001"), {"mme_hostname": "mme1", "mme_realm": "realm", "ue_srvcc_support": None}),
+            ((WRITE_MME, "999000000000002"), {"mme_hostname": "mme2", "mme_realm": "realm", "ue_srvcc_support": True}),
+            ((WRITE_MIP6, "999000000000001", 1), {"destination_host": "pgw1", "destination_realm": "realm"}),
+            ((WRITE_MIP6, "999000000000002", 1), {"destination_host": "pgw2", "destination_realm": "realm"}),
+        ]
+
+        statements = create_subscriber_write_statements(writes, "postgresql")
+
+        self.assertEqual(len(statements), 2)
+
+        mme, mip6 = map(self.compile, statements)
+        self.assertTrue(mme.startswith("UPDATE subscribers SET "))
+        self.assertIn("FROM (VALUES (", mme)
+        self.assertIn("CAST(mme_writes.ue_srvcc_support AS BOOLEAN)", mme)
+        self.assertIn("WHERE subscribers.imsi = mme_writes.imsi", mme)
+
+        self.assertTrue(mip6.startswith("UPDATE mip6s SET "))
+        self.assertIn("FROM (VALUES (", mip6)
+        self.assertIn("subscribers.imsi = mip6_writes.imsi", mip6)
+
+        params = statements[0].compile(dialect=postgresql.dialect()).params
+        self.assertIn(999000000000002, params.values())
+
+    def test__postgresql__single_write(self):
+        writes = [((WRITE_MME, "999000000000001"), {"mme_hostname": "mme1", "mme_realm": "realm", "ue_srvcc_support": None})]
+
+        statement, = create_subscriber_write_statements(writes, "postgresql")
+
+        self.assertNotIn("VALUES (", self.compile(statement))
+
+    def test__other_dialect(self):
+        writes = [
+            ((WRITE_MME, "999000000000001"), {"mme_hostname": "mme1", "mme_realm": "realm", "ue_srvcc_support": None}),
+            ((WRITE_MME, "999000000000002"), {"mme_hostname": "mme2", "mme_realm": "realm", "ue_srvcc_support": True}),
+        ]
+
+        self.assertEqual(len(create_subscriber_write_statements(writes, "sqlite")), 2)
+
+    def test__invalid_write(self):
+        with self.assertRaises(ValueError) as cm:
+            create_subscriber_write_statements([(("apn", "999000000000001"), {})], "postgresql")
+
+        self.assertEqual(cm.exception.args[0], "Invalid subscriber write: apn")
+
+
+class FakeSession:
+    def __init__(self, sessions):
+        self.calls = list()
+        self.info = dict()
+        self.new = self.dirty = self.deleted = ()
+        sessions.append(self)
+
+    def get_bind(self):
+        return engine
+
+    def execute(self, statement):
+        self.calls.append("execute")
+        self.info["written"] = True
+
+    def commit(self):
+        self.calls.append("commit")
+
+    def rollback(self):
+        self.calls.append("rollback")
+
+    def close(self):
+        self.calls.append("close")
+
+
+class TestUnitOfWork(unittest.TestCase):
+    def setUp(self):
+        self.sessions = list()
+        self.calls = list()
+
+    def create_unit_of_work(self):
+        return UnitOfWork(session_factory=lambda: FakeSession(self.sessions))
+
+    def test__single_session(self):
+        with self.create_unit_of_work() as unit_of_work:
+            self.assertIs(get_unit_of_work(), unit_of_work)
+
+            with begin_session() as session:
+                pass
+            with begin_session() as other_session:
+                pass
+
+            self.assertIs(session, other_session)
+
+        self.assertIsNone(get_unit_of_work())
+        self.assertEqual(len(self.sessions), 1)
+        self.assertEqual(session.calls, ["commit", "close"])
+
+    def test__no_session(self):
+        with self.create_unit_of_work():
+            on_commit(self.calls.append, "refresh")
+
+        self.assertEqual(self.sessions, list())
+        self.assertEqual(self.calls, ["refresh"])
+
+    def test__on_commit(self):
+        with self.create_unit_of_work():
+            with begin_session() as session:
+                on_commit(self.calls.append, "refresh")
+
+            #: Deferred until the commit
+            self.assertEqual(self.calls, list())
+
+        self.assertEqual(self.calls, ["refresh"])
+
+    def test__rollback(self):
+        with self.assertRaises(RuntimeError):
+            with self.create_unit_of_work():
+                with begin_session() as session:
+                    on_commit(self.calls.append, "refresh")
+                raise RuntimeError("Unable to send CLR")
+
+        self.assertEqual(session.calls, ["rollback", "close"])
+        self.assertEqual(self.calls, list())
+
+    def test__on_commit__without_unit_of_work(self):
+        on_commit(self.calls.append, "refresh")
+
+        self.assertEqual(self.calls, ["refresh"])
+
+    def test__transactional(self):
+        @transactional
+        def ulr(request):
+            self.assertIsNotNone(get_unit_of_work())
+            on_commit(self.calls.append, request)
+            return "ULA"
+
+        self.assertEqual(ulr.__name__, "ulr")
+        self.assertEqual(ulr("ULR"), "ULA")
+        self.assertEqual(self.calls, ["ULR"])
+        self.assertIsNone(get_unit_of_work())
+
+
+class FakeWriteQueue:
+    def __init__(self, mode, sessions):
+        self.mode = mode
+        self.sessions = sessions
+        self.calls = list()
+
+    def put(self, key, values):
+        self.calls.append([session.calls[:] for session in self.sessions])
+
+
+class TestPutSubscriberWrite(unittest.TestCase):
+    def setUp(self):
+        self.sessions = list()
+        self.addCleanup(setattr, models, "subscriber_writes", models.subscriber_writes)
+
+    def put_within_unit_of_work(self, mode):
+        models.subscriber_writes = FakeWriteQueue(mode, self.sessions)
+
+        with UnitOfWork(session_factory=lambda: FakeSession(self.sessions)):
+            with begin_session():
+                pass
+            put_subscriber_write((WRITE_MME, "999000000000001"), {"mme_hostname": "mme1"})
+
+        return models.subscriber_writes.calls
+
+    def test__group(self):
+        #: The connection is released, not committed, before waiting for the
+        #: group commit
+        self.assertEqual(self.put_within_unit_of_work(WRITE_MODE_GROUP), [[["close"]]])
+
+    def test__group__after_write(self):
+        models.subscriber_writes = FakeWriteQueue(WRITE_MODE_GROUP, self.sessions)
+
+        with UnitOfWork(session_factory=lambda: FakeSession(self.sessions)):
+            with begin_session() as session:
+                session.execute("UPDATE subscribers")
+            put_subscriber_write((WRITE_MME, "999000000000001"), {"mme_hostname": "mme1"})
+
+        #: Written sessions are held, so the request stays atomic
+        self.assertEqual(models.subscriber_writes.calls, [[["execute"]]])
+        self.assertEqual(self.sessions[0].calls, ["execute", "commit", "close"])
+
+    def test__sync(self):
+        self.assertEqual(self.put_within_unit_of_work(WRITE_MODE_SYNC), [[[]]])
+        self.assertEqual(self.sessions[0].calls, ["commit", "close"])
+
+
+class TestUpdateMmeInfo(unittest.TestCase):
+    def setUp(self):
+        self.sessions = list()
+        self.addCleanup(setattr, models, "subscriber_writes", models.subscriber_writes)
+        self.addCleanup(setattr, models, "subscriber_cache", models.subscriber_cache)
+
+        models.subscriber_writes = FakeWriteQueue(WRITE_MODE_GROUP, self.sessions)
+        models.subscriber_cache = SubscriberCache(maxsize=10)
+        models.subscriber_cache.put("999000000000001", create_subscriber_snapshot(create_subscriber()), 0)
+
+    def create_unit_of_work(self):
+        return UnitOfWork(session_factory=lambda: FakeSession(self.sessions))
+
+    def get_mme_hostname(self):
+        return models.subscriber_cache.get("999000000000001").mme_hostname
+
+    def test__cache_follows_database(self):
+        profile = {"mme_hostname": "mme1", "mme_realm": "realm", "ue_srvcc_support": None}
+
+        with self.create_unit_of_work():
+            update_mme_info_eps_subscription_profile("999000000000001", profile)
+
+        #: The queued write has not been committed yet
+        self.assertIsNone(self.get_mme_hostname())
+
+        with self.create_unit_of_work():
+            apply_subscriber_writes([((WRITE_MME, "999000000000001"), profile)])
+            self.assertIsNone(self.get_mme_hostname())
+
+        self.assertEqual(self.get_mme_hostname(), "mme1")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,359 @@
+# -*- coding: utf-8 -*-
+"""
+    hss_app.test_sqn_store
+    ~~~~~~~~~~~~~~~~~~~~~~
+
+    This module contains the SQN stores unittests. Redis is replaced by an
+    in-memory client which runs the same steps of the Lua scripts.
+
+    :copyright: (c) 2021 Henrique Marques Ribeiro.
+    :license: MIT, see LICENSE for more details.
+"""
+
+import unittest
+
+from sqn_store import *
+
+
+class FakeRedis:
+    def __init__(self):
+        self.data = dict()
+        self.available = True
+        self.num_of_calls = 0
+
+    def check(self):
+        self.num_of_calls += 1
+        if not self.available:
+            raise ConnectionError("Redis unavailable")
+
+    def get(self, name):
+        self.check()
+        return self.data.get(name)
+
+    def delete(self, *names):
+        self.check()
+        for name in names:
+            self.data.pop(name, None)
+
+    def register_script(self, script):
+        scripts = {
+            RESERVE_SCRIPT: self.reserve,
+            EXTEND_SCRIPT: self.extend,
+            ADVANCE_SCRIPT: self.advance,
+        }
+        func = scripts[script]
+
+        def run(keys, args):
+            self.check()
+            return func(keys, [str(arg).encode() for arg in args])
+        return run
+
+    def reserve(self, keys, args):
+        if keys[1] not in self.data:
+            return -1
+
+        sqn = int(self.data.get(keys[0], b"0")) + int(args[0])
+        if sqn > int(self.data[keys[1]]):
+            return -1
+
+        self.data[keys[0]] = str(sqn).encode()
+        return sqn
+
+    def extend(self, keys, args):
+        if keys[1] in self.data and int(self.data[keys[1]]) >= int(args[1]):
+            return 0
+
+        self.data[keys[0]] = args[0]
+        self.data[keys[1]] = args[1]
+        return 1
+
+    def advance(self, keys, args):
+        if keys[1] not in self.data or self.data.get(keys[0]) != args[0]:
+            return 0
+
+        if int(args[1]) > int(self.data[keys[1]]):
+            return 0
+
+        self.data[keys[0]] = args[1]
+        return 1
+
+
+class FakeProfiles:
+    def __init__(self, sqns):
+        self.sqns = sqns
+        self.num_of_writes = 0
+        self.committed = None
+
+    def begin(self):
+        """Start a unit of work, whose reservations are rolled back unless
+        they are standalone."""
+        self.committed = dict(self.sqns)
+
+    def rollback(self):
+        self.sqns, self.committed = self.committed, None
+
+    def reserve(self, imsi, delta, standalone=False):
+        if imsi not in self.sqns:
+            return None, None
+
+        self.num_of_writes += 1
+        sqn = self.sqns[imsi]
+        self.sqns[imsi] = (sqn + delta) & SQN_MASK
+
+        if standalone and self.committed is not None:
+            self.committed[imsi] = self.sqns[imsi]
+        return to_sqn(sqn), to_sqn(self.sqns[imsi])
+
+    def advance(self, imsi, sqn, next_sqn):
+        if self.sqns.get(imsi) != from_sqn(sqn):
+            return False
+
+        self.num_of_writes += 1
+        self.sqns[imsi] = from_sqn(next_sqn)
+        return True
+
+    def update(self, imsi, profile):
+        self.num_of_writes += 1
+        self.sqns[imsi] = from_sqn(profile["sqn"])
+
+
+class TestPostgresSqnStore(unittest.TestCase):
+    def setUp(self):
+        self.profiles = FakeProfiles({"999000000000001": 0x20})
+        self.store = PostgresSqnStore(self.profiles.reserve, self.profiles.advance, self.profiles.update)
+
+    def test__reserve(self):
+        self.assertEqual(self.store.reserve("999000000000001", 64), (to_sqn(0x20), to_sqn(0x60)))
+        self.assertEqual(self.store.reserve("999000000000001", 32), (to_sqn(0x60), to_sqn(0x80)))
+        self.assertEqual(self.profiles.num_of_writes, 2)
+
+    def test__reserve__unknown_imsi(self):
+        self.assertEqual(self.store.reserve("999000000000002", 32), (None, None))
+
+    def test__get(self):
+        self.assertEqual(self.store.get("999000000000001", to_sqn(0x20)), to_sqn(0x20))
+
+
+class TestRedisSqnStore(unittest.TestCase):
+    def setUp(self):
+        self.imsi = "999000000000001"
+        self.client = FakeRedis()
+        self.profiles = FakeProfiles({self.imsi: 0x20})
+        self.store = RedisSqnStore(self.client,
+                                   self.profiles.reserve,
+                                   self.profiles.advance,
+                                   self.profiles.update,
+                                   lease_size=256)
+
+    def test__reserve__takes_lease(self):
+        self.assertEqual(self.store.reserve(self.imsi, 32), (to_sqn(0x20), to_sqn(0x40)))
+
+        self.assertEqual(self.store.num_of_leases, 1)
+        self.assertEqual(self.profiles.sqns[self.imsi], 0x20 + 256)
+
+    def test__reserve__within_lease(self):
+        sqns = [self.store.reserve(self.imsi, 32) for _ in range(8)]
+
+        self.assertEqual([sqn for sqn, _ in sqns], [to_sqn(0x20 + 32 * i) for i in range(8)])
+        self.assertEqual(self.store.num_of_leases, 1)
+        self.assertEqual(self.profiles.num_of_writes, 1)
+
+    def test__reserve__next_lease(self):
+        for _ in range(8):
+            self.store.reserve(self.imsi, 32)
+
+        self.assertEqual(self.store.reserve(self.imsi, 64), (to_sqn(0x20 + 256), to_sqn(0x60 + 256)))
+        self.assertEqual(self.store.num_of_leases, 2)
+        self.assertEqual(self.profiles.sqns[self.imsi], 0x20 + 512)
+
+    def test__reserve__high_water_mark(self):
+        for _ in range(3):
+            _, next_sqn = self.store.reserve(self.imsi, 32)
+
+        #: Redis restarted without its keys
+        self.client.data.clear()
+
+        sqn, _ = self.store.reserve(self.imsi, 32)
+        self.assertGreaterEqual(from_sqn(sqn), from_sqn(next_sqn))
+        self.assertEqual(sqn, to_sqn(0x20 + 256))
+
+    def test__reserve__delta_larger_than_lease(self):
+        self.assertEqual(self.store.reserve(self.imsi, 512), (to_sqn(0x20), to_sqn(0x20 + 512)))
+
+    def test__reserve__unknown_imsi(self):
+        self.assertEqual(self.store.reserve("999000000000002", 32), (None, None))
+
+    def test__reserve__redis_unavailable(self):
+        _, next_sqn = self.store.reserve(self.imsi, 32)
+        self.client.available = False
+
+        sqn, _ = self.store.reserve(self.imsi, 32)
+        self.assertGreater(from_sqn(sqn), from_sqn(next_sqn))
+        self.assertEqual(sqn, to_sqn(0x20 + 256))
+
+    def test__reserve__lease_outlives_rollback(self):
+        self.profiles.begin()
+        _, next_sqn = self.store.reserve(self.imsi, 32)
+        self.profiles.rollback()
+
+        #: Redis keeps handing out SQNs of the lease, which stays persisted
+        limit = self.client.data[self.store.get_keys(self.imsi)[1]]
+        self.assertGreaterEqual(self.profiles.sqns[self.imsi], int(limit))
+
+        #: Redis restarted without its keys
+        self.client.data.clear()
+
+        sqn, _ = self.store.reserve(self.imsi, 32)
+        self.assertGreaterEqual(from_sqn(sqn), from_sqn(next_sqn))
+
+    def test__reserve__superseded_lease(self):
+        self.store.reserve(self.imsi, 32)
+
+        #: A concurrent process took a later lease meanwhile
+        extend = self.client.register_script(EXTEND_SCRIPT)
+        _, limit = self.profiles.reserve(self.imsi, 256)
+        extend(keys=self.store.get_keys(self.imsi), args=[from_sqn(limit) - 256, from_sqn(limit)])
+
+        sqn, _ = self.store.reserve(self.imsi, 32)
+        self.assertEqual(sqn, to_sqn(0x20 + 256))
+
+        #: An earlier lease does not move the SQN backwards
+        self.assertEqual(extend(keys=self.store.get_keys(self.imsi), args=[0x20, 0x20 + 256]), 0)
+        self.assertEqual(self.store.get(self.imsi, None), to_sqn(0x40 + 256))
+
+    def test__advance(self):
+        _, next_sqn = self.store.reserve(self.imsi, 32)
+
+        self.assertTrue(self.store.advance(self.imsi, next_sqn, to_sqn(from_sqn(next_sqn) + 64)))
+        self.assertEqual(self.store.get(self.imsi, None), to_sqn(from_sqn(next_sqn) + 64))
+
+        self.assertFalse(self.store.advance(self.imsi, next_sqn, to_sqn(from_sqn(next_sqn) + 64)))
+
+    def test__advance__beyond_lease(self):
+        _, next_sqn = self.store.reserve(self.imsi, 32)
+
+        self.assertFalse(self.store.advance(self.imsi, next_sqn, to_sqn(from_sqn(next_sqn) + 512)))
+
+    def test__get(self):
+        self.assertEqual(self.store.get(self.imsi, to_sqn(0x20)), to_sqn(0x20))
+
+        _, next_sqn = self.store.reserve(self.imsi, 32)
+        self.assertEqual(self.store.get(self.imsi, to_sqn(0x20)), next_sqn)
+
+    def test__reset(self):
+        self.store.reserve(self.imsi, 32)
+        self.store.reset(self.imsi, to_sqn(0x1000))
+
+        self.assertEqual(self.client.data, dict())
+        self.assertEqual(self.store.reserve(self.imsi, 32), (to_sqn(0x1000), to_sqn(0x1020)))
+
+
+class TestRedisSqnStoreCircuitBreaker(unittest.TestCase):
+    def setUp(self):
+        self.imsi = "999000000000001"
+        self.client = FakeRedis()
+        self.profiles = FakeProfiles({self.imsi: 0x20})
+        self.store = RedisSqnStore(self.client,
+                                   self.profiles.reserve,
+                                   self.profiles.advance,
+                                   self.profiles.update,
+                                   lease_size=256,
+                                   failure_threshold=3,
+                                   retry_interval=60)
+
+    def test__open(self):
+        self.client.available = False
+
+        for _ in range(3):
+            self.store.get(self.imsi, to_sqn(0x20))
+
+        self.assertTrue(self.store.is_open)
+        self.assertEqual(self.store.num_of_opens, 1)
+        self.assertEqual(self.client.num_of_calls, 3)
+
+        #: Reservations go straight to Postgres without calling Redis
+        self.assertEqual(self.store.reserve(self.imsi, 32), (to_sqn(0x20), to_sqn(0x40)))
+        self.assertEqual(self.store.get(self.imsi, to_sqn(0x40)), to_sqn(0x40))
+        self.assertFalse(self.store.advance(self.imsi, to_sqn(0x40), to_sqn(0x60)))
+        self.assertEqual(self.client.num_of_calls, 3)
+
+    def test__consecutive_failures(self):
+        for available in (False, False, True, False, False):
+            self.client.available = available
+            self.store.get(self.imsi, to_sqn(0x20))
+
+        self.assertFalse(self.store.is_open)
+        self.assertEqual(self.store.num_of_failures, 4)
+
+    def test__retry(self):
+        self.client.available = False
+        for _ in range(3):
+            self.store.reserve(self.imsi, 32)
+
+        self.assertTrue(self.store.is_open)
+
+        #: A failed retry waits for another interval
+        self.store._retry_at = 0
+        self.store.reserve(self.imsi, 32)
+        self.assertTrue(self.store.is_open)
+        self.assertFalse(self.store.is_available())
+
+        self.client.available = True
+        self.store._retry_at = 0
+        sqn, _ = self.store.reserve(self.imsi, 32)
+
+        self.assertFalse(self.store.is_open)
+        self.assertEqual(self.store.num_of_leases, 1)
+        self.assertEqual(sqn, to_sqn(0x20 + 4 * 32))
+
+    def open_breaker(self):
+        self.client.available = False
+        for _ in range(3):
+            self.store.get(self.imsi, to_sqn(0x20))
+
+        self.assertTrue(self.store.is_open)
+
+    def close_breaker(self):
+        self.client.available = True
+        self.store._retry_at = 0
+
+    def test__fallback__sqn_only_goes_up(self):
+        sqns = [self.store.reserve(self.imsi, 32)[0]]
+
+        self.open_breaker()
+        sqns.append(self.store.reserve(self.imsi, 32)[0])
+        sqns.append(self.store.reserve(self.imsi, 32)[0])
+
+        #: The lease left in Redis is behind Postgres by now
+        self.close_breaker()
+        sqns.append(self.store.reserve(self.imsi, 32)[0])
+        sqns.append(self.store.reserve(self.imsi, 32)[0])
+
+        self.assertFalse(self.store.is_open)
+        self.assertEqual(self.store.num_of_leases, 2)
+        self.assertEqual(sqns, sorted(set(sqns)))
+
+    def test__reset__while_open(self):
+        self.store.reserve(self.imsi, 32)
+
+        self.open_breaker()
+        self.store.reset(self.imsi, to_sqn(0x1000))
+
+        self.close_breaker()
+        sqn, _ = self.store.reserve(self.imsi, 32)
+
+        self.assertEqual(sqn, to_sqn(0x1000))
+
+    def test__disabled(self):
+        self.store.failure_threshold = 0
+        self.client.available = False
+
+        for _ in range(5):
+            self.store.reserve(self.imsi, 32)
+
+        self.assertFalse(self.store.is_open)
+        self.assertEqual(self.client.num_of_calls, 5)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -326,7 +326,7 @@ class TestGenerateVectors(unittest.TestCase):
 
         self.assertEqual(len(vectors), 1)
 
-        _rand, _xres, _autn, _kasme = calculate_eutran_vector(key, opc, amf, sqn, plmn, rand)
+        _rand, _xres, _autn, _kasme = calculate_eutran_vector(opc, key, amf, sqn, plmn, rand)
 
         self.assertEqual(rand, _rand)
         self.assertEqual(xres, _xres)
@@ -341,14 +341,41 @@ class TestGenerateVectors(unittest.TestCase):
         sqn = bytes.fromhex("ff9bb4d0b607")
         plmn = bytes.fromhex("09f107")
 
-        vectors, sqn = generate_vectors(num_of_vectors, key, opc, amf, sqn, plmn)
+        vectors, last_sqn = generate_vectors(num_of_vectors, key, opc, amf, sqn, plmn)
 
         self.assertEqual(len(vectors), 2)
+        self.assertEqual(last_sqn, bytes.fromhex("ff9bb4d0b647"))
+
+        for index, vector in enumerate(vectors, 1):
+            rand, xres, autn, kasme = vector
+            _sqn = (int.from_bytes(sqn, byteorder="big") + index * SQN_STEP).to_bytes(6, byteorder="big")
+
+            _rand, _xres, _autn, _kasme = calculate_eutran_vector(opc, key, amf, _sqn, plmn, rand)
+
+            self.assertEqual(rand, _rand)
+            self.assertEqual(xres, _xres)
+            self.assertEqual(autn, _autn)
+            self.assertEqual(kasme, _kasme)
+
+    def test__generate_vectors__4(self):
+        num_of_vectors = 4
+        key = bytes.fromhex("465b5ce8b199b49faa5f0a2ee238a6bc")
+        opc = bytes.fromhex("cd63cb71954a9f4e48a5994e37a02baf")
+        amf = bytes.fromhex("b9b9")
+        sqn = bytes.fromhex("ff9bb4d0b607")
+        plmn = bytes.fromhex("09f107")
+
+        vectors, last_sqn = generate_vectors(num_of_vectors, MilenageContext(key), opc, amf, sqn, plmn)
+
+        self.assertEqual(len(vectors), 4)
+        self.assertEqual(len({vector.rand for vector in vectors}), 4)
+        self.assertEqual(last_sqn, bytes.fromhex("ff9bb4d0b687"))
 
-        for vector in vectors:
+        for index, vector in enumerate(vectors, 1):
             rand, xres, autn, kasme = vector
+            _sqn = (int.from_bytes(sqn, byteorder="big") + index * SQN_STEP).to_bytes(6, byteorder="big")
 
-            _rand, _xres, _autn, _kasme = calculate_eutran_vector(key, opc, amf, sqn, plmn, rand)
+            _rand, _xres, _autn, _kasme = calculate_eutran_vector(opc, key, amf, _sqn, plmn, rand)
 
             self.assertEqual(rand, _rand)
             self.assertEqual(xres, _xres)
@@ -1279,6 +1306,58 @@ class TestCreateApnConfigurationAvp(unittest.TestCase):
         self.assertEqual(apn_configuration_avp.mip6_agent_info_avp.mip_home_agent_host_avp.destination_host_avp.data, b"topon.s5pgw.node.epc.mncXXX.mccYYY.3gppnetwork.org")
 
 
+class TestApnConfigurationTable(unittest.TestCase):
+    def setUp(self):
+        self.Mip6 = namedtuple("Mip6s", ["context_id", "service_selection", "destination_realm", "destination_host"])
+        self.Apn = namedtuple("Apns", ["apn_id", "apn_name", "pdn_type", "qci", "priority_level", "max_req_bw_dl", "max_req_bw_ul"])
+
+        self.apn = self.Apn(apn_id=1, apn_name="internet", pdn_type="IPv4", qci=9, priority_level=8, max_req_bw_dl=256, max_req_bw_ul=256)
+        self.mip6 = self.Mip6(context_id=1, service_selection="internet", destination_realm=None, destination_host=None)
+
+    def test__shared(self):
+        table = ApnConfigurationTable(maxsize=10)
+
+        avp = table.get(self.apn, self.mip6)
+
+        #: Another subscriber, with its own copies of the same APN and MIP6
+        self.assertIs(table.get(self.apn._replace(), self.mip6._replace(context_id=1)), avp)
+        self.assertEqual(avp.dump(), create_apn_configuration_avp(self.apn, self.mip6).dump())
+        self.assertEqual((table.hits, table.misses), (1, 1))
+
+    def test__apn_change(self):
+        table = ApnConfigurationTable(maxsize=10)
+
+        avp = table.get(self.apn, self.mip6)
+        apn = self.apn._replace(qci=5)
+
+        self.assertIsNot(table.get(apn, self.mip6), avp)
+        self.assertEqual(table.get(apn, self.mip6).dump(), create_apn_configuration_avp(apn, self.mip6).dump())
+        self.assertEqual(len(table), 2)
+
+    def test__mip6_change(self):
+        table = ApnConfigurationTable(maxsize=10)
+
+        avp = table.get(self.apn, self.mip6)
+        mip6 = self.mip6._replace(destination_realm="epc.mynetwork.com", destination_host="pgw.epc.mynetwork.com")
+
+        self.assertIsNot(table.get(self.apn, mip6), avp)
+        self.assertEqual(table.get(self.apn, mip6).dump(), create_apn_configuration_avp(self.apn, mip6).dump())
+
+    def test__maxsize(self):
+        table = ApnConfigurationTable(maxsize=1)
+
+        table.get(self.apn, self.mip6)
+        table.get(self.apn._replace(apn_id=2), self.mip6)
+
+        self.assertEqual(len(table), 1)
+
+    def test__disabled(self):
+        table = ApnConfigurationTable()
+
+        self.assertIsNot(table.get(self.apn, self.mip6), table.get(self.apn, self.mip6))
+        self.assertEqual(len(table), 0)
+
+
 class TestCreateListOfApnConfigurationAvp(unittest.TestCase):
     def setUp(self):
         self.Mip6 = namedtuple("Mip6s", ["context_id", "service_selection", "destination_realm", "destination_host"])
@@ -1945,6 +2024,92 @@ class TestCreateSubscriptionData(unittest.TestCase):
         self.assertFalse(subscription_data[5].apn_configuration_avp.has_avp("mip6_agent_info_avp"))
 
 
+class TestSubscriptionDataCache(unittest.TestCase):
+    def setUp(self):
+        self.Mip6 = namedtuple("Mip6s", ["context_id", "service_selection", "destination_realm", "destination_host"])
+        self.Subscriber = namedtuple("Subscriber", ["msisdn", "stn_sr", "odb", "schar", "max_req_bw_ul", "max_req_bw_dl", "default_apn", "apns", "mip6s", "mme_hostname", "sqn"])
+        self.Apn = namedtuple("Apns", ["apn_id", "apn_name", "pdn_type", "qci", "priority_level", "max_req_bw_dl", "max_req_bw_ul"])
+
+        self.subscriber = self.Subscriber(msisdn=5521000000001,
+                                          stn_sr=5500599999999,
+                                          odb=None,
+                                          schar=8,
+                                          max_req_bw_ul=256,
+                                          max_req_bw_dl=256,
+                                          default_apn=1,
+                                          apns=(self.Apn(apn_id=1, apn_name="internet", pdn_type="IPv4", qci=9, priority_level=8, max_req_bw_dl=256, max_req_bw_ul=256),),
+                                          mip6s=(self.Mip6(context_id=1, service_selection="internet", destination_realm=None, destination_host=None),),
+                                          mme_hostname=None,
+                                          sqn=bytes.fromhex("000000000020"))
+
+    def dump(self, subscription_data):
+        return [avp.dump() for avp in subscription_data]
+
+    def test__hit(self):
+        cache = SubscriptionDataCache(maxsize=10)
+
+        subscription_data = cache.get("999000000000001", self.subscriber)
+
+        self.assertIs(cache.get("999000000000001", self.subscriber), subscription_data)
+        self.assertEqual(self.dump(subscription_data), self.dump(create_subscription_data(self.subscriber)))
+        self.assertEqual((cache.hits, cache.misses), (1, 1))
+
+    def test__dynamic_state_change(self):
+        cache = SubscriptionDataCache(maxsize=10)
+
+        subscription_data = cache.get("999000000000001", self.subscriber)
+        subscriber = self.subscriber._replace(mme_hostname="mme.epc.mynetwork.com", sqn=bytes.fromhex("000000000040"))
+
+        self.assertIs(cache.get("999000000000001", subscriber), subscription_data)
+
+    def test__static_profile_change(self):
+        cache = SubscriptionDataCache(maxsize=10)
+
+        subscription_data = cache.get("999000000000001", self.subscriber)
+        subscriber = self.subscriber._replace(odb="ODB-all-APN")
+
+        self.assertIsNot(cache.get("999000000000001", subscriber), subscription_data)
+        self.assertEqual(self.dump(cache.get("999000000000001", subscriber)), self.dump(create_subscription_data(subscriber)))
+
+    def test__mip6_change(self):
+        cache = SubscriptionDataCache(maxsize=10)
+
+        cache.get("999000000000001", self.subscriber)
+        mip6 = self.Mip6(context_id=1, service_selection="internet", destination_realm="epc.mynetwork.com", destination_host="pgw.epc.mynetwork.com")
+        subscriber = self.subscriber._replace(mip6s=(mip6,))
+
+        subscription_data = cache.get("999000000000001", subscriber)
+
+        self.assertEqual(self.dump(subscription_data), self.dump(create_subscription_data(subscriber)))
+        self.assertEqual(cache.misses, 2)
+
+    def test__maxsize(self):
+        cache = SubscriptionDataCache(maxsize=1)
+
+        cache.get("999000000000001", self.subscriber)
+        cache.get("999000000000002", self.subscriber)
+        cache.get("999000000000001", self.subscriber)
+
+        self.assertEqual(len(cache), 1)
+        self.assertEqual(cache.misses, 3)
+
+    def test__invalidate(self):
+        cache = SubscriptionDataCache(maxsize=10)
+
+        subscription_data = cache.get("999000000000001", self.subscriber)
+        cache.invalidate("999000000000001")
+
+        self.assertIsNot(cache.get("999000000000001", self.subscriber), subscription_data)
+
+    def test__disabled(self):
+        cache = SubscriptionDataCache()
+
+        subscription_data = cache.get("999000000000001", self.subscriber)
+
+        self.assertIsNot(cache.get("999000000000001", self.subscriber), subscription_data)
+        self.assertEqual(len(cache), 0)
+
+
 class TestCreateFeatureListAvp(unittest.TestCase):
     def test__create_feature_list_avp(self):
         feature_list_avp = create_feature_list_avp()
@@ -2761,5 +2926,101 @@ class TestCreateMissingAvpResponse(unittest.TestCase):
         self.assertEqual(ula.error_message_avp.data, b"User-Name AVP not found")
 
 
+class TestAnswerTemplates(unittest.TestCase):
+    def setUp(self):
+        basedir = os.path.dirname(os.path.abspath(__file__))
+        config_file = os.path.join(basedir, "config.yaml")
+
+        app = Bromelia(config_file=config_file)
+
+        #: Application initialization
+        msgs = [AIA, AIR, CLA, CLR, NOA, NOR, PUA, PUR, ULA, ULR]
+        app.load_messages_into_application_id(msgs, DIAMETER_APPLICATION_S6a_S6d)
+
+        self.aia = app.s6a.AIA
+        self.ula = app.s6a.ULA
+
+    def patch(self, answer, session_id):
+        #: Same fields patched by bromelia as per the request
+        answer.header.hop_by_hop = bytes.fromhex("0000beef")
+        answer.header.end_to_end = bytes.fromhex("0000cafe")
+        answer.header.set_error_bit(True)
+        answer.session_id_avp.data = session_id
+        answer.refresh()
+        return answer
+
+    def dump(self, answer):
+        return self.patch(answer, b"mme1.epc.mynetwork.com;1").dump()
+
+    def test__user_unknown(self):
+        templates = AnswerTemplates(self.aia)
+        aia = templates.get("user_unknown")
+
+        self.assertEqual(self.dump(aia), self.dump(create_user_unknown_response(proxy_response=self.aia)))
+        self.assertEqual(aia.experimental_result_avp.experimental_result_code_avp.data, DIAMETER_ERROR_USER_UNKNOWN)
+
+    def test__built_at_startup(self):
+        templates = AnswerTemplates(self.aia)
+
+        self.assertEqual(set(templates.templates), {(name,) for name in ERROR_ANSWER_TEMPLATES})
+
+    def test__copies_do_not_change_template(self):
+        templates = AnswerTemplates(self.aia)
+        dump = templates.get("user_unknown").dump()
+
+        aia1 = self.patch(templates.get("user_unknown"), b"mme1.epc.mynetwork.com;1")
+        aia2 = templates.get("user_unknown")
+
+        self.assertEqual(aia1.session_id_avp.data, b"mme1.epc.mynetwork.com;1")
+        self.assertEqual(aia1.header.hop_by_hop, bytes.fromhex("0000beef"))
+        self.assertEqual(aia2.dump(), dump)
+        self.assertIsNot(aia1.header, aia2.header)
+        self.assertIs(aia1.experimental_result_avp, aia2.experimental_result_avp)
+
+    def test__patched_copy_as_fresh_answer(self):
+        templates = AnswerTemplates(self.aia)
+
+        aia = self.patch(templates.get("user_unknown"), b"mme1.epc.mynetwork.com;1")
+        expected = self.patch(create_user_unknown_response(proxy_response=self.aia), b"mme1.epc.mynetwork.com;1")
+
+        self.assertEqual(aia.dump(), expected.dump())
+        self.assertEqual(aia.header.get_length(), len(expected.dump()))
+
+    def test__ula__kwargs(self):
+        templates = AnswerTemplates(self.ula, supported_features=create_supported_features(), ula_flags=0x00000001)
+
+        ula = templates.get("rat_not_allowed")
+        expected = create_rat_not_allowed_response(proxy_response=self.ula,
+                                                   supported_features=create_supported_features(),
+                                                   ula_flags=0x00000001)
+
+        self.assertEqual(self.dump(ula), self.dump(expected))
+        self.assertTrue(ula.has_avp("supported_features_avp"))
+
+    def test__ula__unknown_eps_subscription(self):
+        templates = AnswerTemplates(self.ula, supported_features=create_supported_features(), ula_flags=0x00000001)
+
+        ula = templates.get("unknown_eps_subscription")
+
+        self.assertEqual(self.dump(ula), self.dump(create_unknown_eps_subscription_response(proxy_response=self.ula)))
+
+    def test__roaming_not_allowed(self):
+        templates = AnswerTemplates(self.ula)
+
+        ula1 = templates.get("roaming_not_allowed", ERROR_DIAGNOSTIC_ODB_ALL_APN)
+        ula2 = templates.get("roaming_not_allowed", ERROR_DIAGNOSTIC_ODB_HPLMN_APN)
+
+        self.assertEqual(ula1.error_diagnostic_avp.data, ERROR_DIAGNOSTIC_ODB_ALL_APN)
+        self.assertEqual(ula2.error_diagnostic_avp.data, ERROR_DIAGNOSTIC_ODB_HPLMN_APN)
+        self.assertIn(("roaming_not_allowed", ERROR_DIAGNOSTIC_ODB_ALL_APN), templates.templates)
+
+    def test__response_generator(self):
+        templates = AnswerTemplates(self.aia)
+        r = ResponseGenerator(None, proxy_response=self.aia, templates=templates)
+
+        self.assertEqual(self.dump(r.unknown_serving_node()), self.dump(create_unknown_serving_node_response(proxy_response=self.aia)))
+        self.assertEqual(r.success().result_code_avp.data, DIAMETER_SUCCESS)
+
+
 if __name__ == "__main__":
     unittest.main()
\ No newline at end of file
@@ -0,0 +1,150 @@
+# -*- coding: utf-8 -*-
+"""
+    hss_app.test_vector_pool
+    ~~~~~~~~~~~~~~~~~~~~~~~~
+
+    This module contains the vector pool unittests.
+
+    :copyright: (c) 2021 Henrique Marques Ribeiro.
+    :license: MIT, see LICENSE for more details.
+"""
+
+import time
+import unittest
+
+from milenage import *
+from vector_pool import *
+
+
+IMSI = "999000000000001"
+KEY = bytes.fromhex("465b5ce8b199b49faa5f0a2ee238a6bc")
+OPC = bytes.fromhex("cd63cb71954a9f4e48a5994e37a02baf")
+AMF = bytes.fromhex("b9b9")
+SQN = bytes.fromhex("000000000020")
+PLMN = bytes.fromhex("27f450")
+
+
+def generate_vectors(num_of_vectors, key, opc, amf, sqn, plmn):
+    sqn_int = int.from_bytes(sqn, byteorder="big")
+    first_sqn = (sqn_int + 1).to_bytes(6, byteorder="big")
+    last_sqn = (sqn_int + num_of_vectors).to_bytes(6, byteorder="big")
+    return calculate_eutran_vectors(opc, key, amf, first_sqn, plmn, num_of_vectors, sqn_step=1), last_sqn
+
+
+class TestVectorPool(unittest.TestCase):
+    def create_pool(self, **kwargs):
+        pool = VectorPool(generate_vectors, **kwargs)
+        pool.track(IMSI, PLMN, KEY, OPC, AMF, SQN)
+        pool.refill(IMSI, PLMN)
+        return pool
+
+    def test__disabled(self):
+        pool = self.create_pool(depth=0)
+
+        self.assertFalse(pool.enabled)
+        self.assertEqual(pool.pop(IMSI, PLMN, KEY, OPC, AMF, SQN, 1), (None, None))
+        self.assertEqual(len(pool), 0)
+
+    def test__pop(self):
+        pool = self.create_pool(depth=4)
+
+        self.assertEqual(len(pool), 4)
+
+        vectors, sqn = pool.pop(IMSI, PLMN, KEY, OPC, AMF, SQN, 3)
+
+        self.assertEqual(len(vectors), 3)
+        self.assertEqual(sqn.hex(), "000000000023")
+        self.assertEqual(len(pool), 1)
+
+        for index, vector in enumerate(vectors, 1):
+            _sqn = (int.from_bytes(SQN, byteorder="big") + index).to_bytes(6, byteorder="big")
+            self.assertEqual(vector, calculate_eutran_vector(OPC, KEY, AMF, _sqn, PLMN, vector.rand))
+
+        vectors, sqn = pool.pop(IMSI, PLMN, KEY, OPC, AMF, sqn, 1)
+
+        self.assertEqual(len(vectors), 1)
+        self.assertEqual(sqn.hex(), "000000000024")
+
+    def test__refill__single_batch(self):
+        calls = list()
+
+        def generate(num_of_vectors, *args):
+            calls.append(num_of_vectors)
+            return generate_vectors(num_of_vectors, *args)
+
+        pool = VectorPool(generate, depth=4)
+        pool.track(IMSI, PLMN, KEY, OPC, AMF, SQN)
+        pool.refill(IMSI, PLMN)
+
+        self.assertEqual(calls, [4])
+        self.assertEqual(len(pool), 4)
+
+    def test__pop__not_enough_vectors(self):
+        pool = self.create_pool(depth=2)
+
+        self.assertEqual(pool.pop(IMSI, PLMN, KEY, OPC, AMF, SQN, 3), (None, None))
+        self.assertEqual(len(pool), 2)
+
+    def test__pop__sqn_mismatch(self):
+        pool = self.create_pool(depth=2)
+
+        sqn = bytes.fromhex("000000000030")
+
+        self.assertEqual(pool.pop(IMSI, PLMN, KEY, OPC, AMF, sqn, 1), (None, None))
+        self.assertEqual(len(pool), 0)
+
+    def test__pop__key_change(self):
+        pool = self.create_pool(depth=2)
+
+        key = bytes.fromhex("fec86ba6eb707ed08905757b1bb44b8f")
+
+        self.assertEqual(pool.pop(IMSI, PLMN, key, OPC, AMF, SQN, 1), (None, None))
+        self.assertEqual(len(pool), 0)
+
+    def test__pop__context(self):
+        pool = self.create_pool(depth=2)
+
+        vectors, sqn = pool.pop(IMSI, PLMN, MilenageContext(KEY), OPC, AMF, SQN, 1)
+
+        self.assertEqual(len(vectors), 1)
+
+    def test__ttl(self):
+        pool = self.create_pool(depth=2, ttl=0.01)
+
+        time.sleep(0.02)
+
+        self.assertEqual(pool.pop(IMSI, PLMN, KEY, OPC, AMF, SQN, 1), (None, None))
+        self.assertEqual(len(pool), 0)
+
+    def test__invalidate(self):
+        pool = self.create_pool(depth=2)
+        pool.invalidate(IMSI)
+
+        self.assertEqual(pool.pop(IMSI, PLMN, KEY, OPC, AMF, SQN, 1), (None, None))
+        self.assertEqual(len(pool), 0)
+
+    def test__max_memory(self):
+        pool = self.create_pool(depth=2, max_memory=3 * VECTOR_MEMORY_SIZE)
+
+        pool.track("999000000000002", PLMN, KEY, OPC, AMF, SQN)
+        pool.refill("999000000000002", PLMN)
+
+        self.assertEqual(len(pool), 2)
+        self.assertEqual(pool.pop(IMSI, PLMN, KEY, OPC, AMF, SQN, 1), (None, None))
+        self.assertIsNotNone(pool.pop("999000000000002", PLMN, KEY, OPC, AMF, SQN, 1)[0])
+
+    def test__background_refill(self):
+        pool = VectorPool(generate_vectors, depth=2)
+        pool.start()
+        pool.track(IMSI, PLMN, KEY, OPC, AMF, SQN)
+
+        for _ in range(100):
+            if len(pool) == 2:
+                break
+            time.sleep(0.01)
+
+        self.assertEqual(len(pool), 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
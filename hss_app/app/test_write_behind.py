@@ -0,0 +1,240 @@
+# -*- coding: utf-8 -*-
+"""
+    hss_app.test_write_behind
+    ~~~~~~~~~~~~~~~~~~~~~~~~~
+
+    This module contains the write-behind queue unittests.
+
+    :copyright: (c) 2021 Henrique Marques Ribeiro.
+    :license: MIT, see LICENSE for more details.
+"""
+
+import threading
+import time
+import unittest
+
+from write_behind import *
+
+
+class FakeDatabase:
+    def __init__(self):
+        self.batches = list()
+        self.failures = 0
+        self.event = threading.Event()
+
+    def apply(self, writes):
+        if self.failures > 0:
+            self.failures -= 1
+            raise RuntimeError("Database unavailable")
+
+        self.batches.append(writes)
+        self.event.set()
+
+    @property
+    def writes(self):
+        return [write for batch in self.batches for write in batch]
+
+
+class FakeCounters:
+    def __init__(self):
+        self.data = dict()
+
+    def incr(self, name, amount=1):
+        self.data[name] = self.data.get(name, 0) + amount
+
+    def gauge(self, name, value):
+        self.data[name] = value
+
+
+class TestWriteBehindQueue(unittest.TestCase):
+    def setUp(self):
+        self.database = FakeDatabase()
+
+    def create_queue(self, **kwargs):
+        queue = WriteBehindQueue(self.database.apply, **kwargs)
+        self.addCleanup(queue.stop)
+        return queue
+
+    def test__sync(self):
+        queue = self.create_queue()
+        queue.put(("mme", "999000000000001"), {"mme_hostname": "mme1"})
+
+        self.assertFalse(queue.enabled)
+        self.assertEqual(self.database.batches, [[(("mme", "999000000000001"), {"mme_hostname": "mme1"})]])
+        self.assertEqual(len(queue), 0)
+
+    def test__invalid_mode(self):
+        with self.assertRaises(ValueError) as cm:
+            WriteBehindQueue(self.database.apply, mode="lazy")
+
+        self.assertEqual(cm.exception.args[0], "Invalid write mode: lazy")
+
+    def test__async__coalesce(self):
+        queue = self.create_queue(mode=WRITE_MODE_ASYNC)
+        queue.put(("mme", "999000000000001"), {"mme_hostname": "mme1"})
+        queue.put(("mme", "999000000000002"), {"mme_hostname": "mme1"})
+        queue.put(("mme", "999000000000001"), {"mme_hostname": "mme2"})
+
+        self.assertEqual(self.database.batches, [])
+        self.assertEqual(len(queue), 2)
+        self.assertEqual(queue.num_of_writes, 3)
+        self.assertEqual(queue.num_of_coalesced_writes, 1)
+
+        queue.flush()
+
+        self.assertEqual(self.database.batches, [[(("mme", "999000000000001"), {"mme_hostname": "mme2"}),
+                                                  (("mme", "999000000000002"), {"mme_hostname": "mme1"})]])
+        self.assertEqual(queue.num_of_flushes, 1)
+
+    def test__async__max_batch_size(self):
+        queue = self.create_queue(mode=WRITE_MODE_ASYNC, max_batch_size=2)
+        for index in range(5):
+            queue.put(("mme", str(index)), {"mme_hostname": "mme1"})
+
+        queue.flush()
+
+        self.assertEqual([len(batch) for batch in self.database.batches], [2, 2, 1])
+
+    def test__async__max_size(self):
+        queue = self.create_queue(mode=WRITE_MODE_ASYNC, max_size=2)
+        for index in range(3):
+            queue.put(("mme", str(index)), {"mme_hostname": "mme1"})
+
+        self.assertEqual(self.database.batches, [[(("mme", "2"), {"mme_hostname": "mme1"})]])
+        self.assertEqual(len(queue), 2)
+        self.assertEqual(queue.num_of_overflows, 1)
+
+    def test__async__failure(self):
+        queue = self.create_queue(mode=WRITE_MODE_ASYNC)
+        queue.put(("mme", "1"), {"mme_hostname": "mme1"})
+        queue.put(("mme", "2"), {"mme_hostname": "mme1"})
+
+        self.database.failures = 1
+        queue.flush()
+
+        self.assertEqual(self.database.batches, [])
+        self.assertEqual(queue.num_of_failures, 1)
+        self.assertEqual(len(queue), 2)
+
+        #: A newer write is not replaced by the failed one
+        queue.put(("mme", "2"), {"mme_hostname": "mme2"})
+        queue.flush()
+
+        self.assertEqual(self.database.writes, [(("mme", "1"), {"mme_hostname": "mme1"}),
+                                                (("mme", "2"), {"mme_hostname": "mme2"})])
+
+    def test__async__background_flush(self):
+        queue = self.create_queue(mode=WRITE_MODE_ASYNC, max_delay=0.01)
+        queue.start()
+
+        start = time.monotonic()
+        queue.put(("mme", "1"), {"mme_hostname": "mme1"})
+
+        self.assertTrue(self.database.event.wait(2))
+        self.assertGreaterEqual(time.monotonic() - start, 0.01)
+        self.assertEqual(self.database.writes, [(("mme", "1"), {"mme_hostname": "mme1"})])
+        self.assertGreaterEqual(queue.max_flush_latency, 0.01)
+
+    def test__async__stop(self):
+        queue = self.create_queue(mode=WRITE_MODE_ASYNC, max_delay=60)
+        queue.start()
+        queue.put(("mme", "1"), {"mme_hostname": "mme1"})
+        queue.stop()
+
+        self.assertEqual(self.database.writes, [(("mme", "1"), {"mme_hostname": "mme1"})])
+
+        #: Writes put after the queue has stopped are applied synchronously
+        queue.put(("mme", "2"), {"mme_hostname": "mme1"})
+        self.assertEqual(len(self.database.batches), 2)
+
+    def test__group(self):
+        queue = self.create_queue(mode=WRITE_MODE_GROUP, max_delay=0.05)
+        queue.start()
+
+        threads = [threading.Thread(target=queue.put, args=(("mme", str(index)), {"mme_hostname": "mme1"}))
+                   for index in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join(2)
+
+        #: Callers only return once their write is committed
+        self.assertEqual(len(self.database.writes), 4)
+        self.assertEqual(len(self.database.batches), 1)
+        self.assertEqual(len(queue), 0)
+
+    def test__group__failure(self):
+        queue = self.create_queue(mode=WRITE_MODE_GROUP, max_delay=0.01)
+        queue.start()
+        self.database.failures = 1
+
+        with self.assertRaises(RuntimeError):
+            queue.put(("mme", "1"), {"mme_hostname": "mme1"})
+
+        queue.put(("mme", "1"), {"mme_hostname": "mme2"})
+        self.assertEqual(self.database.writes, [(("mme", "1"), {"mme_hostname": "mme2"})])
+
+    def test__group__not_started(self):
+        queue = self.create_queue(mode=WRITE_MODE_GROUP)
+        queue.put(("mme", "1"), {"mme_hostname": "mme1"})
+
+        self.assertEqual(self.database.writes, [(("mme", "1"), {"mme_hostname": "mme1"})])
+
+
+class TestWriteBehindQueueCounters(unittest.TestCase):
+    def setUp(self):
+        self.database = FakeDatabase()
+        self.counters = FakeCounters()
+
+    def create_queue(self, **kwargs):
+        queue = WriteBehindQueue(self.database.apply, counters=self.counters, prefix="subscriber_writes", **kwargs)
+        self.addCleanup(queue.stop)
+        return queue
+
+    def test__async(self):
+        queue = self.create_queue(mode=WRITE_MODE_ASYNC, max_size=2)
+        queue.put(("mme", "1"), {"mme_hostname": "mme1"})
+        queue.put(("mme", "1"), {"mme_hostname": "mme2"})
+        queue.put(("mme", "2"), {"mme_hostname": "mme1"})
+        queue.put(("mme", "3"), {"mme_hostname": "mme1"})
+
+        self.database.failures = 1
+        queue.flush()
+        queue.flush()
+
+        #: Callers never publish the metrics themselves
+        self.assertEqual(self.counters.data, dict())
+        queue.publish()
+
+        self.assertEqual(self.counters.data["subscriber_writes:num_of_writes"], 4)
+        self.assertEqual(self.counters.data["subscriber_writes:num_of_coalesced_writes"], 1)
+        self.assertEqual(self.counters.data["subscriber_writes:num_of_overflows"], 1)
+        self.assertEqual(self.counters.data["subscriber_writes:num_of_failures"], 1)
+        self.assertEqual(self.counters.data["subscriber_writes:num_of_flushes"], 1)
+        self.assertEqual(self.counters.data["subscriber_writes:max_flush_latency"], int(queue.max_flush_latency * 1000000))
+
+    def test__sync(self):
+        queue = self.create_queue()
+        queue.start()
+        queue.put(("mme", "1"), {"mme_hostname": "mme1"})
+        queue.stop()
+
+        self.assertEqual(self.counters.data["subscriber_writes:num_of_writes"], 1)
+        self.assertEqual(self.counters.data["subscriber_writes:num_of_flushes"], 0)
+
+    def test__background_publish(self):
+        queue = self.create_queue(mode=WRITE_MODE_ASYNC, max_delay=0.01, publish_interval=0.01)
+        queue.start()
+        queue.put(("mme", "1"), {"mme_hostname": "mme1"})
+
+        for _ in range(100):
+            if self.counters.data.get("subscriber_writes:num_of_flushes") == 1:
+                break
+            time.sleep(0.01)
+
+        self.assertEqual(self.counters.data["subscriber_writes:num_of_writes"], 1)
+        self.assertEqual(self.counters.data["subscriber_writes:num_of_flushes"], 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
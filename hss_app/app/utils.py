@@ -9,8 +9,11 @@
     :license: MIT, see LICENSE for more details.
 """
 
+import copy
+import logging
 import re
-import time
+import threading
+from collections import OrderedDict
 
 from bromelia._internal_utils import convert_to_6_bytes
 from bromelia._internal_utils import convert_to_integer_from_bytes
@@ -22,11 +25,15 @@ from bromelia.exceptions import DiameterMissingAvp
 from bromelia.exceptions import DiameterInvalidAvpValue
 from bromelia.lib.etsi_3gpp_s6a import *
 
+from config import Config
 from milenage import *
+from milenage_engine import MilenageEngine
 from models import Apn
 from models import Subscriber
 from models import Mip6
 
+utils_logger = logging.getLogger("3gpp_hss")
+
 
 pdn_types = {
                 "IPv4": PDN_TYPE_IPV4, 
@@ -69,6 +76,22 @@ schars = {
         15: bytes.fromhex("30663030"),      # 0x0f00
 }
 
+#: SQN increment between consecutive vectors, i.e. SEQ is incremented by one
+#: and IND is left at zero as per 3GPP TS 33.102 Annex C.3.2 with a 5-bit IND
+SQN_STEP = 32
+
+#: Selected before any subscriber context is created and before the worker
+#: processes are forked, so all of them share the same backend
+utils_logger.info(f"Milenage crypto backend: {set_crypto_backend(Config.MILENAGE_CRYPTO_BACKEND)}")
+
+#: Expanded subscriber keys (K) shared along AIR requests
+milenage_contexts = MilenageContextCache(maxsize=Config.MILENAGE_CONTEXT_CACHE_SIZE)
+
+#: Engine which runs vectors calculation, inline or on worker processes
+milenage_engine = MilenageEngine(mode=Config.MILENAGE_ENGINE,
+                                 pool_size=Config.MILENAGE_POOL_SIZE,
+                                 min_batch_size=Config.MILENAGE_POOL_MIN_BATCH_SIZE)
+
 
 def get_imsi(request: DiameterRequest) -> str:
     if not request.has_avp("user_name_avp"):
@@ -117,17 +140,20 @@ def get_immediate_response_preferred(request: DiameterRequest) -> int:
     return int.from_bytes(res_preferred, byteorder="big")
 
 
-"REVIEW SQN CALCULATION"
 def generate_vectors(num_of_vectors: int, key: bytes, opc: bytes, amf: bytes, sqn: bytes, plmn: bytes) -> tuple[list, bytes]:
-    sqn_int = convert_to_integer_from_bytes(sqn)
+    """Generate vectors on the SQNs following the given one, one SQN_STEP
+    apart from each other.
 
-    vectors = list()
-    for _ in range(num_of_vectors):
-        sqn = convert_to_6_bytes(sqn_int + int(time.time()/10000000))
-        vector = calculate_eutran_vector(key, opc, amf, sqn, plmn)
-        vectors.append(vector)
+    :returns:
+        - vectors - list of Vector namedtuple
+        - sqn - SQN of the last vector, to be persisted
+    """
+    sqn_int = convert_to_integer_from_bytes(sqn)
+    first_sqn = convert_to_6_bytes((sqn_int + SQN_STEP) & MASK_48)
+    last_sqn = convert_to_6_bytes((sqn_int + num_of_vectors * SQN_STEP) & MASK_48)
 
-    return vectors, sqn
+    vectors = milenage_engine.calculate_eutran_vectors(opc, key, amf, first_sqn, plmn, num_of_vectors, SQN_STEP)
+    return vectors, last_sqn
 
 
 def generate_authentication_info_avp_data(vectors: list) -> list:
@@ -270,10 +296,81 @@ def create_apn_configuration_avp(apn: Apn, mip6: Mip6) -> ApnConfigurationAVP:
     ])
 
 
+class ApnConfigurationTable:
+    """Interning table of APN-Configuration AVPs. Subscribers sharing an APN
+    and its MIP6 state share a single AVP, which is built once and holds its
+    encoded form, so it must not be modified.
+
+    :param maxsize: maximum number of distinct APN-Configuration AVPs kept in
+                    memory, 0 disables the table
+    """
+    def __init__(self, maxsize: int = 0) -> None:
+        self.maxsize = maxsize
+
+        self.hits = 0
+        self.misses = 0
+
+        self._avps = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._avps)
+
+    def get(self, apn: Apn, mip6: Mip6) -> ApnConfigurationAVP:
+        """Get the APN-Configuration AVP of an APN, building it only if no 
+        other subscriber has the same one.
+
+        :param apn: Apn object or ApnSnapshot namedtuple
+        :param mip6: Mip6 object or Mip6Snapshot namedtuple
+
+        :returns: ApnConfigurationAVP object
+        """
+        if self.maxsize <= 0:
+            return create_apn_configuration_avp(apn, mip6)
+
+        key = (apn.apn_id,
+               apn.apn_name,
+               apn.pdn_type,
+               apn.qci,
+               apn.priority_level,
+               apn.max_req_bw_dl,
+               apn.max_req_bw_ul,
+               mip6.destination_realm,
+               mip6.destination_host)
+
+        with self._lock:
+            avp = self._avps.get(key)
+            if avp is not None:
+                self._avps.move_to_end(key)
+                self.hits += 1
+                return avp
+
+            self.misses += 1
+
+        avp = create_apn_configuration_avp(apn, mip6)
+
+        with self._lock:
+            avp = self._avps.setdefault(key, avp)
+            self._avps.move_to_end(key)
+            while len(self._avps) > self.maxsize:
+                self._avps.popitem(last=False)
+
+        return avp
+
+    def clear(self) -> None:
+        """Drop all APN-Configuration AVPs."""
+        with self._lock:
+            self._avps.clear()
+
+
+#: APN-Configuration AVPs shared by all the subscribers
+apn_configurations = ApnConfigurationTable(maxsize=Config.APN_CONFIGURATION_TABLE_SIZE)
+
+
 def create_list_of_apn_configuration_avp(subscriber: Subscriber) -> list:
     apn_config_avps = list()
     for apn, mip6 in zip(subscriber.apns, subscriber.mip6s):
-        apn_config_avp = create_apn_configuration_avp(apn, mip6)
+        apn_config_avp = apn_configurations.get(apn, mip6)
         apn_config_avps.append(apn_config_avp)
     return apn_config_avps
 
@@ -326,6 +423,104 @@ def create_subscription_data(subscriber: Subscriber) -> list:
     ]
 
 
+def get_subscription_profile_version(subscriber: Subscriber) -> tuple:
+    """Get every subscriber attribute Subscription-Data is built from.
+
+    :param subscriber: Subscriber object or SubscriberSnapshot namedtuple
+
+    :returns: tuple which compares equal as long as Subscription-Data would
+              not change
+    """
+    return (subscriber.msisdn,
+            subscriber.stn_sr,
+            subscriber.odb,
+            subscriber.schar,
+            subscriber.max_req_bw_ul,
+            subscriber.max_req_bw_dl,
+            subscriber.default_apn,
+            tuple(subscriber.apns),
+            tuple(subscriber.mip6s))
+
+
+class SubscriptionDataCache:
+    """Bounded LRU of the Subscription-Data AVPs sent in ULA, keyed by 
+    subscriber. Each entry is tagged with the profile version it was built 
+    from, so a change to the static profile or to the MIP6 state is noticed on
+    the next ULR, while MME and SQN updates keep the entry.
+
+    AVPs are shared by all the answers built from the same entry, so they must
+    not be modified.
+
+    :param maxsize: maximum number of subscribers kept in memory, 0 disables
+                    the cache
+    """
+    def __init__(self, maxsize: int = 0) -> None:
+        self.maxsize = maxsize
+
+        self.hits = 0
+        self.misses = 0
+
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self) -> bool:
+        return self.maxsize > 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, imsi: str, subscriber: Subscriber) -> list:
+        """Get the Subscription-Data AVPs of a subscriber, building them only
+        on a cache miss or when the subscriber profile has changed.
+
+        :param imsi: subscriber IMSI
+        :param subscriber: Subscriber object or SubscriberSnapshot namedtuple
+
+        :returns: list of AVPs to be sent within Subscription-Data AVP
+        """
+        if not self.enabled:
+            return create_subscription_data(subscriber)
+
+        version = get_subscription_profile_version(subscriber)
+
+        with self._lock:
+            entry = self._entries.get(imsi)
+            if entry is not None and entry[0] == version:
+                self._entries.move_to_end(imsi)
+                self.hits += 1
+                return entry[1]
+
+            self.misses += 1
+
+        subscription_data = create_subscription_data(subscriber)
+
+        with self._lock:
+            self._entries[imsi] = (version, subscription_data)
+            self._entries.move_to_end(imsi)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+        return subscription_data
+
+    def invalidate(self, imsi: str) -> None:
+        """Drop the Subscription-Data AVPs of a subscriber, if any.
+
+        :param imsi: subscriber IMSI
+        """
+        with self._lock:
+            self._entries.pop(imsi, None)
+
+    def clear(self) -> None:
+        """Drop all Subscription-Data AVPs."""
+        with self._lock:
+            self._entries.clear()
+
+
+#: Subscription-Data AVPs sent in ULA, rebuilt only on profile changes
+subscription_data_cache = SubscriptionDataCache(maxsize=Config.SUBSCRIPTION_DATA_CACHE_SIZE)
+
+
 def create_feature_list_avp() -> FeatureListAVP:
     feature_list_avp = FeatureListAVP()
     feature_list_avp.set_bit(0)             # Operator Determined Barring of all Packet Oriented Services
@@ -563,9 +758,10 @@ def create_success_response(proxy_response, **kwargs):
 
 "PEDING UNITTESTS"
 class ResponseGenerator:
-    def __init__(self, request: DiameterRequest, proxy_response):
+    def __init__(self, request: DiameterRequest, proxy_response, templates=None):
         self.request = request
         self.proxy_response = proxy_response
+        self.templates = templates
         self.kwargs = {}
 
 
@@ -582,18 +778,26 @@ class ResponseGenerator:
 
     
     def user_unknown(self):
+        if self.templates is not None:
+            return self.templates.get("user_unknown")
         return create_user_unknown_response(self.proxy_response, **self.kwargs)
 
     
     def unknown_serving_node(self):
+        if self.templates is not None:
+            return self.templates.get("unknown_serving_node")
         return create_unknown_serving_node_response(self.proxy_response, **self.kwargs)
 
 
     def rat_not_allowed(self):
+        if self.templates is not None:
+            return self.templates.get("rat_not_allowed")
         return create_rat_not_allowed_response(self.proxy_response, **self.kwargs)
 
 
     def roaming_not_allowed(self, msg: str):
+        if self.templates is not None:
+            return self.templates.get("roaming_not_allowed", msg)
         return create_roaming_not_allowed_response(self.proxy_response, msg, **self.kwargs)
 
 
@@ -602,6 +806,8 @@ class ResponseGenerator:
 
 
     def unknown_eps_subscription(self):
+        if self.templates is not None:
+            return self.templates.get("unknown_eps_subscription")
         return create_unknown_eps_subscription_response(self.proxy_response)
 
 
@@ -610,4 +816,85 @@ class ResponseGenerator:
 
 
     def success(self, **kwargs):
-        return create_success_response(self.proxy_response, **self.kwargs, **kwargs)
\ No newline at end of file
+        return create_success_response(self.proxy_response, **self.kwargs, **kwargs)
+
+
+class AnswerTemplate:
+    """Answer built once and copied for every request. bromelia patches the
+    hop-by-hop, end-to-end and Session-Id of the answer as per the request,
+    so each copy only gets its own header and Session-Id AVP. Every other AVP
+    object is shared by the copies and must not be changed.
+
+    :param answer: DiameterAnswer object
+    """
+    def __init__(self, answer) -> None:
+        self.answer = answer
+        self._session_id_index = next(index for index, avp in enumerate(answer.avps)
+                                            if avp is answer.session_id_avp)
+
+    def create(self):
+        """Copy the answer.
+
+        :returns: DiameterAnswer object
+        """
+        answer = copy.copy(self.answer)
+        answer.header = copy.copy(self.answer.header)
+
+        session_id_avp = SessionIdAVP(self.answer.session_id_avp.data)
+        answer._avps = list(self.answer._avps)
+        answer._avps[self._session_id_index] = session_id_avp
+        answer.session_id_avp = session_id_avp
+        return answer
+
+
+class AnswerTemplates:
+    """Error answers of a single command, which do not depend on the request
+    but for the fields patched by bromelia. Unknown IMSI floods, e.g. from a
+    misconfigured MME, are answered with copies of the same answer rather
+    than building its AVPs from scratch each time.
+
+    The answers without arguments are built right away, the Error-Diagnostic
+    variants on first use.
+
+    :param proxy_response: function which creates the answer, e.g.
+                           app.s6a.AIA
+    :param kwargs: AVPs loaded into the ResponseGenerator, e.g. the ULA
+                   Supported-Features
+    """
+    def __init__(self, proxy_response, **kwargs) -> None:
+        self.proxy_response = proxy_response
+        self.kwargs = kwargs
+        self.templates = dict()
+
+        for name in ERROR_ANSWER_TEMPLATES:
+            self.get(name)
+
+    def get(self, name: str, *args):
+        """Create an answer from its template.
+
+        :param name: ResponseGenerator method which builds the answer
+        :param args: arguments of the method, e.g. the Error-Diagnostic of
+                     roaming_not_allowed
+
+        :returns: DiameterAnswer object
+        """
+        key = (name, *args)
+        template = self.templates.get(key)
+
+        if template is None:
+            generator = ResponseGenerator(None, self.proxy_response)
+            generator.load_avps(**self.kwargs)
+
+            template = AnswerTemplate(getattr(generator, name)(*args))
+            self.templates[key] = template
+
+        return template.create()
+
+
+#: ResponseGenerator methods built by AnswerTemplates at startup
+ERROR_ANSWER_TEMPLATES = (
+    "user_unknown",
+    "unknown_serving_node",
+    "rat_not_allowed",
+    "unknown_eps_subscription",
+)
@@ -0,0 +1,252 @@
+# -*- coding: utf-8 -*-
+"""
+    hss_app.vector_pool
+    ~~~~~~~~~~~~~~~~~~~
+
+    This module implements a per subscriber pool of pre-generated E-UTRAN
+    vectors, which is refilled by a background thread off the AIR path.
+
+    :copyright: (c) 2021-present Henrique Marques Ribeiro.
+    :license: MIT, see LICENSE for more details.
+"""
+
+import logging
+import queue
+import threading
+import time
+from collections import deque, OrderedDict
+
+from milenage import MASK_48
+from milenage import MilenageContext
+
+pool_logger = logging.getLogger("3gpp_hss")
+
+#: Rough memory footprint of a single pooled vector, including the Python
+#: objects overhead, used to enforce the pool max memory.
+VECTOR_MEMORY_SIZE = 512
+
+
+class PoolEntry:
+    """Pooled vectors of a subscriber for a given visited PLMN, along with the
+    material they have been generated from.
+
+    :param key: 128-bit subscriber key or its MilenageContext
+    :param opc: 128-bit value derived from OP & K
+    :param amf: 16-bit authentication management field
+    :param sqn: 48-bit sequence number persisted for the subscriber
+    """
+    __slots__ = ("key", "opc", "amf", "sqn", "high_water_mark", "vectors")
+
+    def __init__(self, key: bytes, opc: bytes, amf: bytes, sqn: bytes) -> None:
+        self.key = key
+        self.opc = opc
+        self.amf = amf
+        self.sqn = sqn
+        self.high_water_mark = sqn
+        self.vectors = deque()
+
+    def has_material(self, key: bytes, opc: bytes, amf: bytes) -> bool:
+        return get_raw_key(self.key) == get_raw_key(key) and \
+               self.opc == opc and \
+               self.amf == amf
+
+
+def get_raw_key(key: bytes) -> bytes:
+    if isinstance(key, MilenageContext):
+        return key.key
+    return key
+
+
+class VectorPool:
+    """Keeps up to depth ready E-UTRAN vectors per subscriber and visited PLMN.
+    Each pooled vector is generated on its own SQN, so popped vectors can be
+    handed out in any number of AIRs. The pool of a subscriber is dropped
+    whenever its key material or its persisted SQN does not match anymore.
+
+    :param generate: function with the same signature of utils.generate_vectors
+    :param depth: number of vectors kept per subscriber, 0 disables the pool
+    :param ttl: seconds a pooled vector remains valid
+    :param max_memory: memory budget in bytes for all pooled vectors
+    :param sqn_step: SQN increment between consecutive generated vectors
+    """
+    def __init__(self, generate, depth: int = 0, ttl: float = 300, max_memory: int = 8 * 1024 * 1024, sqn_step: int = 1) -> None:
+        self.generate = generate
+        self.sqn_step = sqn_step
+        self.depth = depth
+        self.ttl = ttl
+        self.max_vectors = max_memory // VECTOR_MEMORY_SIZE
+
+        self._entries = OrderedDict()
+        self._num_of_vectors = 0
+        self._lock = threading.Lock()
+        self._pending = set()
+        self._queue = queue.Queue()
+        self._thread = None
+
+    @property
+    def enabled(self) -> bool:
+        return self.depth > 0
+
+    def __len__(self) -> int:
+        return self._num_of_vectors
+
+    def start(self) -> None:
+        """Start the background thread which refills the pools."""
+        if not self.enabled or self._thread is not None:
+            return
+
+        self._thread = threading.Thread(name="vector_pool_refill",
+                                        target=self._run,
+                                        daemon=True)
+        self._thread.start()
+
+    def pop(self, imsi: str, plmn: bytes, key: bytes, opc: bytes, amf: bytes, sqn: bytes, num_of_vectors: int) -> tuple:
+        """Pop ready vectors for the subscriber. On a miss the caller is
+        expected to generate the vectors inline and track the subscriber.
+
+        :param imsi: subscriber IMSI
+        :param plmn: 24-bit visited network identifier
+        :param key: 128-bit subscriber key or its MilenageContext
+        :param opc: 128-bit value derived from OP & K
+        :param amf: 16-bit authentication management field
+        :param sqn: 48-bit sequence number persisted for the subscriber
+        :param num_of_vectors: number of vectors requested
+
+        :returns:
+            - vectors - list of Vector namedtuple, None on a miss
+            - sqn - SQN high-water mark to be persisted, None on a miss
+        """
+        if not self.enabled:
+            return None, None
+
+        with self._lock:
+            entry = self._entries.get((imsi, plmn))
+
+            if entry is None:
+                return None, None
+
+            if entry.sqn != sqn or not entry.has_material(key, opc, amf):
+                self._drop(imsi, plmn)
+                return None, None
+
+            self._entries.move_to_end((imsi, plmn))
+            self._expire(entry)
+
+            if len(entry.vectors) < num_of_vectors:
+                self._schedule(imsi, plmn)
+                return None, None
+
+            vectors = list()
+            for _ in range(num_of_vectors):
+                _, vector, vector_sqn = entry.vectors.popleft()
+                vectors.append(vector)
+
+            self._num_of_vectors -= num_of_vectors
+            entry.sqn = vector_sqn
+            self._schedule(imsi, plmn)
+
+            return vectors, vector_sqn
+
+    def track(self, imsi: str, plmn: bytes, key: bytes, opc: bytes, amf: bytes, sqn: bytes) -> None:
+        """Start or restart the pool of a subscriber from the SQN which has
+        just been persisted.
+
+        :param imsi: subscriber IMSI
+        :param plmn: 24-bit visited network identifier
+        :param key: 128-bit subscriber key or its MilenageContext
+        :param opc: 128-bit value derived from OP & K
+        :param amf: 16-bit authentication management field
+        :param sqn: 48-bit sequence number persisted for the subscriber
+        """
+        if not self.enabled:
+            return
+
+        with self._lock:
+            self._drop(imsi, plmn)
+            self._entries[(imsi, plmn)] = PoolEntry(key, opc, amf, sqn)
+            self._schedule(imsi, plmn)
+
+    def invalidate(self, imsi: str) -> None:
+        """Drop all the pools of a subscriber, e.g. after a resynchronisation
+        or a key change.
+
+        :param imsi: subscriber IMSI
+        """
+        with self._lock:
+            for _imsi, plmn in list(self._entries.keys()):
+                if _imsi == imsi:
+                    self._drop(_imsi, plmn)
+
+    def clear(self) -> None:
+        """Drop all the pools."""
+        with self._lock:
+            self._entries.clear()
+            self._num_of_vectors = 0
+
+    def refill(self, imsi: str, plmn: bytes) -> None:
+        """Top up the pool of a subscriber to its depth. Vectors are generated
+        out of the lock and discarded if the pool changed meanwhile.
+
+        :param imsi: subscriber IMSI
+        :param plmn: 24-bit visited network identifier
+        """
+        with self._lock:
+            self._pending.discard((imsi, plmn))
+            entry = self._entries.get((imsi, plmn))
+
+            if entry is None:
+                return
+
+            self._expire(entry)
+            num_of_vectors = self.depth - len(entry.vectors)
+            sqn = entry.high_water_mark
+
+        if num_of_vectors <= 0:
+            return
+
+        vectors, last_sqn = self.generate(num_of_vectors, entry.key, entry.opc, entry.amf, sqn, plmn)
+
+        now = time.monotonic()
+        sqn_int = int.from_bytes(sqn, byteorder="big")
+        pooled_vectors = list()
+        for index, vector in enumerate(vectors, 1):
+            vector_sqn = ((sqn_int + index * self.sqn_step) & MASK_48).to_bytes(6, byteorder="big")
+            pooled_vectors.append((now, vector, vector_sqn))
+
+        with self._lock:
+            if self._entries.get((imsi, plmn)) is not entry:
+                return
+
+            entry.vectors.extend(pooled_vectors)
+            entry.high_water_mark = last_sqn
+            self._num_of_vectors += len(pooled_vectors)
+            self._evict()
+
+    def _run(self) -> None:
+        while True:
+            imsi, plmn = self._queue.get()
+            try:
+                self.refill(imsi, plmn)
+            except Exception as e:
+                pool_logger.exception(f"Unable to refill vector pool (IMSI: {imsi}): {e}")
+
+    def _schedule(self, imsi: str, plmn: bytes) -> None:
+        if (imsi, plmn) not in self._pending:
+            self._pending.add((imsi, plmn))
+            self._queue.put((imsi, plmn))
+
+    def _expire(self, entry: PoolEntry) -> None:
+        deadline = time.monotonic() - self.ttl
+        while entry.vectors and entry.vectors[0][0] < deadline:
+            entry.vectors.popleft()
+            self._num_of_vectors -= 1
+
+    def _drop(self, imsi: str, plmn: bytes) -> None:
+        entry = self._entries.pop((imsi, plmn), None)
+        if entry is not None:
+            self._num_of_vectors -= len(entry.vectors)
+
+    def _evict(self) -> None:
+        while self._num_of_vectors > self.max_vectors and self._entries:
+            imsi, plmn = next(iter(self._entries))
+            self._drop(imsi, plmn)
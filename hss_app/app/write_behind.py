@@ -0,0 +1,268 @@
+# -*- coding: utf-8 -*-
+"""
+    hss_app.write_behind
+    ~~~~~~~~~~~~~~~~~~~~
+
+    This module implements a write-behind queue, which takes the subscriber
+    state updates off the Diameter handler threads and commits them to the
+    database in batches from a background thread. The same queue provides
+    group commit, where handlers wait for the batch of their updates.
+
+    :copyright: (c) 2021-present Henrique Marques Ribeiro.
+    :license: MIT, see LICENSE for more details.
+"""
+
+import logging
+import threading
+import time
+from collections import OrderedDict
+
+writes_logger = logging.getLogger("3gpp_hss")
+
+WRITE_MODE_SYNC = "sync"
+WRITE_MODE_ASYNC = "async"
+WRITE_MODE_GROUP = "group"
+
+
+class GroupCommitWaiter:
+    """Handlers waiting for the same pending write."""
+    __slots__ = ("event", "error")
+
+    def __init__(self) -> None:
+        self.event = threading.Event()
+        self.error = None
+
+
+class WriteBehindQueue:
+    """Pending writes keyed by what they update, e.g. the MME of an IMSI, so
+    a write replaces any pending write to the same key and only the last one
+    reaches the database.
+
+    Writes are flushed once the oldest one has waited max_delay seconds or
+    max_batch_size of them are pending, whichever comes first. Once max_size
+    writes are pending, further ones are applied synchronously by the caller
+    rather than dropped.
+
+    In "async" mode the caller returns as soon as its write is queued, and a
+    failed batch is retried after max_delay seconds, unless its writes have
+    been replaced meanwhile. In "group" mode the caller waits until the batch
+    of its write is committed, and gets its error if the batch fails.
+
+    With counters, the background thread sets the metrics of the queue as
+    gauges after each flush and every publish_interval seconds, so callers
+    never wait on Redis: <prefix>:num_of_writes, :num_of_coalesced_writes,
+    :num_of_overflows, :num_of_flushes, :num_of_failures and
+    :max_flush_latency, in microseconds.
+
+    :param apply: function which commits a list of (key, values) tuples in a
+                  single transaction
+    :param mode: "sync" applies writes synchronously, "async" queues them and
+                 "group" batches the writes of concurrent callers
+    :param max_size: max number of pending writes
+    :param max_batch_size: max number of writes per transaction
+    :param max_delay: seconds a write may wait before it is flushed
+    :param counters: CounterDB object where the metrics are published
+    :param prefix: prefix of the metric names
+    :param publish_interval: seconds between publications of the metrics
+    """
+    def __init__(self, apply, mode: str = WRITE_MODE_SYNC, max_size: int = 10000, max_batch_size: int = 500, max_delay: float = 0.05, counters=None, prefix: str = "writes", publish_interval: float = 1) -> None:
+        if mode not in (WRITE_MODE_SYNC, WRITE_MODE_ASYNC, WRITE_MODE_GROUP):
+            raise ValueError(f"Invalid write mode: {mode}")
+
+        self.apply = apply
+        self.mode = mode
+        self.max_size = max_size
+        self.max_batch_size = max_batch_size
+        self.max_delay = max_delay
+        self.counters = counters
+        self.prefix = prefix
+        self.publish_interval = publish_interval
+
+        self.num_of_writes = 0
+        self.num_of_coalesced_writes = 0
+        self.num_of_overflows = 0
+        self.num_of_flushes = 0
+        self.num_of_failures = 0
+        self.max_flush_latency = 0
+
+        self._pending = OrderedDict()
+        self._since = dict()
+        self._waiters = dict()
+        self._condition = threading.Condition()
+        self._stopped = False
+        self._thread = None
+        self._published = dict()
+
+    @property
+    def enabled(self) -> bool:
+        return self.mode != WRITE_MODE_SYNC
+
+    def __len__(self) -> int:
+        return len(self._pending)
+
+    def start(self) -> None:
+        """Start the background thread which flushes the writes and
+        publishes the metrics."""
+        if (not self.enabled and self.counters is None) or self._thread is not None:
+            return
+
+        self._thread = threading.Thread(name="write_behind",
+                                        target=self._run,
+                                        daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: float = 5) -> None:
+        """Flush the pending writes, stop the background thread and publish
+        the last metrics, e.g. on shutdown.
+
+        :param timeout: seconds to wait for the pending writes
+        """
+        with self._condition:
+            self._stopped = True
+            self._condition.notify_all()
+
+        if self._thread is not None:
+            self._thread.join(timeout)
+        self.publish()
+
+    def put(self, key: tuple, values: dict) -> None:
+        """Queue a write, or apply it right away if the queue is disabled or
+        full. In "group" mode, wait until the write is committed.
+
+        :param key: what the write updates, e.g. ("mme", imsi)
+        :param values: values to be written
+        """
+        queued, waiter = False, None
+
+        with self._condition:
+            self.num_of_writes += 1
+
+            #: Group commit needs the background thread, or nobody would
+            #: release the waiters
+            if self.enabled and not self._stopped and \
+               (self.mode != WRITE_MODE_GROUP or self._thread is not None):
+                if key in self._pending:
+                    self.num_of_coalesced_writes += 1
+                    self._pending[key] = values
+                    queued, waiter = True, self._waiters.get(key)
+
+                elif len(self._pending) < self.max_size:
+                    self._pending[key] = values
+                    self._since[key] = time.monotonic()
+
+                    if self.mode == WRITE_MODE_GROUP:
+                        self._waiters[key] = GroupCommitWaiter()
+                    queued, waiter = True, self._waiters.get(key)
+
+                    if len(self._pending) in (1, self.max_batch_size):
+                        self._condition.notify()
+
+                else:
+                    self.num_of_overflows += 1
+
+        if not queued:
+            return self.apply([(key, values)])
+
+        if waiter is not None:
+            waiter.event.wait()
+            if waiter.error is not None:
+                raise waiter.error
+
+    def flush(self) -> None:
+        """Apply every pending write, until a batch fails."""
+        while True:
+            batch = self._pop_batch()
+            if not batch or not self._flush(batch):
+                return
+
+    def _pop_batch(self) -> list:
+        with self._condition:
+            batch = list()
+            while self._pending and len(batch) < self.max_batch_size:
+                key, values = self._pending.popitem(last=False)
+                batch.append((key, values, self._since.pop(key), self._waiters.pop(key, None)))
+            return batch
+
+    def _release(self, batch: list, error: Exception = None) -> None:
+        for _, _, _, waiter in batch:
+            if waiter is not None:
+                waiter.error = error
+                waiter.event.set()
+
+    def _flush(self, batch: list) -> bool:
+        try:
+            self.apply([(key, values) for key, values, _, _ in batch])
+
+        except Exception as e:
+            writes_logger.exception(f"Unable to flush {len(batch)} subscriber writes: {e}")
+            self.num_of_failures += 1
+
+            if self.mode == WRITE_MODE_GROUP:
+                self._release(batch, e)
+                return False
+
+            #: Writes put meanwhile are newer than the failed ones
+            with self._condition:
+                for key, values, since, _ in reversed(batch):
+                    if key not in self._pending:
+                        self._pending[key] = values
+                        self._pending.move_to_end(key, last=False)
+                        self._since[key] = since
+            return False
+
+        now = time.monotonic()
+        self.num_of_flushes += 1
+        self.max_flush_latency = max(self.max_flush_latency, max(now - since for _, _, since, _ in batch))
+
+        self._release(batch)
+        return True
+
+    def publish(self) -> None:
+        """Set the metrics which changed since they were last published."""
+        if self.counters is None:
+            return
+
+        metrics = {
+            "num_of_writes": self.num_of_writes,
+            "num_of_coalesced_writes": self.num_of_coalesced_writes,
+            "num_of_overflows": self.num_of_overflows,
+            "num_of_flushes": self.num_of_flushes,
+            "num_of_failures": self.num_of_failures,
+            "max_flush_latency": int(self.max_flush_latency * 1000000),
+        }
+
+        for name, value in metrics.items():
+            if self._published.get(name) != value:
+                self.counters.gauge(f"{self.prefix}:{name}", value)
+        self._published = metrics
+
+    def _run(self) -> None:
+        while True:
+            self.publish()
+
+            with self._condition:
+                if not self._pending and not self._stopped:
+                    self._condition.wait(self.publish_interval)
+
+                if not self._pending:
+                    if self._stopped:
+                        return
+                    continue
+
+                #: The oldest write sets the deadline of the batch
+                while not self._stopped and len(self._pending) < self.max_batch_size:
+                    timeout = self._since[next(iter(self._pending))] + self.max_delay - time.monotonic()
+                    if timeout <= 0:
+                        break
+                    self._condition.wait(timeout)
+
+                if self._stopped and not self._pending:
+                    return
+
+            if not self._flush(self._pop_batch()):
+                time.sleep(self.max_delay)
+
+                #: Failed group commits are not retried, so the writes left
+                #: still have their waiters
+                if self._stopped and self.mode != WRITE_MODE_GROUP:
+                    return
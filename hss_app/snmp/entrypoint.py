@@ -62,6 +62,33 @@ MibScalar, MibScalarInstance = mibBuilder.importSymbols(
     'SNMPv2-SMI', 'MibScalar', 'MibScalarInstance'
 )
     
+# OID 1.0.2.0
+class Air_Latency_P50(MibScalarInstance):
+    def getValue(self, name, idx):
+        try:
+            return self.getSyntax().clone(app_counterdb.get('air:latency:p50'))
+        except:
+            return self.getSyntax().clone(0)
+
+    
+# OID 1.0.2.1
+class Air_Latency_P95(MibScalarInstance):
+    def getValue(self, name, idx):
+        try:
+            return self.getSyntax().clone(app_counterdb.get('air:latency:p95'))
+        except:
+            return self.getSyntax().clone(0)
+
+    
+# OID 1.0.2.2
+class Air_Latency_P99(MibScalarInstance):
+    def getValue(self, name, idx):
+        try:
+            return self.getSyntax().clone(app_counterdb.get('air:latency:p99'))
+        except:
+            return self.getSyntax().clone(0)
+
+    
 # OID 1.0.0.5
 class Air_NumAnswers_AuthenticationDataUnavailable(MibScalarInstance):
     def getValue(self, name, idx):
@@ -116,6 +143,51 @@ class Air_NumRequests(MibScalarInstance):
             return self.getSyntax().clone(0)
 
     
+# OID 1.0.1.0
+class Air_NumResyncs(MibScalarInstance):
+    def getValue(self, name, idx):
+        try:
+            return self.getSyntax().clone(app_counterdb.get('air:num_resyncs'))
+        except:
+            return self.getSyntax().clone(0)
+
+    
+# OID 1.0.1.1
+class Air_NumResyncs_MacSFailure(MibScalarInstance):
+    def getValue(self, name, idx):
+        try:
+            return self.getSyntax().clone(app_counterdb.get('air:num_resyncs:mac_s_failure'))
+        except:
+            return self.getSyntax().clone(0)
+
+    
+# OID 2.0.1.0
+class Nor_Latency_P50(MibScalarInstance):
+    def getValue(self, name, idx):
+        try:
+            return self.getSyntax().clone(app_counterdb.get('nor:latency:p50'))
+        except:
+            return self.getSyntax().clone(0)
+
+    
+# OID 2.0.1.1
+class Nor_Latency_P95(MibScalarInstance):
+    def getValue(self, name, idx):
+        try:
+            return self.getSyntax().clone(app_counterdb.get('nor:latency:p95'))
+        except:
+            return self.getSyntax().clone(0)
+
+    
+# OID 2.0.1.2
+class Nor_Latency_P99(MibScalarInstance):
+    def getValue(self, name, idx):
+        try:
+            return self.getSyntax().clone(app_counterdb.get('nor:latency:p99'))
+        except:
+            return self.getSyntax().clone(0)
+
+    
 # OID 2.0.0.3
 class Nor_NumAnswers_InvalidAvpValue(MibScalarInstance):
     def getValue(self, name, idx):
@@ -170,6 +242,33 @@ class Nor_NumRequests(MibScalarInstance):
             return self.getSyntax().clone(0)
 
     
+# OID 3.0.1.0
+class Pur_Latency_P50(MibScalarInstance):
+    def getValue(self, name, idx):
+        try:
+            return self.getSyntax().clone(app_counterdb.get('pur:latency:p50'))
+        except:
+            return self.getSyntax().clone(0)
+
+    
+# OID 3.0.1.1
+class Pur_Latency_P95(MibScalarInstance):
+    def getValue(self, name, idx):
+        try:
+            return self.getSyntax().clone(app_counterdb.get('pur:latency:p95'))
+        except:
+            return self.getSyntax().clone(0)
+
+    
+# OID 3.0.1.2
+class Pur_Latency_P99(MibScalarInstance):
+    def getValue(self, name, idx):
+        try:
+            return self.getSyntax().clone(app_counterdb.get('pur:latency:p99'))
+        except:
+            return self.getSyntax().clone(0)
+
+    
 # OID 3.0.0.3
 class Pur_NumAnswers_InvalidAvpValue(MibScalarInstance):
     def getValue(self, name, idx):
@@ -215,6 +314,87 @@ class Pur_NumRequests(MibScalarInstance):
             return self.getSyntax().clone(0)
 
     
+# OID 5.0.0.5
+class SubscriberWrites_MaxFlushLatency(MibScalarInstance):
+    def getValue(self, name, idx):
+        try:
+            return self.getSyntax().clone(app_counterdb.get('subscriber_writes:max_flush_latency'))
+        except:
+            return self.getSyntax().clone(0)
+
+    
+# OID 5.0.0.1
+class SubscriberWrites_NumOfCoalescedWrites(MibScalarInstance):
+    def getValue(self, name, idx):
+        try:
+            return self.getSyntax().clone(app_counterdb.get('subscriber_writes:num_of_coalesced_writes'))
+        except:
+            return self.getSyntax().clone(0)
+
+    
+# OID 5.0.0.4
+class SubscriberWrites_NumOfFailures(MibScalarInstance):
+    def getValue(self, name, idx):
+        try:
+            return self.getSyntax().clone(app_counterdb.get('subscriber_writes:num_of_failures'))
+        except:
+            return self.getSyntax().clone(0)
+
+    
+# OID 5.0.0.3
+class SubscriberWrites_NumOfFlushes(MibScalarInstance):
+    def getValue(self, name, idx):
+        try:
+            return self.getSyntax().clone(app_counterdb.get('subscriber_writes:num_of_flushes'))
+        except:
+            return self.getSyntax().clone(0)
+
+    
+# OID 5.0.0.2
+class SubscriberWrites_NumOfOverflows(MibScalarInstance):
+    def getValue(self, name, idx):
+        try:
+            return self.getSyntax().clone(app_counterdb.get('subscriber_writes:num_of_overflows'))
+        except:
+            return self.getSyntax().clone(0)
+
+    
+# OID 5.0.0.0
+class SubscriberWrites_NumOfWrites(MibScalarInstance):
+    def getValue(self, name, idx):
+        try:
+            return self.getSyntax().clone(app_counterdb.get('subscriber_writes:num_of_writes'))
+        except:
+            return self.getSyntax().clone(0)
+
+    
+# OID 4.0.1.0
+class Ulr_Latency_P50(MibScalarInstance):
+    def getValue(self, name, idx):
+        try:
+            return self.getSyntax().clone(app_counterdb.get('ulr:latency:p50'))
+        except:
+            return self.getSyntax().clone(0)
+
+    
+# OID 4.0.1.1
+class Ulr_Latency_P95(MibScalarInstance):
+    def getValue(self, name, idx):
+        try:
+            return self.getSyntax().clone(app_counterdb.get('ulr:latency:p95'))
+        except:
+            return self.getSyntax().clone(0)
+
+    
+# OID 4.0.1.2
+class Ulr_Latency_P99(MibScalarInstance):
+    def getValue(self, name, idx):
+        try:
+            return self.getSyntax().clone(app_counterdb.get('ulr:latency:p99'))
+        except:
+            return self.getSyntax().clone(0)
+
+    
 # OID 4.0.0.3
 class Ulr_NumAnswers_InvalidAvpValue(MibScalarInstance):
     def getValue(self, name, idx):
@@ -302,23 +482,43 @@ mibBuilder.exportSymbols(
                 oids.get("sys_descr"), 
                 v2c.OctetString()
     ),
+    Air_Latency_P50(oids.get("sys_descr"), oids.get("air:latency:p50"), v2c.Integer32()),
+    Air_Latency_P95(oids.get("sys_descr"), oids.get("air:latency:p95"), v2c.Integer32()),
+    Air_Latency_P99(oids.get("sys_descr"), oids.get("air:latency:p99"), v2c.Integer32()),
     Air_NumAnswers_AuthenticationDataUnavailable(oids.get("sys_descr"), oids.get("air:num_answers:authentication_data_unavailable"), v2c.Integer32()),
     Air_NumAnswers_InvalidAvpValue(oids.get("sys_descr"), oids.get("air:num_answers:invalid_avp_value"), v2c.Integer32()),
     Air_NumAnswers_MissingAvp(oids.get("sys_descr"), oids.get("air:num_answers:missing_avp"), v2c.Integer32()),
     Air_NumAnswers_Success(oids.get("sys_descr"), oids.get("air:num_answers:success"), v2c.Integer32()),
     Air_NumAnswers_UserUnknown(oids.get("sys_descr"), oids.get("air:num_answers:user_unknown"), v2c.Integer32()),
     Air_NumRequests(oids.get("sys_descr"), oids.get("air:num_requests"), v2c.Integer32()),
+    Air_NumResyncs(oids.get("sys_descr"), oids.get("air:num_resyncs"), v2c.Integer32()),
+    Air_NumResyncs_MacSFailure(oids.get("sys_descr"), oids.get("air:num_resyncs:mac_s_failure"), v2c.Integer32()),
+    Nor_Latency_P50(oids.get("sys_descr"), oids.get("nor:latency:p50"), v2c.Integer32()),
+    Nor_Latency_P95(oids.get("sys_descr"), oids.get("nor:latency:p95"), v2c.Integer32()),
+    Nor_Latency_P99(oids.get("sys_descr"), oids.get("nor:latency:p99"), v2c.Integer32()),
     Nor_NumAnswers_InvalidAvpValue(oids.get("sys_descr"), oids.get("nor:num_answers:invalid_avp_value"), v2c.Integer32()),
     Nor_NumAnswers_MissingAvp(oids.get("sys_descr"), oids.get("nor:num_answers:missing_avp"), v2c.Integer32()),
     Nor_NumAnswers_Success(oids.get("sys_descr"), oids.get("nor:num_answers:success"), v2c.Integer32()),
     Nor_NumAnswers_UnknownServingNode(oids.get("sys_descr"), oids.get("nor:num_answers:unknown_serving_node"), v2c.Integer32()),
     Nor_NumAnswers_UserUnknown(oids.get("sys_descr"), oids.get("nor:num_answers:user_unknown"), v2c.Integer32()),
     Nor_NumRequests(oids.get("sys_descr"), oids.get("nor:num_requests"), v2c.Integer32()),
+    Pur_Latency_P50(oids.get("sys_descr"), oids.get("pur:latency:p50"), v2c.Integer32()),
+    Pur_Latency_P95(oids.get("sys_descr"), oids.get("pur:latency:p95"), v2c.Integer32()),
+    Pur_Latency_P99(oids.get("sys_descr"), oids.get("pur:latency:p99"), v2c.Integer32()),
     Pur_NumAnswers_InvalidAvpValue(oids.get("sys_descr"), oids.get("pur:num_answers:invalid_avp_value"), v2c.Integer32()),
     Pur_NumAnswers_MissingAvp(oids.get("sys_descr"), oids.get("pur:num_answers:missing_avp"), v2c.Integer32()),
     Pur_NumAnswers_Success(oids.get("sys_descr"), oids.get("pur:num_answers:success"), v2c.Integer32()),
     Pur_NumAnswers_UserUnknown(oids.get("sys_descr"), oids.get("pur:num_answers:user_unknown"), v2c.Integer32()),
     Pur_NumRequests(oids.get("sys_descr"), oids.get("pur:num_requests"), v2c.Integer32()),
+    SubscriberWrites_MaxFlushLatency(oids.get("sys_descr"), oids.get("subscriber_writes:max_flush_latency"), v2c.Integer32()),
+    SubscriberWrites_NumOfCoalescedWrites(oids.get("sys_descr"), oids.get("subscriber_writes:num_of_coalesced_writes"), v2c.Integer32()),
+    SubscriberWrites_NumOfFailures(oids.get("sys_descr"), oids.get("subscriber_writes:num_of_failures"), v2c.Integer32()),
+    SubscriberWrites_NumOfFlushes(oids.get("sys_descr"), oids.get("subscriber_writes:num_of_flushes"), v2c.Integer32()),
+    SubscriberWrites_NumOfOverflows(oids.get("sys_descr"), oids.get("subscriber_writes:num_of_overflows"), v2c.Integer32()),
+    SubscriberWrites_NumOfWrites(oids.get("sys_descr"), oids.get("subscriber_writes:num_of_writes"), v2c.Integer32()),
+    Ulr_Latency_P50(oids.get("sys_descr"), oids.get("ulr:latency:p50"), v2c.Integer32()),
+    Ulr_Latency_P95(oids.get("sys_descr"), oids.get("ulr:latency:p95"), v2c.Integer32()),
+    Ulr_Latency_P99(oids.get("sys_descr"), oids.get("ulr:latency:p99"), v2c.Integer32()),
     Ulr_NumAnswers_InvalidAvpValue(oids.get("sys_descr"), oids.get("ulr:num_answers:invalid_avp_value"), v2c.Integer32()),
     Ulr_NumAnswers_MissingAvp(oids.get("sys_descr"), oids.get("ulr:num_answers:missing_avp"), v2c.Integer32()),
     Ulr_NumAnswers_RatNotAllowed(oids.get("sys_descr"), oids.get("ulr:num_answers:rat_not_allowed"), v2c.Integer32()),
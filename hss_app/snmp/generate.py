@@ -170,6 +170,12 @@ with open(os.path.join(base_dir, "entrypoint.py"), "w") as entrypoint_file:
             if pattern:
                 keys.append(pattern[0])
 
+        #: Latency percentiles are set as gauges by the app latency module
+        keys += [key for key in oids.keys() if ":latency:" in key]
+
+        #: Subscriber write metrics are published by the app write-behind queue
+        keys += [key for key in oids.keys() if key.startswith("subscriber_writes:")]
+
         keys = list(set(keys))
         keys.sort()
 
@@ -19,6 +19,11 @@ oids = {
     "air:num_answers:invalid_avp_value": "1.0.0.3",
     "air:num_answers:user_unknown": "1.0.0.4",
     "air:num_answers:authentication_data_unavailable": "1.0.0.5",
+    "air:num_resyncs": "1.0.1.0",
+    "air:num_resyncs:mac_s_failure": "1.0.1.1",
+    "air:latency:p50": "1.0.2.0",
+    "air:latency:p95": "1.0.2.1",
+    "air:latency:p99": "1.0.2.2",
 
     "nor:num_requests": "2.0.0.0",
     "nor:num_answers:success": "2.0.0.1",
@@ -26,12 +31,18 @@ oids = {
     "nor:num_answers:invalid_avp_value": "2.0.0.3",
     "nor:num_answers:user_unknown": "2.0.0.4",
     "nor:num_answers:unknown_serving_node": "2.0.0.5",
+    "nor:latency:p50": "2.0.1.0",
+    "nor:latency:p95": "2.0.1.1",
+    "nor:latency:p99": "2.0.1.2",
 
     "pur:num_requests": "3.0.0.0",
     "pur:num_answers:success": "3.0.0.1",
     "pur:num_answers:missing_avp": "3.0.0.2",
     "pur:num_answers:invalid_avp_value": "3.0.0.3",
     "pur:num_answers:user_unknown": "3.0.0.4",
+    "pur:latency:p50": "3.0.1.0",
+    "pur:latency:p95": "3.0.1.1",
+    "pur:latency:p99": "3.0.1.2",
 
     "ulr:num_requests": "4.0.0.0",
     "ulr:num_answers:success": "4.0.0.1",
@@ -42,4 +53,14 @@ oids = {
     "ulr:num_answers:realm_not_served": "4.0.0.6",
     "ulr:num_answers:roaming_not_allowed": "4.0.0.7",
     "ulr:num_answers:unknown_eps_subscription": "4.0.0.8",
+    "ulr:latency:p50": "4.0.1.0",
+    "ulr:latency:p95": "4.0.1.1",
+    "ulr:latency:p99": "4.0.1.2",
+
+    "subscriber_writes:num_of_writes": "5.0.0.0",
+    "subscriber_writes:num_of_coalesced_writes": "5.0.0.1",
+    "subscriber_writes:num_of_overflows": "5.0.0.2",
+    "subscriber_writes:num_of_flushes": "5.0.0.3",
+    "subscriber_writes:num_of_failures": "5.0.0.4",
+    "subscriber_writes:max_flush_latency": "5.0.0.5",
 }
\ No newline at end of file
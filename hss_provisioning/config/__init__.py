@@ -113,6 +113,12 @@ class Config:
         "hss": SQL_BASE_URI.format(**params),
     }
 
+    #: Postgres channel where subscriber changes are notified to the HSS. 
+    #: Changes touching more subscribers than below are notified as a full 
+    #: flush, so the payload stays within the Postgres limit.
+    SUBSCRIBER_CHANGES_CHANNEL = "hss_subscriber_changes"
+    SUBSCRIBER_CHANGES_MAX_IMSIS = 256
+
     #: JSON API Schema - Request & Response.
     request_schema_subscriber = get_json_repr(
         os.path.join(config_dir, "api_request_subscriber.json")
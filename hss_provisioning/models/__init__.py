@@ -9,6 +9,8 @@
     :license: MIT, see LICENSE for more details.
 """
 
+import itertools
+import json
 from copy import deepcopy
 
 from sqlalchemy import (
@@ -18,8 +20,11 @@ from sqlalchemy import (
     ForeignKey,
     Integer,
     LargeBinary,
+    Sequence,
     String,
-    create_engine
+    create_engine,
+    event,
+    text
 )
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import (
@@ -135,4 +140,90 @@ class SubscriberMip6s(Base, HssBaseModel):
     mip6 = relationship(Mip6, backref=backref("subscriber_mip6s", cascade="all, delete-orphan"), overlaps="mip6s")
 
 
+#: Version attached to every change notification, so the HSS is able to
+#: detect notifications it has missed.
+change_version = Sequence("hss_change_version", metadata=Base.metadata)
+
+
 Base.metadata.create_all(engine)
+
+
+#: Changes are notified once per transaction, right before it commits, so
+#: the HSS only receives them once committed. The version is drawn at that
+#: point too, so a transaction rolled back beforehand draws none and leaves
+#: no gap in the versions; only a failed COMMIT does. A null list of IMSIs
+#: means any subscriber may have changed.
+NOTIFY_STATEMENT = text("SELECT pg_notify(:channel, json_build_object("
+                        "'version', nextval('hss_change_version'), "
+                        "'imsis', CAST(:imsis AS json))::text)")
+
+
+def notify_changes(session, imsis):
+    if session.get_bind().dialect.name != "postgresql":
+        return
+
+    if imsis is not None:
+        imsis = sorted(imsis)
+        if len(imsis) > Config.SUBSCRIBER_CHANGES_MAX_IMSIS:
+            imsis = None
+
+    session.connection().execute(NOTIFY_STATEMENT, {
+        "channel": Config.SUBSCRIBER_CHANGES_CHANNEL,
+        "imsis": json.dumps(imsis)
+    })
+
+
+def record_changes(session, imsis):
+    changed_imsis = session.info.get("changed_imsis", set())
+
+    if changed_imsis is None or imsis is None:
+        session.info["changed_imsis"] = None
+    else:
+        session.info["changed_imsis"] = changed_imsis | set(imsis)
+
+
+@event.listens_for(Session, "after_flush")
+def record_flushed_changes(session, flush_context):
+    imsis = set()
+    apn_changed = False
+    other_changed = False
+
+    for obj in itertools.chain(session.new, session.dirty, session.deleted):
+        if isinstance(obj, Subscriber):
+            imsis.add(str(obj.imsi))
+
+        #: A new APN is not referenced by any subscriber yet
+        elif isinstance(obj, Apn):
+            if obj not in session.new and session.is_modified(obj):
+                apn_changed = True
+
+        #: MIP6s and association rows are changed along their subscriber
+        else:
+            other_changed = True
+
+    if apn_changed or (other_changed and not imsis):
+        record_changes(session, None)
+
+    elif imsis:
+        record_changes(session, imsis)
+
+
+@event.listens_for(Session, "after_bulk_delete")
+def record_bulk_deleted_changes(delete_context):
+    if delete_context.result.rowcount:
+        record_changes(delete_context.session, None)
+
+
+@event.listens_for(Session, "before_commit")
+def notify_committed_changes(session):
+    #: Otherwise the last changes would be flushed after this hook
+    session.flush()
+
+    if "changed_imsis" in session.info:
+        notify_changes(session, session.info.pop("changed_imsis"))
+
+
+@event.listens_for(Session, "after_transaction_end")
+def discard_changes(session, transaction):
+    if transaction.parent is None:
+        session.info.pop("changed_imsis", None)